@@ -0,0 +1,183 @@
+"""
+Step throughput benchmark of SumoEnvironment.
+
+Measures the steps per second of SumoEnvironment.step, the time of SumoEnvironment.reset and the time
+spent in each phase of step (simulation advance, lane update, encoding, reward, truncation check and info)
+on the 2x2_intersection scenarios, for every laneInfo/rewardFn/edges combination. Results are written to
+a JSON file, so runs can be compared.
+
+With --fake the environment runs on a FakeConnection (a toy queue model) instead of SUMO, which measures
+the Python-side overhead of the environment and does not need SUMO installed. With --record DIR the TraCI
+calls of every combination are recorded to DIR, and with --replay DIR they are served from the recorded
+traces (see tscRL.environments.trace), which also runs without SUMO and gives the same observations and
+rewards as the recorded run. Record and replay with the same options. With --pool N the environments lease
+their SUMO processes from a SumoPool of N workers started beforehand, instead of starting SUMO.
+
+Usage:
+    python env_benchmark.py --steps 500 --output results.json
+    python env_benchmark.py --fake --backends polling subscription
+    python env_benchmark.py --record traces --noCache && python env_benchmark.py --replay traces --noCache
+    python env_benchmark.py --pool 1
+"""
+import sys
+import os
+import argparse
+import itertools
+import json
+import platform
+import subprocess
+import time
+from datetime import datetime
+
+fileDir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(fileDir, '..', '..'))
+
+import numpy as np
+
+from tscRL.environments.environment import SumoEnvironment, LANE_DATA_ROWS, POLLING, SUBSCRIPTION
+from tscRL.environments.fake_traci import FakeConnection
+from tscRL.environments.sumo_pool import SumoPool
+from tscRL.environments.trace import RecordingConnection, ReplayConnection
+from tscRL.util.profiling import PhaseTimer
+from tscRL.util.stateCache import StateCache
+
+netsDir = os.path.abspath(os.path.join(fileDir, '..', '..', '..', 'nets', '2x2_intersection'))
+SCENARIOS = {"balanced": os.path.join(netsDir, "intersection_balanced.sumocfg"),
+             "unbalanced": os.path.join(netsDir, "intersection_unbalanced.sumocfg")}
+
+def getOptions():
+    parser = argparse.ArgumentParser(description="Step throughput benchmark of SumoEnvironment.")
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--laneInfo", nargs="+", choices=list(LANE_DATA_ROWS), default=list(LANE_DATA_ROWS))
+    parser.add_argument("--rewardFns", nargs="+", choices=list(SumoEnvironment.rewardFns),
+                        default=list(SumoEnvironment.rewardFns))
+    parser.add_argument("--edges", nargs="+", choices=["false", "true"], default=["false", "true"])
+    parser.add_argument("--backends", nargs="+", choices=[POLLING, SUBSCRIPTION], default=[POLLING])
+    parser.add_argument("--steps", type=int, default=500, help="Measured steps per combination.")
+    parser.add_argument("--resets", type=int, default=5, help="Measured resets per combination.")
+    parser.add_argument("--warmupSteps", type=int, default=20, help="Steps run before measuring.")
+    parser.add_argument("--warmingTime", type=int, default=600)
+    parser.add_argument("--simTime", type=int, default=43800)
+    parser.add_argument("--seed", type=int, default=0, help="SUMO seed.")
+    parser.add_argument("--libsumo", action="store_true", help="Run SUMO through libsumo.")
+    parser.add_argument("--fake", action="store_true", help="Run on a FakeConnection instead of SUMO.")
+    parser.add_argument("--record", default=None, help="Directory where the TraCI traces are recorded.")
+    parser.add_argument("--replay", default=None, help="Directory of the TraCI traces to replay instead of SUMO.")
+    parser.add_argument("--pool", type=int, default=0, help="Lease SUMO from a pool of this many workers.")
+    parser.add_argument("--noCache", action="store_true", help="Do not cache the warm-up states.")
+    parser.add_argument("--output", default="benchmark_results.json")
+    return parser.parse_args()
+
+def getMetadata(options):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=fileDir, capture_output=True,
+                                text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    return {"date": datetime.now().isoformat(timespec="seconds"),
+            "commit": commit,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "options": vars(options)}
+
+def benchmark(options, scenario, laneInfo, rewardFn, edges, backend, stateCache, pool=None):
+    """
+    Measures one combination of environment parameters.
+
+    Returns:
+        dict: Parameters and results of the combination.
+    """
+    baseFactory = FakeConnection if options.fake else (pool.lease if pool is not None else None)
+    traceName = "_".join([scenario, laneInfo, rewardFn, "edges" if edges else "lanes", backend]) + ".npz"
+    if options.replay is not None:
+        connectionFactory = ReplayConnection.factory(os.path.join(options.replay, traceName))
+    elif options.record is not None:
+        os.makedirs(options.record, exist_ok=True)
+        connectionFactory = RecordingConnection.factory(os.path.join(options.record, traceName), baseFactory)
+    else:
+        connectionFactory = baseFactory
+    start = time.perf_counter()
+    env = SumoEnvironment(
+        sumocfgFile=SCENARIOS[scenario],
+        edges=edges,
+        laneInfo=laneInfo,
+        rewardFn=rewardFn,
+        simTime=options.simTime,
+        warmingTime=options.warmingTime,
+        observationBackend=backend,
+        useLibsumo=options.libsumo,
+        sumoSeed=options.seed,
+        stateCache=stateCache,
+        connectionFactory=connectionFactory
+    )
+    constructionTime = time.perf_counter() - start
+    nActions = env.action_space.n
+    resetTimes = []
+    for _ in range(options.resets):
+        start = time.perf_counter()
+        env.reset()
+        resetTimes.append(time.perf_counter() - start)
+    env.reset()
+    # Fixed sequence of actions, so runs are comparable
+    actions = ((k * 7 // 3) % nActions for k in itertools.count())
+    for _ in range(options.warmupSteps):
+        env.step(next(actions))
+
+    env.phaseTimer = PhaseTimer()
+    stepTime = 0
+    episodes = 0
+    for _ in range(options.steps):
+        start = time.perf_counter()
+        _, _, _, truncated, _ = env.step(next(actions))
+        stepTime += time.perf_counter() - start
+        if truncated:
+            env.reset()
+            episodes += 1
+    phases = env.phaseTimer.summary()
+    version = env.connection.getVersion()[1]
+    env.close()
+
+    return {"scenario": scenario,
+            "laneInfo": laneInfo,
+            "rewardFn": rewardFn,
+            "edges": edges,
+            "observationBackend": backend,
+            "version": version,
+            "steps": options.steps,
+            "episodesEnded": episodes,
+            "stepsPerSecond": options.steps / stepTime,
+            "meanStepTime": stepTime / options.steps,
+            "constructionTime": constructionTime,
+            "meanResetTime": float(np.mean(resetTimes)) if resetTimes else None,
+            "phases": {phase: {"meanTime": values["mean"], "fraction": values["total"] / stepTime}
+                       for phase, values in phases.items()}}
+
+if __name__ == "__main__":
+    options = getOptions()
+    stateCache = None if options.noCache or options.fake or options.replay else StateCache()
+    pool = None
+    if options.pool > 0 and not (options.fake or options.replay):
+        pool = SumoPool(options.pool, SCENARIOS[options.scenarios[0]])
+    results = []
+    for scenario, laneInfo, rewardFn, edges, backend in itertools.product(
+            options.scenarios, options.laneInfo, options.rewardFns, options.edges, options.backends):
+        result = benchmark(options, scenario, laneInfo, rewardFn, edges == "true", backend, stateCache, pool)
+        results.append(result)
+        print(scenario, laneInfo, rewardFn, "edges=" + edges, backend,
+              "%.1f steps/s" % result["stepsPerSecond"],
+              "construction %.1f ms" % (1000 * result["constructionTime"]),
+              "reset %.1f ms" % (1000 * result["meanResetTime"]) if result["meanResetTime"] is not None else "")
+
+    if pool is not None:
+        pool.close()
+    metadata = getMetadata(options)
+    if options.replay is not None:
+        metadata["connection"] = "replay"
+    else:
+        metadata["connection"] = "fake" if options.fake else ("pool" if pool is not None else
+                                                              ("libsumo" if options.libsumo else "traci"))
+    with open(options.output, "w") as file:
+        json.dump({"metadata": metadata, "results": results}, file, indent=2)
+    print("Results written to " + options.output)
@@ -0,0 +1,64 @@
+"""
+Multi-fidelity hyperparameter study of DQNAgent (see tscRL.agents.study.runStudy).
+
+Trials run in parallel worker processes sharing the study storage, and climb the fidelity rungs (mesoscopic
+short episodes, then microscopic episodes of growing length) until the pruner stops them. The trials are
+written to a CSV file, as parametersStudy*.csv, with the wall time and steps per second of each trial.
+
+Usage:
+    python dqn_parameters_study.py --trials 40 --workers 4 --storage study.log --output parametersStudy5.csv
+    python dqn_parameters_study.py --pruner hyperband --noMeso
+"""
+import sys
+import os
+import argparse
+
+fileDir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(fileDir, '..', '..'))
+
+from tscRL.environments.environment import MICRO
+from tscRL.agents.study import runStudy, DEFAULT_RUNGS, SUCCESSIVE_HALVING, HYPERBAND
+
+netsDir = os.path.abspath(os.path.join(fileDir, '..', '..', '..', 'nets', '2x2_intersection'))
+SCENARIOS = {"balanced": os.path.join(netsDir, "intersection_balanced.sumocfg"),
+             "unbalanced": os.path.join(netsDir, "intersection_unbalanced.sumocfg")}
+
+# Environment of the DQN experiment
+ENV_KWARGS = {"deltaTime": 5,
+              "yellowTime": 4,
+              "minGreenTime": 10,
+              "edges": False,
+              "discreteIntervals": 20,
+              "maxLaneValue": 2500,
+              "laneInfo": "waitingTime",
+              "rewardFn": "diff_cumulativeWaitingTime",
+              "stateCache": True}
+
+def getOptions():
+    parser = argparse.ArgumentParser(description="Multi-fidelity hyperparameter study of DQNAgent.")
+    parser.add_argument("--scenario", choices=list(SCENARIOS), default="unbalanced")
+    parser.add_argument("--studyName", default="dqn_study")
+    parser.add_argument("--storage", default="dqn_study.log", help="Journal file (.log) or RDB URL of the study.")
+    parser.add_argument("--trials", type=int, default=40)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--pruner", choices=[SUCCESSIVE_HALVING, HYPERBAND], default=SUCCESSIVE_HALVING)
+    parser.add_argument("--reductionFactor", type=int, default=3)
+    parser.add_argument("--noMeso", action="store_true", help="Run the first rung on the microscopic simulation.")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", default="parametersStudy.csv")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    options = getOptions()
+    rungs = [dict(rung, fidelity=MICRO) for rung in DEFAULT_RUNGS] if options.noMeso else DEFAULT_RUNGS
+    study = runStudy(options.studyName, options.storage, SCENARIOS[options.scenario], options.trials,
+                     nWorkers=options.workers, envKwargs=ENV_KWARGS, rungs=rungs, pruner=options.pruner,
+                     reductionFactor=options.reductionFactor, seed=options.seed)
+    study.trials_dataframe().to_csv(options.output, index=False)
+    print("Number of finished trials: ", len(study.trials))
+    print("Best trial:")
+    trial = study.best_trial
+    print("  Value: ", trial.value)
+    print("  Params: ")
+    for key, value in trial.params.items():
+        print("    {}: {}".format(key, value))
@@ -0,0 +1,74 @@
+"""
+Evaluation of trained policies against the fixed-time program (see tscRL.agents.evaluation.evaluate).
+
+Every (policy, scenario, seed) evaluation runs in a worker process with its own SUMO, with the seed passed
+to SUMO (--seed), and its results are cached: evaluations already run (e.g. the fixed-time baseline) are
+not simulated again. The episodes are written to a CSV file, and the comparison table (mean and standard
+deviation of the metrics of each policy on each scenario) to <output>.table.csv.
+
+Usage:
+    python policy_evaluation.py --dqn dqn_model.zip --seeds 0 1 2 3 4 --workers 4 --output evaluation.csv
+    python policy_evaluation.py --qtable ql_qtable --scenarios balanced --seeds 0 1 2
+"""
+import sys
+import os
+import argparse
+
+fileDir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(fileDir, '..', '..'))
+
+from tscRL.agents.evaluation import evaluate, comparisonTable, writeCsv, FixedTimePolicy, DQNPolicy, QTablePolicy
+
+netsDir = os.path.abspath(os.path.join(fileDir, '..', '..', '..', 'nets', '2x2_intersection'))
+SCENARIOS = {"balanced": os.path.join(netsDir, "intersection_balanced.sumocfg"),
+             "unbalanced": os.path.join(netsDir, "intersection_unbalanced.sumocfg")}
+
+# Environment of the DQN experiment
+DQN_ENV_KWARGS = {"edges": False,
+                  "discreteIntervals": 20,
+                  "maxLaneValue": 2500,
+                  "laneInfo": "waitingTime",
+                  "rewardFn": "diff_cumulativeWaitingTime"}
+# Environment of the Q-learning experiment
+QL_ENV_KWARGS = {"edges": False,
+                 "discreteIntervals": 4,
+                 "maxLaneValue": 500,
+                 "laneInfo": "waitingTime",
+                 "rewardFn": "diff_cumulativeWaitingTime"}
+# Environment shared by every policy
+ENV_KWARGS = {"deltaTime": 5,
+              "yellowTime": 4,
+              "minGreenTime": 10,
+              "stateCache": True}
+
+def getOptions():
+    parser = argparse.ArgumentParser(description="Evaluation of trained policies against the fixed-time program.")
+    parser.add_argument("--dqn", default=None, help="DQN model (.zip) saved by Stable Baselines3.")
+    parser.add_argument("--qtable", default=None, help="Path of a Q-table saved by QLAgent.saveQTable.")
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--seeds", nargs="+", type=int, default=[0, 1, 2])
+    parser.add_argument("--episodes", type=int, default=1)
+    parser.add_argument("--simTime", type=int, default=43800)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--noCache", action="store_true", help="Simulate every evaluation again.")
+    parser.add_argument("--output", default="evaluation.csv")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    options = getOptions()
+    policies = {"fixed_time": FixedTimePolicy()}
+    if options.dqn is not None:
+        policies["dqn"] = DQNPolicy(options.dqn, envKwargs=DQN_ENV_KWARGS)
+    if options.qtable is not None:
+        policies["q_learning"] = QTablePolicy(options.qtable, envKwargs=QL_ENV_KWARGS)
+    scenarios = {name: SCENARIOS[name] for name in options.scenarios}
+    rows = evaluate(policies, scenarios, options.seeds, episodes=options.episodes,
+                    envKwargs=dict(ENV_KWARGS, simTime=options.simTime), nWorkers=options.workers,
+                    cache=not options.noCache)
+    table = comparisonTable(rows)
+    writeCsv(rows, options.output)
+    writeCsv(table, os.path.splitext(options.output)[0] + ".table.csv")
+    for row in table:
+        print("{} - {} ({} episodes):".format(row["scenario"], row["policy"], row["episodes"]))
+        for metric in ["cumulative_reward", "mean_waiting_time", "mean_acc_waiting_time"]:
+            print("  {}: {:.2f} +- {:.2f}".format(metric, row[metric + "_mean"], row[metric + "_std"]))
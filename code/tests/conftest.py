@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The tscRL package is imported from the code directory, as in the experiments
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+NETS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'nets', '2x2_intersection'))
@@ -0,0 +1,58 @@
+from math import ceil, log2
+
+import numpy as np
+import pytest
+
+from tscRL.util.discrete import Discrete
+
+# (I, M) of the lane encodings: observation defaults, halted vehicles and waiting times, and I > M
+PARAMETERS = [(6, 60), (10, 100), (4, 30), (6, 500), (3, 3), (8, 5)]
+
+
+def scalarLogInterval(discrete, x):
+    """ The per-element encoding Discrete.log_interval had before the vectorized one. """
+    if (x>discrete.M):
+        return discrete.I
+    if (x<0):
+        raise ValueError("Argument must be a non-negative value")
+    return ceil(discrete.F*(log2(x/(discrete.M*discrete.L)+1))+pow(discrete.L,2)*x)
+
+
+def denseInputs(discrete):
+    """ Dense range over [0, 2M], the integers, the bin edges and their neighbours, and M and its neighbours. """
+    M = float(discrete.M)
+    edges = np.concatenate([discrete.bin_edges, [M]])
+    values = np.concatenate([np.linspace(0, 2*M, 20001), np.arange(0, 2*int(M)+2, dtype=np.float64),
+                             edges, np.nextafter(edges, 0), np.nextafter(edges, np.inf),
+                             [np.nextafter(0, 1), 1e-12, 1e-6]])
+    return np.unique(values[values >= 0])
+
+
+@pytest.mark.parametrize("I, M", PARAMETERS)
+@pytest.mark.parametrize("lookup", [False, True])
+def test_log_interval_array_matches_scalar_loop(I, M, lookup):
+    discrete = Discrete(I, M)
+    x = denseInputs(discrete)
+    expected = np.array([scalarLogInterval(discrete, value) for value in x.tolist()])
+    intervals = discrete.log_interval_array(x, lookup=lookup)
+    assert intervals.dtype == np.int64
+    mismatches = np.flatnonzero(intervals != expected)
+    assert mismatches.size == 0, "x = " + str(x[mismatches[:5]].tolist())
+    # Lane vectors keep their shape
+    assert np.array_equal(discrete.log_interval_array(x[:12].reshape(3, 4), lookup=lookup),
+                          expected[:12].reshape(3, 4))
+
+
+@pytest.mark.parametrize("I, M", PARAMETERS)
+def test_log_interval_matches_scalar_loop(I, M):
+    discrete = Discrete(I, M)
+    values = denseInputs(discrete)[::50].tolist() + [0, M, M + 1]
+    for value in values:
+        assert discrete.log_interval(value) == scalarLogInterval(discrete, value)
+    assert discrete.get_max_encoded_value() == max(values)
+
+
+@pytest.mark.parametrize("lookup", [False, True])
+def test_log_interval_array_rejects_negative_values(lookup):
+    with pytest.raises(ValueError):
+        Discrete(6, 60).log_interval_array([3, -1], lookup=lookup)
@@ -0,0 +1,49 @@
+import copy
+import pickle
+
+from tscRL.util.lazyInfo import LazyInfo
+
+
+def makeInfo(calls):
+    def field(name):
+        def compute():
+            calls.append(name)
+            return name
+        return compute
+    return LazyInfo({"sim_step": 5}, {"mean_waiting_time": field("mean_waiting_time"),
+                                      "mean_acc_waiting_time": field("mean_acc_waiting_time")})
+
+
+def test_deepcopy_does_not_compute_fields():
+    calls = []
+    info = makeInfo(calls)
+    # DummyVecEnv returns deepcopy(buf_infos) on every step
+    infos = copy.deepcopy([info])
+    assert calls == []
+    assert isinstance(infos[0], LazyInfo)
+    assert infos[0]["mean_waiting_time"] == "mean_waiting_time"
+    assert calls == ["mean_waiting_time"]
+
+
+def test_copies_share_computed_fields_and_expiry():
+    calls = []
+    info = makeInfo(calls)
+    infoCopy = copy.deepcopy(info)
+    infoCopy["terminal_observation"] = 1
+    assert info["mean_waiting_time"] == infoCopy["mean_waiting_time"]
+    # Computed once for the info and its copies
+    assert calls == ["mean_waiting_time"]
+    assert "terminal_observation" not in info
+    info.expire()
+    assert "mean_acc_waiting_time" not in infoCopy
+    assert infoCopy.get("mean_acc_waiting_time") is None
+    assert infoCopy["mean_waiting_time"] == "mean_waiting_time"
+    assert calls == ["mean_waiting_time"]
+
+
+def test_pickle_resolves_into_dict():
+    calls = []
+    info = pickle.loads(pickle.dumps(makeInfo(calls)))
+    assert type(info) is dict
+    assert info == {"sim_step": 5, "mean_waiting_time": "mean_waiting_time",
+                    "mean_acc_waiting_time": "mean_acc_waiting_time"}
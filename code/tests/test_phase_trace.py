@@ -0,0 +1,53 @@
+import os
+import json
+import random
+
+import pytest
+
+from conftest import NETS_DIR
+from tscRL.environments.environment import SumoEnvironment
+from tscRL.environments.fake_traci import FakeConnection
+
+SUMOCFG_FILE = os.path.join(NETS_DIR, "intersection_balanced.sumocfg")
+# Trace of the per-second loop of TrafficLight.update (one simulationStep per second), recorded over
+# FakeConnection with the same actions: signals of every second, phase and phase time after every step
+TRACE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "phase_trace.json")
+
+with open(TRACE_FILE) as file:
+    TRACES = json.load(file)
+
+
+class SignalLogConnection(FakeConnection):
+    """ FakeConnection that logs the signals of the traffic light at every simulated second. """
+    def __init__(self, sumoCMD, label=None):
+        super().__init__(sumoCMD, label)
+        self.signals = []
+
+    def _step(self):
+        super()._step()
+        self.signals.append(self.tlsState)
+
+
+def traceId(trace):
+    return "delta{deltaTime}-yellow{yellowTime}-minGreen{minGreenTime}".format(**trace["args"])
+
+
+@pytest.mark.parametrize("trace", TRACES, ids=traceId)
+def test_phase_trace_matches_per_second_loop(trace):
+    env = SumoEnvironment(SUMOCFG_FILE, connectionFactory=SignalLogConnection, **trace["args"])
+    connection = env.connection
+    actions = random.Random(0)
+    try:
+        for index, expected in enumerate(trace["steps"]):
+            action = int(actions.randrange(env.action_space.n) + env.action_space.start)
+            assert action == expected["action"]
+            connection.signals = []
+            observation, reward, _, _, _ = env.step(action)
+            trafficLight = env.trafficLight
+            step = {"action": action, "time": float(connection.time), "phase": int(trafficLight.currentPhase),
+                    "yellow": bool(trafficLight.yellow), "phase_time": int(trafficLight.currentPhaseTime),
+                    "observation": [int(value) for value in observation], "reward": float(reward),
+                    "signals": connection.signals}
+            assert step == expected, "step " + str(index)
+    finally:
+        env.close()
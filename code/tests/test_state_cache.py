@@ -0,0 +1,48 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from conftest import NETS_DIR
+
+pytest.importorskip("traci")
+if shutil.which("sumo") is None and not os.environ.get("SUMO_HOME"):
+    pytest.skip("SUMO is not installed", allow_module_level=True)
+
+from tscRL.environments.environment import SumoEnvironment
+from tscRL.util.stateCache import StateCache
+
+SUMOCFG_FILE = os.path.join(NETS_DIR, "intersection_balanced.sumocfg")
+STEPS = 60
+
+
+def runEpisodes(cache, label, episodes=2):
+    """ Observations and rewards of episodes with a fixed sequence of actions. """
+    env = SumoEnvironment(SUMOCFG_FILE, rewardFn="diff_waitingTime", sumoSeed=7, stateCache=cache,
+                          episodeLength=STEPS * 5, label=label)
+    trace = []
+    try:
+        for _ in range(episodes):
+            observation, _ = env.reset()
+            trace.append(np.asarray(observation).tolist())
+            for step in range(STEPS):
+                action = env.action_space.start + step % env.action_space.n
+                observation, reward, _, truncated, _ = env.step(action)
+                trace.append((np.asarray(observation).tolist(), float(reward)))
+                if truncated:
+                    break
+    finally:
+        env.close()
+    return trace
+
+
+def test_cached_and_uncached_episodes_are_identical(tmp_path):
+    cache = StateCache(str(tmp_path))
+    uncached = runEpisodes(cache, "uncached")
+    # The warm-up state was cached by the first environment and is loaded by the second one
+    assert len(os.listdir(tmp_path)) == 1
+    cached = runEpisodes(cache, "cached")
+    assert cached == uncached
+    # Without a state cache, the episodes are the same as with one
+    assert runEpisodes(None, "nocache") == uncached
@@ -0,0 +1,41 @@
+import os
+
+import numpy as np
+
+from conftest import NETS_DIR
+from tscRL.environments.surrogate import SurrogateEnvironment
+from tscRL.agents.ql_agent import QLAgent
+from tscRL.agents.fixedTL_agent import FixedTLAgent
+
+SUMOCFG_FILE = os.path.join(NETS_DIR, "intersection_balanced.sumocfg")
+
+
+def makeEnv(**kwargs):
+    return SurrogateEnvironment(SUMOCFG_FILE, seed=1, simTime=1800, **kwargs)
+
+
+def test_step_before_reset_is_relative_to_the_warm_up():
+    stepped = makeEnv()
+    reset = makeEnv()
+    reset.reset()
+    # The reward state is set at construction, as after a reset
+    assert stepped.step(2)[1] == reset.step(2)[1]
+    assert np.array_equal(stepped.getCurrentState(), reset.getCurrentState())
+
+
+def test_agents_run_on_the_surrogate():
+    metrics = QLAgent(makeEnv(), gamma=0.9, alpha=0.1, episodes=2).learn()
+    assert len(metrics) == 2
+    metrics = FixedTLAgent(makeEnv(), episodes=2).run()
+    assert len(metrics) == 2 and "mean_acc_waiting_time" in metrics[0]
+
+
+def test_fixed_program_ignores_actions_and_restarts_on_reset():
+    first = makeEnv(fixedTL=True)
+    second = makeEnv(fixedTL=True)
+    first.reset()
+    second.reset()
+    assert [first.step(0)[1] for _ in range(20)] == [second.step(3)[1] for _ in range(20)]
+    assert first.simulation.model.programTime == 20 * first.simulation.deltaTime
+    first.reset()
+    assert first.simulation.model.programTime == 0
@@ -4,6 +4,8 @@ import optuna
 import gymnasium as gym
 from stable_baselines3.common.callbacks import BaseCallback, EvalCallback
 
+from tscRL.util.profiling import mergeSummaries
+
 class CustomMetricsCallback(BaseCallback):
     
     def __init__(self, verbose=0):
@@ -13,6 +15,8 @@ class CustomMetricsCallback(BaseCallback):
         self.total_losses = 0
         self.cumulative_reward = 0
         self.step = 0
+        # Steps whose info includes the waiting times (see SumoEnvironment infoFrequency)
+        self.info_steps = 0
         self.episode = 0
         self.metrics = {"episode": [], "mean_waiting_time": [], "mean_acc_waiting_time": [], "cumulative_reward":[], "time": [], "loss_value": []}
         self.episode_start_time = 0
@@ -21,10 +25,11 @@ class CustomMetricsCallback(BaseCallback):
         self.episode_start_time = time()
 
     def _on_step(self) -> bool:
-        mean_waiting_time_step = self.locals['infos'][0]['mean_waiting_time']
-        mean_acc_waiting_time_step = self.locals['infos'][0]['mean_acc_waiting_time']
-        self.total_waiting_times += mean_waiting_time_step
-        self.total_acc_waiting_times += mean_acc_waiting_time_step
+        info = self.locals['infos'][0]
+        if 'mean_waiting_time' in info and 'mean_acc_waiting_time' in info:
+            self.total_waiting_times += info['mean_waiting_time']
+            self.total_acc_waiting_times += info['mean_acc_waiting_time']
+            self.info_steps += 1
         
         
         done = self.locals['dones'][0]
@@ -38,9 +43,10 @@ class CustomMetricsCallback(BaseCallback):
     
     def _on_episode_end(self):
         self.metrics["episode"].append(self.episode)
-        mean_waiting_time_ep = self.total_waiting_times / self.step
+        info_steps = max(self.info_steps, 1)
+        mean_waiting_time_ep = self.total_waiting_times / info_steps
         self.metrics["mean_waiting_time"].append(mean_waiting_time_ep)
-        mean_acc_waiting_time_ep = self.total_acc_waiting_times / self.step
+        mean_acc_waiting_time_ep = self.total_acc_waiting_times / info_steps
         self.metrics["mean_acc_waiting_time"].append(mean_acc_waiting_time_ep)
         self.metrics["cumulative_reward"].append(self.cumulative_reward)
         episode_end_time = time()
@@ -50,6 +56,7 @@ class CustomMetricsCallback(BaseCallback):
         self.metrics["loss_value"].append(self.model.logger.name_to_value.get('train/loss'))
         
         self.step = 0
+        self.info_steps = 0
         self.total_waiting_times = 0
         self.total_acc_waiting_times = 0
         self.cumulative_reward = 0
@@ -111,10 +118,13 @@ class TrialCallback(BaseCallback):
         min_trial_fract: float,
         verbose: int = 0,
         max_trial_time: int = 2700,
-        prune: bool = True
+        prune: bool = True,
+        report: bool = True
     ):
         super().__init__(verbose)
         self.trial = trial
+        # Report the mean cumulative reward to the trial (the caller may report by itself, e.g. per rung of a study)
+        self.report = report
         self.episode = 0
         self.cumulative_reward = 0
         self.last_cumulative_rewards = deque(maxlen=rewards_window_size)
@@ -141,7 +151,8 @@ class TrialCallback(BaseCallback):
         if (self.verbose):
             print("Trial " + str(self.trial.number) + " - Episode " + str(self.episode) + " finished" )
             
-        self.trial.report(mean_last_cr, self.episode)
+        if self.report:
+            self.trial.report(mean_last_cr, self.episode)
         if self.prune:
             if (time()-self.initial_time) > self.max_trial_time:
                 self.is_pruned = True
@@ -153,3 +164,66 @@ class TrialCallback(BaseCallback):
         
         
 
+
+
+class ProfilingCallback(BaseCallback):
+    """
+    Callback that exports the profile of the training environments (see SumoEnvironment.getProfile, the
+    environments must be created with profile=True) to the SB3 logger every logFreq steps, and to the user
+    attributes of an Optuna trial at the end of the training.
+
+    Logged values, per environment step of the last logFreq steps: "profile/<phase>_ms" (mean time of each
+    phase of step), "profile/step_ms" (their sum), "traci/<call>_calls" and "traci/<call>_ms" (number and
+    time of the calls to each TraCI API) and "traci/calls" (all the calls). The trial gets the same values
+    over the whole training, with the keys joined by "_" instead of "/".
+
+    Args:
+        logFreq (int): Number of calls (steps of the vectorized environment) between logs.
+        trial (optuna.Trial): Trial whose user attributes get the profile of the training (optional).
+    """
+    def __init__(self, logFreq: int = 1000, trial: optuna.Trial = None, verbose: int = 0):
+        super().__init__(verbose)
+        self.logFreq = logFreq
+        self.trial = trial
+        # Profile of the whole training
+        self.summaries = {"phases": [], "traci": []}
+
+    def _readProfiles(self):
+        """ Profiles of the environments since the last read (the profiles are cleared). """
+        if not self.training_env.has_attr("phaseTimer"):
+            # Not a SumoEnvironment (e.g. a surrogate environment)
+            return {"phases": {}, "traci": {}}
+        profiles = self.training_env.env_method("getProfile", True)
+        profile = {key: mergeSummaries([envProfile[key] for envProfile in profiles]) for key in ("phases", "traci")}
+        for key in self.summaries:
+            self.summaries[key].append(profile[key])
+        return profile
+
+    @staticmethod
+    def _profileValues(profile):
+        """ Values per environment step of a profile. """
+        phases = profile["phases"]
+        if not phases:
+            return {}
+        steps = max(values["count"] for values in phases.values())
+        values = {"profile/" + phase + "_ms": 1000 * phaseValues["total"] / steps for phase, phaseValues in phases.items()}
+        values["profile/step_ms"] = sum(1000 * phaseValues["total"] for phaseValues in phases.values()) / steps
+        for call, callValues in profile["traci"].items():
+            values["traci/" + call + "_calls"] = callValues["count"] / steps
+            values["traci/" + call + "_ms"] = 1000 * callValues["total"] / steps
+        values["traci/calls"] = sum(callValues["count"] for callValues in profile["traci"].values()) / steps
+        return values
+
+    def _on_step(self) -> bool:
+        if self.n_calls % self.logFreq == 0:
+            for key, value in self._profileValues(self._readProfiles()).items():
+                self.logger.record(key, value)
+        return True
+
+    def _on_training_end(self) -> None:
+        self._readProfiles()
+        if self.trial is None:
+            return
+        profile = {key: mergeSummaries(summaries) for key, summaries in self.summaries.items()}
+        for key, value in self._profileValues(profile).items():
+            self.trial.set_user_attr(key.replace("/", "_"), value)
@@ -1,11 +1,15 @@
 import gymnasium as gym
+from functools import partial
 
 from stable_baselines3 import DQN
 from stable_baselines3.common.callbacks import BaseCallback
 from stable_baselines3.common.logger import configure
+from stable_baselines3.common.env_util import make_vec_env
+from stable_baselines3.common.vec_env import SubprocVecEnv
 
 from tscRL.environments.environment import SumoEnvironment
 from .callbacks import CustomMetricsCallback
+from .replay_buffer import CompactReplayBuffer
 
 from typing import Tuple
 class DQNAgent:
@@ -23,13 +27,33 @@ class DQNAgent:
         netArch: Tuple[int, int] = (32,32),
         verbose: int = 0,
         callback: BaseCallback = None,
+        nEnvs: int = 1,
+        compactBuffer: bool = False,
+        dropNextObservations: bool = False,
+        bufferDir: str = None,
     ) -> None:
+        self.steps_per_episode = env.totalTimeSteps
+        if compactBuffer:
+            # Observations stored in the narrowest dtype of the discretized values (see CompactReplayBuffer)
+            replayBufferClass = CompactReplayBuffer
+            replayBufferKwargs = dict(dropNextObservations=dropNextObservations, memmapDir=bufferDir)
+        else:
+            replayBufferClass = None
+            replayBufferKwargs = None
+        if nEnvs > 1:
+            # env is only used as a template, experience is collected by nEnvs copies in subprocesses. The
+            # copies are built by now, so the SUMO process of the template is closed
+            templateEnv = env
+            env = self.makeVecEnv(env, nEnvs)
+            templateEnv.close()
         self.model = DQN(
             policy="MlpPolicy",
             env=env,
             learning_rate=learningRate,
             buffer_size=bufferSize,
             batch_size=batchSize,
+            replay_buffer_class=replayBufferClass,
+            replay_buffer_kwargs=replayBufferKwargs,
             learning_starts=0,
             gamma=gamma,
             train_freq=1,
@@ -44,7 +68,6 @@ class DQNAgent:
         #tmp_path = "./tmp/dqn_log/"
         #new_logger = configure(tmp_path, ["stdout", "csv"])
         #self.model.set_logger(new_logger)
-        self.steps_per_episode = env.totalTimeSteps
         
         if callback == None:
             self.callback = CustomMetricsCallback(verbose=1)
@@ -52,8 +75,14 @@ class DQNAgent:
             self.callback = callback
         
     
+    @staticmethod
+    def makeVecEnv(env: SumoEnvironment, nEnvs: int):
+        # Each copy gets its own connection label (and state file) in its process
+        envArgs = {key: value for key, value in env.envArgs.items() if key != "label"}
+        return make_vec_env(partial(SumoEnvironment, **envArgs), n_envs=nEnvs, vec_env_cls=SubprocVecEnv)
+    
     def learn(self, episodes: int = 50, logInterval: int = 1, progressBar: bool = False):
-        
+        # Timesteps are counted over all the environments, so episodes are split among them
         total_timesteps = episodes * self.steps_per_episode
         
         self.model.learn(
@@ -74,6 +103,8 @@ class DQNAgent:
                 learning_rate=self.model.learning_rate,
                 buffer_size=self.model.buffer_size,
                 batch_size=self.model.batch_size,
+                replay_buffer_class=self.model.replay_buffer_class,
+                replay_buffer_kwargs=self.model.replay_buffer_kwargs,
                 gamma=self.model.gamma,
                 train_freq=1,
                 target_update_interval=1000,
@@ -95,24 +126,29 @@ class DQNAgent:
     def run(self, episodes: int = 1):
         totalAccWaitingTime = 0
         totalAccReward = 0
+        # Steps whose info includes the accumulated waiting time: with the infoFields and infoFrequency of the
+        # environment, the mean accumulated waiting time may only be averaged over a sample of the steps
+        infoSteps = 0
         
         env=self.model.get_env()
         if env == None:
             raise ValueError("env is not defined.")
         for _ in range(episodes):
             obs = env.reset()
-            steps = 0
             done = False
             while not done:
                 action, _ = self.model.predict(obs, deterministic=True)
                 obs, reward, done, info = env.step(action)
+                # Metrics are taken from the first environment when there are several
+                done = done[0]
     
-                totalAccReward += reward
-                totalAccWaitingTime += int(info[0]["mean_acc_waiting_time"])
-                steps += 1
+                totalAccReward += reward[0]
+                if "mean_acc_waiting_time" in info[0]:
+                    totalAccWaitingTime += int(info[0]["mean_acc_waiting_time"])
+                    infoSteps += 1
                 
         meanAccReward = totalAccReward / episodes  
-        meanAccWaitingTime = totalAccWaitingTime / steps
+        meanAccWaitingTime = totalAccWaitingTime / max(infoSteps, 1)
         metrics = {"mean_acc_waiting_time": meanAccWaitingTime, "mean_acc_reward": meanAccReward}
         
         return metrics
@@ -0,0 +1,323 @@
+import os
+import csv
+import json
+import hashlib
+import tempfile
+import itertools
+import subprocess
+from time import perf_counter
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.util import Finalize
+
+import numpy as np
+from sumolib import checkBinary
+
+from tscRL.environments.environment import SumoEnvironment
+from tscRL.environments.sumo_pool import SumoPool
+from tscRL.util.stateCache import cache_dir, getScenarioKey
+from .q_table import QTable
+
+# Default directory for cached evaluation results
+evaluation_dir = os.path.join(cache_dir, "evaluations")
+
+# SumoEnvironment arguments that do not change the results of an episode
+NON_RESULT_ARGS = ["gui", "sumoLog", "observationBackend", "label", "useLibsumo", "connectionFactory", "profile",
+                   "infoFields", "infoFrequency", "lazyInfo"]
+# Metrics of each evaluated episode
+METRICS = ["cumulative_reward", "mean_waiting_time", "mean_acc_waiting_time", "steps", "elapsed_time"]
+
+
+def _fileDigest(*fileNames):
+    digest = hashlib.sha256()
+    for fileName in fileNames:
+        with open(fileName, "rb") as file:
+            for chunk in iter(lambda: file.read(2**20), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+@lru_cache(maxsize=None)
+def sumoVersion():
+    """
+    Version of the SUMO binary (first line of sumo --version), part of the key of the cached results.
+    """
+    output = subprocess.run([checkBinary("sumo"), "--version"], capture_output=True, text=True).stdout
+    return output.splitlines()[0] if output else ""
+
+
+class FixedTimePolicy:
+    """
+    The fixed-time program of the scenario (program "2"), as run by FixedTLAgent.
+    """
+    fixedTL = True
+
+    def __init__(self, envKwargs=None):
+        self.envKwargs = envKwargs or {}
+
+    def key(self):
+        return ("fixed_time",)
+
+    def load(self, env):
+        pass
+
+    def act(self, observation):
+        return None
+
+
+class DQNPolicy:
+    """
+    Greedy policy of a DQN model saved by Stable Baselines3 (e.g. DQNAgent.model.save).
+
+    Args:
+        modelPath (str): Path of the saved model (.zip).
+        envKwargs (dict): SumoEnvironment arguments the model was trained with (observation and reward).
+    """
+    fixedTL = False
+
+    def __init__(self, modelPath, envKwargs=None):
+        self.modelPath = modelPath
+        self.envKwargs = envKwargs or {}
+        self.model = None
+
+    def key(self):
+        return ("dqn", _fileDigest(self.modelPath))
+
+    def load(self, env):
+        from stable_baselines3 import DQN
+        self.model = DQN.load(self.modelPath)
+
+    def act(self, observation):
+        action, _ = self.model.predict(observation, deterministic=True)
+        return int(action)
+
+
+class QTablePolicy:
+    """
+    Greedy policy of a Q-table saved by QLAgent.saveQTable (no learning during the evaluation).
+
+    Args:
+        qTablePath (str): Path the Q-table was saved to.
+        envKwargs (dict): SumoEnvironment arguments the Q-table was learned with (observation and reward).
+    """
+    fixedTL = False
+
+    def __init__(self, qTablePath, envKwargs=None):
+        self.qTablePath = qTablePath
+        self.envKwargs = envKwargs or {}
+        self.qTable = None
+        self.actionStart = 0
+
+    def key(self):
+        files = [self.qTablePath + suffix for suffix in (".values.npy", ".sizes.npy", ".codes.npy")]
+        return ("qtable", _fileDigest(*[fileName for fileName in files if os.path.exists(fileName)]))
+
+    def load(self, env):
+        self.qTable = QTable.load(self.qTablePath, mmap=False)
+        self.actionStart = env.action_space.start
+
+    def act(self, observation):
+        return int(self.qTable.argmax(observation)) + self.actionStart
+
+
+class ResultCache:
+    """
+    Cache of evaluation results, one JSON file per key (see evaluationKey). Results are deterministic for a
+    given policy, scenario, seed and environment, so cached evaluations are never simulated again.
+
+    Attributes:
+        cacheDir (str): Directory where the results are stored.
+    """
+    def __init__(self, cacheDir=evaluation_dir):
+        self.cacheDir = cacheDir
+        os.makedirs(cacheDir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cacheDir, key + ".json")
+
+    def get(self, key):
+        """
+        Returns:
+            list: Cached metrics of each episode, or None if they are not cached.
+        """
+        try:
+            with open(self._path(key)) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, results):
+        # Write and rename, so other processes never read a partially written file
+        fd, tmpPath = tempfile.mkstemp(dir=self.cacheDir, suffix=".tmp")
+        with os.fdopen(fd, "w") as file:
+            json.dump(results, file)
+        os.replace(tmpPath, self._path(key))
+
+
+def _environmentArgs(policy, envKwargs):
+    kwargs = dict(envKwargs, **policy.envKwargs)
+    kwargs["fixedTL"] = policy.fixedTL
+    # The metrics are computed from the waiting times of every step, whatever infoFields and infoFrequency are
+    kwargs["infoFields"] = None
+    kwargs["infoFrequency"] = 1
+    return kwargs
+
+
+def evaluationKey(policy, sumocfgFile, seed, episodes, envKwargs):
+    """
+    Key of the results of an evaluation: hash of the policy (of its saved files), the scenario files, the
+    SUMO seed, the number of episodes, the environment arguments that change the results and the SUMO version.
+    """
+    kwargs = _environmentArgs(policy, envKwargs)
+    # Whether the warm-up state is cached, not the StateCache object (nor its directory)
+    kwargs["stateCache"] = bool(kwargs.get("stateCache"))
+    resultArgs = sorted((key, value) for key, value in kwargs.items() if key not in NON_RESULT_ARGS)
+    return getScenarioKey(sumocfgFile, policy.key(), seed, episodes, resultArgs, sumoVersion())
+
+
+def evaluatePolicy(policy, sumocfgFile, seed, episodes=1, envKwargs=None, connectionFactory=None):
+    """
+    Runs episodes of a policy on a scenario, with the given SUMO seed (episode i is reset with seed + i).
+
+    Returns:
+        list: Metrics of each episode (see METRICS): cumulative reward, mean over the steps of the mean
+            waiting time and of the mean accumulated waiting time, number of steps and wall time.
+    """
+    kwargs = _environmentArgs(policy, envKwargs or {})
+    kwargs["sumoSeed"] = seed
+    if connectionFactory is not None:
+        kwargs["connectionFactory"] = connectionFactory
+    env = SumoEnvironment(sumocfgFile, **kwargs)
+    results = []
+    try:
+        policy.load(env)
+        for episode in range(episodes):
+            startTime = perf_counter()
+            # Seeded, so the episodes (e.g. the snapshots they start from) are the same in every evaluation
+            observation, _ = env.reset(seed=seed + episode)
+            cumulativeReward = 0
+            waitingTimes = []
+            accWaitingTimes = []
+            truncated = False
+            while not truncated:
+                observation, reward, _, truncated, info = env.step(policy.act(observation))
+                cumulativeReward += reward
+                waitingTimes.append(info["mean_waiting_time"])
+                accWaitingTimes.append(info["mean_acc_waiting_time"])
+            results.append({"cumulative_reward": float(cumulativeReward),
+                            "mean_waiting_time": float(np.mean(waitingTimes)),
+                            "mean_acc_waiting_time": float(np.mean(accWaitingTimes)),
+                            "steps": len(waitingTimes),
+                            "elapsed_time": perf_counter() - startTime})
+    finally:
+        env.close()
+    return results
+
+
+# SUMO process of each worker of evaluate, reused by its evaluations
+_workerPool = None
+
+def _initWorker():
+    global _workerPool
+    _workerPool = SumoPool()
+    # Close SUMO when the worker exits
+    Finalize(_workerPool, _workerPool.close, exitpriority=10)
+
+def _runJob(policy, sumocfgFile, seed, episodes, envKwargs):
+    connectionFactory = _workerPool.lease if _workerPool is not None else None
+    return evaluatePolicy(policy, sumocfgFile, seed, episodes, envKwargs, connectionFactory)
+
+
+def evaluate(policies, scenarios, seeds, episodes=1, envKwargs=None, nWorkers=1, cache=True):
+    """
+    Evaluates every (policy, scenario, seed) combination, in a pool of worker processes (each one with its
+    own SUMO process), and returns the metrics of every episode as a tidy list of rows. Evaluations in the
+    result cache are not simulated.
+
+    Args:
+        policies (dict): Policies by name (FixedTimePolicy, DQNPolicy, QTablePolicy...).
+        scenarios (dict): SUMO configuration files by scenario name.
+        seeds (list): SUMO seeds.
+        episodes (int): Episodes of each evaluation.
+        envKwargs (dict): SumoEnvironment arguments (overridden by the envKwargs of each policy).
+        nWorkers (int): Number of worker processes (1 evaluates in this process).
+        cache (bool or ResultCache): Result cache. True uses a ResultCache with the default directory, False
+            disables caching.
+
+    Returns:
+        list: One row (dict) per episode: policy, scenario, seed, episode, the metrics (see METRICS) and
+            whether the results were cached.
+    """
+    envKwargs = envKwargs or {}
+    resultCache = ResultCache() if cache is True else (cache or None)
+    jobs = list(itertools.product(policies.items(), scenarios.items(), seeds))
+    results = {}
+    pending = []
+    for job in jobs:
+        (_, policy), (_, sumocfgFile), seed = job
+        key = evaluationKey(policy, sumocfgFile, seed, episodes, envKwargs) if resultCache is not None else None
+        cached = resultCache.get(key) if resultCache is not None else None
+        if cached is not None:
+            results[job[0][0], job[1][0], seed] = (cached, True)
+        else:
+            pending.append((job, key))
+
+    def store(job, key, jobResults):
+        if resultCache is not None:
+            resultCache.put(key, jobResults)
+        results[job[0][0], job[1][0], job[2]] = (jobResults, False)
+
+    if nWorkers <= 1:
+        for job, key in pending:
+            (_, policy), (_, sumocfgFile), seed = job
+            store(job, key, evaluatePolicy(policy, sumocfgFile, seed, episodes, envKwargs))
+    elif pending:
+        with ProcessPoolExecutor(max_workers=nWorkers, initializer=_initWorker) as executor:
+            futures = [(job, key, executor.submit(_runJob, job[0][1], job[1][1], job[2], episodes, envKwargs))
+                       for job, key in pending]
+            for job, key, future in futures:
+                store(job, key, future.result())
+
+    rows = []
+    for (policyName, _), (scenarioName, _), seed in jobs:
+        jobResults, cached = results[policyName, scenarioName, seed]
+        for episode, metrics in enumerate(jobResults):
+            rows.append(dict({"policy": policyName, "scenario": scenarioName, "seed": seed, "episode": episode},
+                             **metrics, cached=cached))
+    return rows
+
+
+def comparisonTable(rows, metrics=("cumulative_reward", "mean_waiting_time", "mean_acc_waiting_time")):
+    """
+    Mean and standard deviation of the metrics of each policy on each scenario, over seeds and episodes.
+
+    Args:
+        rows (list): Rows returned by evaluate.
+        metrics (tuple): Metrics of the table.
+
+    Returns:
+        list: One row (dict) per scenario and policy, in the order of evaluate: scenario, policy, number of
+            episodes and the mean and standard deviation of each metric (<metric>_mean and <metric>_std).
+    """
+    groups = {}
+    for row in rows:
+        groups.setdefault((row["scenario"], row["policy"]), []).append(row)
+    table = []
+    for (scenario, policy), groupRows in sorted(groups.items(), key=lambda item: item[0][0]):
+        tableRow = {"scenario": scenario, "policy": policy, "episodes": len(groupRows)}
+        for metric in metrics:
+            values = [row[metric] for row in groupRows]
+            tableRow[metric + "_mean"] = float(np.mean(values))
+            tableRow[metric + "_std"] = float(np.std(values))
+        table.append(tableRow)
+    return table
+
+
+def writeCsv(rows, fileName):
+    """
+    Writes the rows of evaluate or comparisonTable to a CSV file.
+    """
+    with open(fileName, "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
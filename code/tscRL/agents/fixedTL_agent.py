@@ -3,6 +3,7 @@ import random
 
 import sys
 import os
+import tempfile
 
 class FixedTLAgent:
     """
@@ -13,17 +14,31 @@ class FixedTLAgent:
                 The environment where agent acts in
             currentState : tuple
                 Current state
+            native : bool
+                Let SUMO run each episode to its end in a single simulation step, collecting the metrics
+                from its outputs (see SumoEnvironment.runFixedTimeEpisode), instead of stepping it. The
+                metrics have the same keys, filled from the outputs of a reloaded simulation, and more
+                (trips, running and halting vehicles)
+            outputDir : str
+                Directory of the tripinfo and summary outputs of the native episodes (a temporary
+                directory, removed after each episode, if None)
     """
     
-    def __init__(self, environment, episodes, programID=None):
+    def __init__(self, environment, episodes, programID=None, native=False, outputDir=None):
         environment.fixedTL = True
+        # The metrics are computed from the info of every step
+        environment.requireInfoFields(["mean_acc_waiting_time"])
         self.environment = environment
         self.currentState = environment.getCurrentState()
         self.episodes = episodes
+        self.native = native
+        self.outputDir = outputDir
         if programID != None:
             self.environment.setTLProgram(programID)
         
     def run(self):
+        if self.native:
+            return self._runNative()
         metrics = []
         for episode in range(self.episodes):
             print("episode: " + str(episode+1))
@@ -47,4 +62,25 @@ class FixedTLAgent:
             
         self.environment.close()
         return metrics
-        
\ No newline at end of file
+        
+
+    def _runNative(self):
+        metrics = []
+        for episode in range(self.episodes):
+            print("episode: " + str(episode+1))
+            if self.outputDir is None:
+                with tempfile.TemporaryDirectory() as outputDir:
+                    episodeMetrics = self._runNativeEpisode(outputDir, episode)
+            else:
+                os.makedirs(self.outputDir, exist_ok=True)
+                episodeMetrics = self._runNativeEpisode(self.outputDir, episode)
+            self.environment.reset()
+            metrics.append(dict({"episode": episode}, **episodeMetrics))
+
+        self.environment.close()
+        return metrics
+
+    def _runNativeEpisode(self, outputDir, episode):
+        tripinfoFile = os.path.join(outputDir, "tripinfo_" + str(episode) + ".xml")
+        summaryFile = os.path.join(outputDir, "summary_" + str(episode) + ".xml")
+        return self.environment.runFixedTimeEpisode(tripinfoFile, summaryFile)
@@ -0,0 +1,147 @@
+import os
+import numpy as np
+from gymnasium import spaces
+
+
+class QTable:
+    """
+    Dense tabular action-value function stored in a NumPy array.
+
+    Discretized states are mapped to rows with a mixed-radix encoding: each state variable is a digit
+    whose base is the number of values it can take (known from the observation space).
+
+    Attributes:
+        sizes (np.ndarray): Number of values of each state variable.
+        strides (np.ndarray): Weight of each state variable in the state code.
+        values (np.ndarray): Action values, one row per state code and one column per action.
+    """
+    def __init__(self, sizes, nActions, values=None):
+        self.sizes = np.asarray(sizes, dtype=np.int64)
+        self.nActions = nActions
+        # Last variable varies fastest
+        strides = np.ones(len(self.sizes), dtype=np.int64)
+        for i in range(len(self.sizes)-2, -1, -1):
+            strides[i] = strides[i+1] * self.sizes[i+1]
+        self.strides = strides
+        self.nStates = QTable.countStates(self.sizes)
+        if values is None:
+            values = np.zeros((self.nStates, nActions))
+        self.values = values
+
+    @staticmethod
+    def countStates(sizes):
+        """
+        Number of states (as a Python int, so it does not overflow) of a state space with the given sizes.
+        """
+        nStates = 1
+        for size in sizes:
+            nStates *= int(size)
+        return nStates
+
+    @staticmethod
+    def fromSpaces(observationSpace: spaces.Box, actionSpace: spaces.Discrete, maxDenseStates=2**20):
+        """
+        Create a Q-table for the given spaces, dense if the number of states is at most maxDenseStates and
+        sparse otherwise.
+        """
+        sizes = (observationSpace.high - observationSpace.low + 1).astype(np.int64)
+        if QTable.countStates(sizes) <= maxDenseStates:
+            return QTable(sizes, int(actionSpace.n))
+        return SparseQTable(sizes, int(actionSpace.n))
+
+    def encode(self, states):
+        """
+        Mixed-radix code of a state, or of a batch of states (one per row).
+        """
+        return np.asarray(states, dtype=np.int64) @ self.strides
+
+    def _rows(self, states):
+        return self.encode(states)
+
+    def __getitem__(self, states):
+        """ Action values of a state (or a batch of states). """
+        # Rows first, a sparse table may grow its values when adding them
+        rows = self._rows(states)
+        return self.values[rows]
+
+    def get(self, state, action):
+        row = self._rows(state)
+        return self.values[row, action]
+
+    def set(self, state, action, value):
+        row = self._rows(state)
+        self.values[row, action] = value
+
+    def argmax(self, states):
+        """ Greedy action of a state (or a batch of states). Ties are broken by the lowest action. """
+        return np.argmax(self[states], axis=-1)
+
+    def max(self, states):
+        """ Highest action value of a state (or a batch of states). """
+        return np.max(self[states], axis=-1)
+
+    def clear(self):
+        self.values[:] = 0
+
+    def save(self, path):
+        """
+        Save the action values as a .npy file, so they can be memory-mapped when loaded.
+        """
+        np.save(path + ".values.npy", self.values)
+        np.save(path + ".sizes.npy", self.sizes)
+        if os.path.exists(path + ".codes.npy"):
+            os.remove(path + ".codes.npy")
+
+    @staticmethod
+    def load(path, mmap=True):
+        """
+        Load a Q-table saved with save(). If mmap is True the action values are memory-mapped
+        (read-write) instead of read into memory.
+        """
+        mmapMode = "r+" if mmap else None
+        sizes = np.load(path + ".sizes.npy")
+        values = np.load(path + ".values.npy", mmap_mode=mmapMode)
+        if os.path.exists(path + ".codes.npy"):
+            return SparseQTable(sizes, values.shape[1], values, np.load(path + ".codes.npy"))
+        return QTable(sizes, values.shape[1], values)
+
+
+class SparseQTable(QTable):
+    """
+    Q-table for state spaces too large to be stored densely. Only visited states get a row: a dict maps
+    state codes to rows, and rows are added to an array that doubles its capacity when full.
+    Unvisited states have zero action values.
+    """
+    def __init__(self, sizes, nActions, values=None, codes=None, capacity=1024):
+        if values is None:
+            values = np.zeros((capacity, nActions))
+            codes = np.zeros(0, dtype=np.int64)
+        super().__init__(sizes, nActions, values)
+        self.rows = {int(code): row for row, code in enumerate(codes)}
+
+    def _row(self, code):
+        row = self.rows.get(code)
+        if row is None:
+            row = len(self.rows)
+            if row == len(self.values):
+                self.values = np.concatenate((self.values, np.zeros((max(row, 1), self.nActions))))
+            self.rows[code] = row
+        return row
+
+    def _rows(self, states):
+        codes = self.encode(states)
+        if codes.ndim == 0:
+            return self._row(int(codes))
+        return np.array([self._row(int(code)) for code in codes], dtype=np.int64)
+
+    def clear(self):
+        self.values[:] = 0
+        self.rows.clear()
+
+    def save(self, path):
+        np.save(path + ".values.npy", self.values[:len(self.rows)])
+        np.save(path + ".sizes.npy", self.sizes)
+        codes = np.zeros(len(self.rows), dtype=np.int64)
+        for code, row in self.rows.items():
+            codes[row] = code
+        np.save(path + ".codes.npy", codes)
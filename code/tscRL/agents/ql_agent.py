@@ -5,6 +5,8 @@ from time import time
 import sys
 import os
 
+from .q_table import QTable
+
 class QLAgent:
     """
         Q Learning agent with epsilon greedy policy
@@ -12,7 +14,7 @@ class QLAgent:
         Attributes:
             environment : SumoEnvironment
                 The environment where agent acts in
-            currentState : tuple
+            currentState : np.ndarray
                 Current state
             lastReward : float
                 Last reward aquired
@@ -26,11 +28,16 @@ class QLAgent:
                 Minimum exploration probability
             decayRate : float
                 Exponential decay rate for exploration probability
+            qTable : QTable
+                Action values, indexed by the mixed-radix code of the state (sparse if there are more
+                than maxDenseStates states)
     """
     
-    def __init__(self, environment, gamma, alpha, startEpsilon=1, endEpsilon=0.001, decayRate=0.02, episodes=1):
+    def __init__(self, environment, gamma, alpha, startEpsilon=1, endEpsilon=0.001, decayRate=0.02, episodes=1, maxDenseStates=2**20):
         self.environment = environment
-        self.currentState = tuple(environment.getCurrentState())
+        # The metrics are computed from the info of every step
+        environment.requireInfoFields(["mean_waiting_time"])
+        self.currentState = environment.getCurrentState()
 
         self.lastReward = 0
         # self.accReward = 0
@@ -43,25 +50,31 @@ class QLAgent:
         self.episodes = episodes
         self.action_space = self.environment.action_space
         
-        self.qTable = {self.currentState: [0 for action in range(self.action_space.n)]}
-        #print(self.qTable[self.currentState][0])
+        self.qTable = QTable.fromSpaces(self.environment.observation_space, self.action_space, maxDenseStates)
         
         
     def epsilonGreedyPolicy(self, state, epsilon):
         randint = random.uniform(0,1)
         if randint > epsilon:
-            action = max(self.qTable[state].items(), key=lambda x: x[1])[0]
-            # action = np.argmax(self.qTable[state])
+            action = int(self.qTable.argmax(state)) + self.action_space.start
         else:
             action = int(self.action_space.sample())
         return action
     
     def deleteKnowledge(self):
-        self.qTable = {
-            self.currentState: {
-                (action + self.action_space.start): 0 for action in range(self.action_space.n)
-            }
-        }
+        self.qTable.clear()
+    
+    def updateQValue(self, state, action, reward, newState):
+        """ Q-learning update of the value of the action taken in state. """
+        actionIndex = action - self.action_space.start
+        qValue = self.qTable.get(state, actionIndex)
+        self.qTable.set(state, actionIndex, qValue + self.alpha * (reward + self.gamma * self.qTable.max(newState) - qValue))
+    
+    def saveQTable(self, path):
+        self.qTable.save(path)
+        
+    def loadQTable(self, path, mmap=True):
+        self.qTable = QTable.load(path, mmap)
     
     def learn(self):
         metrics = []
@@ -76,14 +89,10 @@ class QLAgent:
             while not done:
                 action = self.epsilonGreedyPolicy(self.currentState, epsilon)
                 newState, reward, _, done, info = self.environment.step(action)
-                newState = tuple(newState)
                 cumulativeReward = cumulativeReward + reward
                 meanWaitingTimeSum += info["mean_waiting_time"]
 
-                if newState not in self.qTable:
-                    self.qTable[newState] = {(action + self.action_space.start) : 0 for action in range(self.action_space.n)}
-                    
-                self.qTable[self.currentState][action] = self.qTable[self.currentState][action] + self.alpha * (reward + self.gamma * max(self.qTable[newState]) - self.qTable[self.currentState][action])
+                self.updateQValue(self.currentState, action, reward, newState)
                 if done:
                     break
                     
@@ -109,16 +118,13 @@ class QLAgent:
             cumulativeReward = 0
             meanWaitingTimeSum = 0
             while not done:
-                action = max(self.qTable[state].items(), key=lambda x: x[1])[0]
+                action = int(self.qTable.argmax(self.currentState)) + self.action_space.start
                 newState, reward, _, done, info = self.environment.step(action)
                 
                 cumulativeReward = cumulativeReward + reward
                 meanWaitingTimeSum += info["mean_waiting_time"]
 
-                if newState not in self.qTable:
-                    self.qTable[newState] = {action: 0 for action in self.environment.actionSpace}
-            
-                self.qTable[self.currentState][action] = self.qTable[self.currentState][action] + self.alpha * (reward + self.gamma * max(self.qTable[newState].values()) - self.qTable[self.currentState][action])
+                self.updateQValue(self.currentState, action, reward, newState)
                 if done:
                     break
                 self.currentState = newState
@@ -0,0 +1,137 @@
+import tempfile
+import numpy as np
+
+from gymnasium import spaces
+from stable_baselines3.common.buffers import BaseBuffer, ReplayBuffer
+from stable_baselines3.common.type_aliases import ReplayBufferSamples
+
+
+def compactDtype(observationSpace):
+    """
+    Narrowest integer dtype that holds every value of an integer Box observation space (e.g. uint8 for the
+    discretized observations of SumoEnvironment). Other spaces keep their dtype.
+    """
+    if not (isinstance(observationSpace, spaces.Box) and np.issubdtype(observationSpace.dtype, np.integer)):
+        return observationSpace.dtype
+    low = int(np.min(observationSpace.low))
+    high = int(np.max(observationSpace.high))
+    return np.promote_types(np.min_scalar_type(low), np.min_scalar_type(high))
+
+
+class CompactReplayBuffer(ReplayBuffer):
+    """
+    Stable Baselines3 replay buffer for discretized observations, for DQNAgent.
+
+    Observations are stored in the narrowest integer dtype of the observation space (see compactDtype),
+    instead of the int64 of the space. With dropNextObservations, the next observation of a transition
+    is not stored: it is the observation of the following transition of the same environment, except at
+    the end of an episode, when the terminal observation is kept apart. Unlike optimize_memory_usage, this
+    works along with handle_timeout_termination (episodes of SumoEnvironment end by truncation).
+
+    With memmapDir, the arrays of the buffer are backed by (anonymous) temporary files in that directory
+    instead of RAM, so buffers larger than RAM can be used. The files are deleted when the buffer is.
+
+    Args:
+        dropNextObservations (bool): Do not store the next observations.
+        memmapDir (str): Directory of the memory-mapped files of the buffer (None keeps it in RAM).
+        Other arguments as in ReplayBuffer (passed by SB3).
+    """
+    def __init__(
+        self,
+        buffer_size,
+        observation_space,
+        action_space,
+        device="auto",
+        n_envs=1,
+        optimize_memory_usage=False,
+        handle_timeout_termination=True,
+        dropNextObservations=False,
+        memmapDir=None,
+    ):
+        BaseBuffer.__init__(self, buffer_size, observation_space, action_space, device, n_envs=n_envs)
+        self.buffer_size = max(buffer_size // n_envs, 1)
+        # optimize_memory_usage is replaced by dropNextObservations
+        self.optimize_memory_usage = False
+        self.handle_timeout_termination = handle_timeout_termination
+        self.dropNextObservations = dropNextObservations
+        self.memmapDir = memmapDir
+        self.observationDtype = compactDtype(observation_space)
+
+        shape = (self.buffer_size, self.n_envs)
+        self.observations = self._allocate(shape + self.obs_shape, self.observationDtype)
+        if not dropNextObservations:
+            self.next_observations = self._allocate(shape + self.obs_shape, self.observationDtype)
+        self.actions = self._allocate(shape + (self.action_dim,), self._maybe_cast_dtype(action_space.dtype))
+        self.rewards = self._allocate(shape, np.float32)
+        self.dones = self._allocate(shape, np.float32)
+        self.timeouts = self._allocate(shape, np.float32)
+        # Terminal observations by (position, environment), when the next observations are dropped
+        self.terminalObservations = {}
+
+    def _allocate(self, shape, dtype):
+        if self.memmapDir is None:
+            return np.zeros(shape, dtype=dtype)
+        # The temporary file is unlinked on creation and freed along with the map
+        return np.memmap(tempfile.TemporaryFile(dir=self.memmapDir), dtype=dtype, mode="w+", shape=shape)
+
+    @property
+    def nbytes(self):
+        """ Bytes taken by the arrays of the buffer. """
+        arrays = [self.observations, self.actions, self.rewards, self.dones, self.timeouts]
+        if not self.dropNextObservations:
+            arrays.append(self.next_observations)
+        return sum(array.nbytes for array in arrays)
+
+    def add(self, obs, next_obs, action, reward, done, infos):
+        if not self.dropNextObservations:
+            super().add(obs, next_obs, action, reward, done, infos)
+            return
+        nextPos = (self.pos + 1) % self.buffer_size
+        self.observations[self.pos] = np.array(obs)
+        # The row of the next position is overwritten by the next transition, which starts with next_obs
+        # unless the episode ended
+        self.observations[nextPos] = np.array(next_obs)
+        for env in range(self.n_envs):
+            self.terminalObservations.pop((self.pos, env), None)
+            if done[env]:
+                self.terminalObservations[(self.pos, env)] = np.array(next_obs[env], dtype=self.observationDtype)
+        self.actions[self.pos] = np.array(action).reshape((self.n_envs, self.action_dim))
+        self.rewards[self.pos] = np.array(reward)
+        self.dones[self.pos] = np.array(done)
+        if self.handle_timeout_termination:
+            self.timeouts[self.pos] = np.array([info.get("TimeLimit.truncated", False) for info in infos])
+
+        self.pos += 1
+        if self.pos == self.buffer_size:
+            self.full = True
+            self.pos = 0
+
+    def sample(self, batch_size, env=None):
+        if not self.dropNextObservations:
+            return super().sample(batch_size, env=env)
+        # The transition at pos is the oldest one, its next observation was overwritten
+        if self.full:
+            batchInds = (np.random.randint(1, self.buffer_size, size=batch_size) + self.pos) % self.buffer_size
+        else:
+            batchInds = np.random.randint(0, self.pos, size=batch_size)
+        return self._get_samples(batchInds, env=env)
+
+    def _get_samples(self, batch_inds, env=None):
+        if not self.dropNextObservations:
+            return super()._get_samples(batch_inds, env=env)
+        envIndices = np.random.randint(0, high=self.n_envs, size=(len(batch_inds),))
+        nextObservations = self.observations[(batch_inds + 1) % self.buffer_size, envIndices, :]
+        if self.terminalObservations:
+            for sample, key in enumerate(zip(batch_inds.tolist(), envIndices.tolist())):
+                terminalObservation = self.terminalObservations.get(key)
+                if terminalObservation is not None:
+                    nextObservations[sample] = terminalObservation
+        data = (
+            self._normalize_obs(self.observations[batch_inds, envIndices, :], env),
+            self.actions[batch_inds, envIndices, :],
+            self._normalize_obs(nextObservations, env),
+            # Only use dones that are not due to timeouts
+            (self.dones[batch_inds, envIndices] * (1 - self.timeouts[batch_inds, envIndices])).reshape(-1, 1),
+            self._normalize_reward(self.rewards[batch_inds, envIndices].reshape(-1, 1), env),
+        )
+        return ReplayBufferSamples(*tuple(map(self.to_torch, data)))
@@ -0,0 +1,206 @@
+import os
+from time import perf_counter
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import optuna
+from optuna.storages import JournalStorage
+from optuna.storages.journal import JournalFileBackend
+from optuna.trial import TrialState
+
+from tscRL.environments.environment import SumoEnvironment, MICRO, MESO
+from tscRL.environments.sumo_pool import SumoPool
+from .callbacks import TrialCallback
+from .dqn_agent import DQNAgent
+
+# Fidelity rungs of a study: training episodes, simulated time of the episodes and simulation fidelity.
+# Trials are promoted from each rung to the next by the pruner.
+DEFAULT_RUNGS = [{"episodes": 2, "simTime": 7200, "fidelity": MESO},
+                 {"episodes": 4, "simTime": 14400, "fidelity": MICRO},
+                 {"episodes": 10, "simTime": 43800, "fidelity": MICRO}]
+
+SUCCESSIVE_HALVING = "successive_halving"
+HYPERBAND = "hyperband"
+
+
+def sampleDQNParams(trial: optuna.Trial):
+    """
+    Samples the DQNAgent hyperparameters of the parameter studies of the DQN experiment.
+
+    Returns:
+        dict: DQNAgent arguments.
+    """
+    layerSize = trial.suggest_categorical("layer", [32, 64, 128])
+    return {"learningRate": trial.suggest_float("learning_rate", 0.001, 0.1, log=True),
+            "batchSize": trial.suggest_categorical("batch_size", [32, 64]),
+            "bufferSize": trial.suggest_categorical("buffer_size", [100000, 500000, 1000000]),
+            "explorationFraction": trial.suggest_float("exploration_fraction", 0.1, 0.6),
+            "targetUpdateInterval": trial.suggest_categorical("target_update_interval", [1000, 5000, 10000]),
+            "netArch": (layerSize, layerSize)}
+
+
+def getStorage(storage):
+    """
+    Optuna storage shared by the workers of a study: a journal file (path ending in .log or .journal),
+    which supports concurrent processes without a database server, or an RDB URL (e.g. "sqlite:///study.db").
+    """
+    if storage.endswith((".log", ".journal")):
+        return JournalStorage(JournalFileBackend(storage))
+    return storage
+
+
+def getPruner(pruner, nRungs, reductionFactor):
+    """
+    Pruner allocating the rungs among the trials. The value of rung i is reported at step reductionFactor**i,
+    so the rungs of successive halving (and of each Hyperband bracket) fall on the rungs of the study.
+    """
+    if pruner == HYPERBAND:
+        return optuna.pruners.HyperbandPruner(min_resource=1, max_resource=reductionFactor ** (nRungs - 1),
+                                              reduction_factor=reductionFactor)
+    if pruner != SUCCESSIVE_HALVING:
+        print("Warning: Invalid pruner value. \"" + SUCCESSIVE_HALVING + "\" value was assigned instead.")
+    return optuna.pruners.SuccessiveHalvingPruner(min_resource=1, reduction_factor=reductionFactor)
+
+
+def _runRung(trial, rung, params, sumocfgFile, envKwargs, agentKwargs, rewardsWindowSize, pool):
+    """
+    Trains a new agent with the parameters of the trial on the fidelity of the rung.
+
+    Returns:
+        tuple: Mean cumulative reward of the last rewardsWindowSize episodes and number of environment steps.
+    """
+    kwargs = dict(envKwargs, simTime=rung["simTime"], fidelity=rung.get("fidelity", MICRO))
+    if kwargs["fidelity"] == MESO:
+        # Edge data only, and states cannot be loaded (see SumoEnvironment fidelity)
+        kwargs["edges"] = True
+        kwargs["stateCache"] = None
+    if pool is not None:
+        kwargs["connectionFactory"] = pool.lease
+    env = SumoEnvironment(sumocfgFile, **kwargs)
+    callback = TrialCallback(trial=trial, n_eval_episodes=rung["episodes"], rewards_window_size=rewardsWindowSize,
+                             min_trial_fract=1, prune=False, report=False)
+    try:
+        agent = DQNAgent(env=env, callback=callback, **dict(agentKwargs, **params))
+        agent.learn(episodes=rung["episodes"])
+        steps = agent.model.num_timesteps
+    finally:
+        env.close()
+    return float(np.mean(callback.last_cumulative_rewards)), steps
+
+
+def _objective(trial, sumocfgFile, envKwargs, agentKwargs, rungs, reductionFactor, rewardsWindowSize,
+               sampleParams, pool):
+    params = sampleParams(trial)
+    startTime = perf_counter()
+    totalSteps = 0
+    value = None
+    try:
+        for index, rung in enumerate(rungs):
+            rungStart = perf_counter()
+            value, steps = _runRung(trial, rung, params, sumocfgFile, envKwargs, agentKwargs, rewardsWindowSize,
+                                    pool)
+            totalSteps += steps
+            trial.set_user_attr("rung_" + str(index) + "_time", perf_counter() - rungStart)
+            trial.set_user_attr("rungs", index + 1)
+            if not np.isfinite(value):
+                return float("nan")
+            trial.report(value, reductionFactor ** index)
+            if index < len(rungs) - 1 and trial.should_prune():
+                raise optuna.TrialPruned()
+    except AssertionError as e:
+        # Sometimes, random hyperparams can generate NaN.
+        print(e)
+        return float("nan")
+    finally:
+        wallTime = perf_counter() - startTime
+        trial.set_user_attr("wall_time", wallTime)
+        trial.set_user_attr("steps", totalSteps)
+        trial.set_user_attr("steps_per_second", totalSteps / wallTime if wallTime > 0 else 0)
+    return value
+
+
+def _runWorker(worker, studyName, storage, nTrials, sumocfgFile, envKwargs, agentKwargs, rungs, pruner,
+               reductionFactor, rewardsWindowSize, sampleParams, seed, usePool):
+    """
+    Runs trials of the study in a worker process until the study has nTrials finished trials. The worker
+    runs its own SUMO (a single-worker SumoPool reused by all its environments, unless usePool is False).
+    """
+    import torch
+    # One thread per worker, the workers already use the cores
+    torch.set_num_threads(1)
+    sampler = optuna.samplers.TPESampler(seed=None if seed is None else seed + worker)
+    # The pruner is not stored with the study
+    study = optuna.load_study(study_name=studyName, storage=getStorage(storage), sampler=sampler,
+                              pruner=getPruner(pruner, len(rungs), reductionFactor))
+    pool = SumoPool() if usePool else None
+    objective = partial(_objective, sumocfgFile=sumocfgFile, envKwargs=envKwargs, agentKwargs=agentKwargs,
+                        rungs=rungs, reductionFactor=reductionFactor, rewardsWindowSize=rewardsWindowSize,
+                        sampleParams=sampleParams, pool=pool)
+    finished = (TrialState.COMPLETE, TrialState.PRUNED, TrialState.FAIL)
+    try:
+        study.optimize(objective, callbacks=[optuna.study.MaxTrialsCallback(nTrials, states=finished)])
+    finally:
+        if pool is not None:
+            pool.close()
+
+
+def runStudy(
+    studyName: str,
+    storage: str,
+    sumocfgFile: str,
+    nTrials: int,
+    nWorkers: int = 1,
+    envKwargs: dict = None,
+    agentKwargs: dict = None,
+    rungs: list = None,
+    pruner: str = SUCCESSIVE_HALVING,
+    reductionFactor: int = 3,
+    rewardsWindowSize: int = 3,
+    sampleParams=sampleDQNParams,
+    seed: int = None,
+    usePool: bool = True,
+):
+    """
+    Multi-fidelity hyperparameter study of DQNAgent on SumoEnvironment.
+
+    Each trial trains a new agent on every rung (see DEFAULT_RUNGS), from the cheapest to the full fidelity,
+    and reports the mean cumulative reward of the last training episodes of the rung (as TrialCallback). The
+    pruner (successive halving or Hyperband) stops the trials that fall behind at a rung, so most of the
+    budget goes to the promising ones. The trials run in nWorkers processes sharing the storage, each one
+    with its own SUMO process, and get their wall time, environment steps and steps per second (along with
+    the time of each rung) as user attributes.
+
+    Args:
+        studyName (str): Name of the study (loaded if it already exists in the storage).
+        storage (str): Journal file path (.log or .journal) or RDB URL of the study (see getStorage).
+        sumocfgFile (str): SUMO configuration of the environments.
+        nTrials (int): Number of finished trials of the study the workers stop at.
+        nWorkers (int): Number of worker processes.
+        envKwargs (dict): SumoEnvironment arguments (simTime and fidelity are set by the rungs).
+        agentKwargs (dict): DQNAgent arguments not sampled by sampleParams.
+        rungs (list): Fidelity rungs, dicts with "episodes", "simTime" and "fidelity" ("micro" by default).
+        pruner (str): "successive_halving" or "hyperband".
+        reductionFactor (int): Reduction factor of the pruner (1 of reductionFactor trials is promoted).
+        rewardsWindowSize (int): Number of last training episodes of a rung its value is the mean of.
+        sampleParams (callable): Samples the DQNAgent arguments of a trial (a module-level function, it is
+            sent to the worker processes).
+        seed (int): Seed of the samplers of the workers (worker i uses seed + i).
+        usePool (bool): Reuse the SUMO process of each worker across its environments (see SumoPool).
+
+    Returns:
+        optuna.Study: The study.
+    """
+    rungs = rungs if rungs is not None else DEFAULT_RUNGS
+    study = optuna.create_study(study_name=studyName, storage=getStorage(storage), direction="maximize",
+                                pruner=getPruner(pruner, len(rungs), reductionFactor), load_if_exists=True)
+    workerArgs = (studyName, storage, nTrials, os.path.abspath(sumocfgFile), envKwargs or {}, agentKwargs or {},
+                  rungs, pruner, reductionFactor, rewardsWindowSize, sampleParams, seed, usePool)
+    if nWorkers <= 1:
+        _runWorker(0, *workerArgs)
+    else:
+        with ProcessPoolExecutor(max_workers=nWorkers) as executor:
+            futures = [executor.submit(_runWorker, worker, *workerArgs) for worker in range(nWorkers)]
+            for future in futures:
+                future.result()
+    return optuna.load_study(study_name=studyName, storage=getStorage(storage))
@@ -1,6 +1,8 @@
 import sys
 import os
 import random
+import itertools
+import shutil
 import numpy as np
 from typing import Dict
 
@@ -8,9 +10,25 @@ import gymnasium as gym
 from gymnasium import spaces
 
 import traci
+import traci.constants as tc
 from sumolib import checkBinary
+try:
+    # In-process SUMO, call-compatible with traci (optional)
+    import libsumo
+except ImportError:
+    libsumo = None
+try:
+    # For converting the episode outputs to Parquet or Arrow files (optional)
+    import pyarrow
+except ImportError:
+    pyarrow = None
 
 from tscRL.util.discrete import Discrete
+from tscRL.util.lazyInfo import LazyInfo
+from tscRL.util.stateCache import StateCache
+from tscRL.util.sumoOutputs import (readTripinfo, readSummary, episodeOutputFiles, convertOutput, OUTPUT_TAGS,
+                                    FILE_EXTENSIONS, XML)
+from tscRL.util.profiling import NullTimer, PhaseTimer, CallCounter, CountingConnection
 
 
 # Ensure SUMO environment variable is set
@@ -18,15 +36,46 @@ if 'SUMO_HOME' in os.environ:
     tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
     sys.path.append(tools)
 else:
-    sys.exit("please declare environment variable 'SUMO_HOME'")
+    # traci and sumolib may be installed as packages. SUMO itself is only needed to run simulations
+    # (not by the FakeConnection or the surrogate environments)
+    print("Warning: please declare environment variable 'SUMO_HOME' to run SUMO simulations")
     
 # Directory for saving SUMO simulation states
 state_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.states')
 os.makedirs(state_dir, exist_ok=True)
 
+# Counter for generating connection labels unique within the process
+_labelCounter = itertools.count()
+
+# Errors raised by SUMO commands, for both traci and libsumo
+TraCIExceptions = (traci.TraCIException,) if libsumo is None else (traci.TraCIException, libsumo.TraCIException)
+
 # Constants for vehicle state information
 HALTED = "halted"
 WAITING_TIME = "waitingTime"
+# Row of each lane metric in the lane data buffer
+LANE_DATA_ROWS = {HALTED: 0, WAITING_TIME: 1}
+
+# Observation backends for retrieving lane information
+POLLING = "polling"
+SUBSCRIPTION = "subscription"
+# TraCI variables retrieved for each lane (or edge)
+LANE_VARIABLES = [tc.LAST_STEP_VEHICLE_HALTING_NUMBER, tc.VAR_WAITING_TIME]
+
+# Simulation fidelities: microscopic (SUMO's default) or mesoscopic (queue-based, much faster)
+MICRO = "micro"
+MESO = "meso"
+# SUMO options of the mesoscopic simulation: traffic lights control the queues at the junctions (otherwise
+# they are ignored, only penalized), one queue per lane at the end of the edges (so vehicles waiting to
+# turn do not block the other lanes) and 10 m segments (about two vehicles per segment, so the waiting times
+# stay close to the microscopic ones on the 2x2_intersection scenarios)
+MESO_OPTIONS = ["--mesosim", "true", "--meso-junction-control", "true", "--meso-lane-queue", "true",
+                "--meso-edgelength", "10"]
+
+# Fields of the info returned by SumoEnvironment.step and reset
+INFO_FIELDS = ["sim_step", "mean_waiting_time", "mean_acc_waiting_time"]
+# Info frequency for computing the info fields only at the end of the episodes
+EPISODE_END = "episode_end"
 
 class Vehicle:
     """
@@ -51,26 +100,186 @@ class Lane:
         lastStepHaltedVehicles (int): Number of vehicles that were halted in the last simulation step.
         lastStepWaitingTime (float): Total waiting time accumulated in the lane in the last step.
         edge (bool): Determines whether lane data should be retrieved from the edge or the lane.
+        connection (traci.Connection): TraCI connection of the simulation the lane belongs to.
+        laneData (np.ndarray): Buffer (one row per metric, one column per lane) where the lane data is stored.
+            Lanes of the same environment share it, so their data can be read as a single array.
+        index (int): Column of the lane in laneData.
     """
-    def __init__(self, laneId, laneLength, edge=False):
+    def __init__(self, laneId, laneLength, edge=False, connection=traci, laneData=None, index=0):
         # self.vehicleMinGap = vehicleMinGap
         # self.vehicles = []
         self.laneId = laneId
         # self.laneLength = laneLength
+        if laneData is None:
+            laneData = np.zeros((len(LANE_DATA_ROWS), 1))
+            index = 0
+        self.laneData = laneData
+        self.index = index
         self.lastStepHaltedVehicles = 0
         self.lastStepWaitingTime = 0
         self.edge = edge
+        self.connection = connection
         
-    def update(self):
-        """ Updates traffic data for the lane using SUMO APIs. """
-        if (self.edge):
-            self.lastStepHaltedVehicles = traci.edge.getLastStepHaltingNumber(self.laneId)
-            self.lastStepWaitingTime = traci.edge.getWaitingTime(self.laneId)
+    @property
+    def lastStepHaltedVehicles(self):
+        return self.laneData[LANE_DATA_ROWS[HALTED], self.index]
+    
+    @lastStepHaltedVehicles.setter
+    def lastStepHaltedVehicles(self, value):
+        self.laneData[LANE_DATA_ROWS[HALTED], self.index] = value
+        
+    @property
+    def lastStepWaitingTime(self):
+        return self.laneData[LANE_DATA_ROWS[WAITING_TIME], self.index]
+    
+    @lastStepWaitingTime.setter
+    def lastStepWaitingTime(self, value):
+        self.laneData[LANE_DATA_ROWS[WAITING_TIME], self.index] = value
+        
+    @property
+    def domain(self):
+        """ Returns the TraCI domain (edge or lane) used to retrieve the lane data. """
+        return self.connection.edge if self.edge else self.connection.lane
+    
+    def subscribe(self):
+        """ Subscribes to the lane variables, so they are sent along with every simulation step. """
+        self.domain.subscribe(self.laneId, LANE_VARIABLES)
+        
+    def update(self, subscriptionResults=None):
+        """
+        Updates traffic data for the lane using SUMO APIs.
+        
+        Args:
+            subscriptionResults (dict, optional): Subscription results of the lane. If given, the values are
+                read from them instead of querying SUMO.
+        """
+        if subscriptionResults is not None:
+            self.lastStepHaltedVehicles = subscriptionResults[tc.LAST_STEP_VEHICLE_HALTING_NUMBER]
+            self.lastStepWaitingTime = subscriptionResults[tc.VAR_WAITING_TIME]
+        elif (self.edge):
+            self.lastStepHaltedVehicles = self.connection.edge.getLastStepHaltingNumber(self.laneId)
+            self.lastStepWaitingTime = self.connection.edge.getWaitingTime(self.laneId)
         else:
-            self.lastStepHaltedVehicles = traci.lane.getLastStepHaltingNumber(self.laneId)
-            self.lastStepWaitingTime = traci.lane.getWaitingTime(self.laneId)
+            self.lastStepHaltedVehicles = self.connection.lane.getLastStepHaltingNumber(self.laneId)
+            self.lastStepWaitingTime = self.connection.lane.getWaitingTime(self.laneId)
         
 
+class VehicleTracker:
+    """
+    Keeps track of the accumulated waiting time of the vehicles in the simulation without querying
+    SUMO vehicle by vehicle on every step.
+
+    Each vehicle is subscribed once, when it departs, to its accumulated waiting time and its lane
+    (or edge). Departures and arrivals are read from a simulation subscription, and the values of
+    every vehicle arrive along with each simulation step. The values are stored in NumPy arrays,
+    one slot per vehicle, so the accumulated waiting time over the controlled lanes is a single sum.
+
+    Attributes:
+        slots (dict): Slot index of each tracked vehicle.
+        accumulatedWaitingTime (np.ndarray): Accumulated waiting time of the vehicle in each slot.
+        laneIndex (np.ndarray): Index of the controlled lane where the vehicle in each slot is,
+            or -1 if it is not on a controlled lane (or the slot is free).
+    """
+    SIMULATION_VARIABLES = [tc.VAR_DEPARTED_VEHICLES_IDS, tc.VAR_ARRIVED_VEHICLES_IDS]
+    
+    def __init__(self, laneIds, edge=False, connection=traci, capacity=256):
+        self.laneIds = {laneId: index for index, laneId in enumerate(laneIds)}
+        self.edge = edge
+        self.connection = connection
+        self.vehicleVariables = [tc.VAR_ACCUMULATED_WAITING_TIME, tc.VAR_ROAD_ID if edge else tc.VAR_LANE_ID]
+        self.slots: Dict[str, int] = {}
+        self.freeSlots = list(range(capacity - 1, -1, -1))
+        self.accumulatedWaitingTime = np.zeros(capacity)
+        self.laneIndex = np.full(capacity, -1, dtype=np.int64)
+        
+    def _grow(self):
+        """ Doubles the number of slots. """
+        capacity = len(self.laneIndex)
+        self.freeSlots.extend(range(2 * capacity - 1, capacity - 1, -1))
+        self.accumulatedWaitingTime = np.concatenate((self.accumulatedWaitingTime, np.zeros(capacity)))
+        self.laneIndex = np.concatenate((self.laneIndex, np.full(capacity, -1, dtype=np.int64)))
+    
+    def _add(self, vehicleId):
+        """ Assigns a slot to the vehicle and subscribes to its variables. """
+        if not self.freeSlots:
+            self._grow()
+        self.slots[vehicleId] = self.freeSlots.pop()
+        self.connection.vehicle.subscribe(vehicleId, self.vehicleVariables)
+    
+    def _remove(self, vehicleId):
+        """ Frees the slot of the vehicle. """
+        slot = self.slots.pop(vehicleId, None)
+        if slot is not None:
+            self.accumulatedWaitingTime[slot] = 0
+            self.laneIndex[slot] = -1
+            self.freeSlots.append(slot)
+        
+    def reset(self):
+        """
+        Starts tracking the vehicles currently in the simulation. Must be called after the simulation
+        subscription is registered (SUMO drops every subscription when a state is loaded).
+        """
+        for vehicleId in list(self.slots):
+            self._remove(vehicleId)
+        for vehicleId in self.connection.vehicle.getIDList():
+            self._add(vehicleId)
+        self._read()
+    
+    def _read(self):
+        """
+        Copies the subscription results of the tracked vehicles into the arrays. Vehicles without
+        results have left the simulation and their slots are freed.
+        """
+        results = self.connection.vehicle.getAllSubscriptionResults()
+        for vehicleId, slot in list(self.slots.items()):
+            vehicleResults = results.get(vehicleId)
+            if vehicleResults is None:
+                self._remove(vehicleId)
+            else:
+                self.accumulatedWaitingTime[slot] = vehicleResults[tc.VAR_ACCUMULATED_WAITING_TIME]
+                self.laneIndex[slot] = self.laneIds.get(vehicleResults[self.vehicleVariables[1]], -1)
+    
+    def update(self, vehicleCount):
+        """
+        Updates the tracked vehicles with the departures and arrivals of the last simulation step call.
+
+        Departures are reported per simulationStep call, so vehicles that departed during an earlier
+        call are missed. In that case the number of tracked vehicles differs from the vehicle count
+        and the tracker is resynchronized with the vehicle ID list.
+
+        Args:
+            vehicleCount (int): Number of vehicles currently in the simulation.
+        """
+        simulationResults = self.connection.simulation.getSubscriptionResults()
+        arrived = simulationResults[tc.VAR_ARRIVED_VEHICLES_IDS]
+        for vehicleId in arrived:
+            self._remove(vehicleId)
+        for vehicleId in simulationResults[tc.VAR_DEPARTED_VEHICLES_IDS]:
+            if vehicleId not in self.slots and vehicleId not in arrived:
+                self._add(vehicleId)
+        self._read()
+        if len(self.slots) != vehicleCount:
+            for vehicleId in self.connection.vehicle.getIDList():
+                if vehicleId not in self.slots:
+                    self._add(vehicleId)
+            self._read()
+    
+    def getAccumulatedWaitingTime(self):
+        """
+        Returns:
+            float: Accumulated waiting time of the vehicles on the controlled lanes.
+        """
+        return self.accumulatedWaitingTime[self.laneIndex >= 0].sum()
+    
+    def getAccumulatedWaitingTimeByLane(self):
+        """
+        Returns:
+            np.ndarray: Accumulated waiting time of the vehicles on each controlled lane.
+        """
+        tracked = self.laneIndex >= 0
+        return np.bincount(self.laneIndex[tracked], weights=self.accumulatedWaitingTime[tracked],
+                           minlength=len(self.laneIds))
+    
 class TrafficLight:
     """
     Represents a traffic light controller within the SUMO simulation.
@@ -85,6 +294,9 @@ class TrafficLight:
         minGreenTime (int): Minimum time required for a green phase before a change.
         yellow (bool): Flag to indicate if the current phase is in the yellow transition.
         currentPhaseTime (int): Counter tracking the duration of the current phase.
+        connection (traci.Connection): TraCI connection of the simulation the traffic light belongs to.
+        PHASES (list): Phases of the traffic light, the last one being the initial (all red) phase. The
+            predefined phases of the 2x2 intersection by default (see phasesFromProgram for other junctions).
     """
     class Phase:
         """
@@ -113,8 +325,11 @@ class TrafficLight:
         Phase("rrrrrrrrrrrrrrrr", "rrrrrrrrrrrrrrrr"),      # init: Initial state (all red)
     ]
     
-    def __init__(self, id, initialPhase, yellowTime, minGreenTime):
+    def __init__(self, id, initialPhase, yellowTime, minGreenTime, connection=traci, phases=None):
         self.id = id
+        self.connection = connection
+        if phases is not None:
+            self.PHASES = phases
         # The index of the initial phase is set to the last element in the PHASES list
         self.initIndex = len(self.PHASES)-1
         self.currentPhase = self.initIndex
@@ -124,6 +339,34 @@ class TrafficLight:
         self.yellow = False
         self.currentPhaseTime = 0
             
+    @staticmethod
+    def phasesFromProgram(tlsId, connection=traci):
+        """
+        Builds the phases of a traffic light from the green phases of its programs in the network, for
+        junctions other than the 2x2 intersection. The yellow transition of each phase turns its green
+        signals into yellow ones.
+
+        Args:
+            tlsId (str): The identifier of the traffic light.
+            connection (traci.Connection): TraCI connection of the simulation.
+
+        Returns:
+            list: The phases, followed by the initial (all red) phase.
+        """
+        phases = []
+        states = set()
+        for logic in connection.trafficlight.getAllProgramLogics(tlsId):
+            for phase in logic.phases:
+                state = phase.state
+                if ("G" in state or "g" in state) and "y" not in state and state not in states:
+                    states.add(state)
+                    yellowTransition = state.replace("G", "y").replace("g", "y")
+                    phases.append(TrafficLight.Phase(state, yellowTransition))
+        if not phases:
+            raise ValueError("Traffic light " + tlsId + " has no green phases")
+        phases.append(TrafficLight.Phase("r" * len(phases[0].state), "r" * len(phases[0].state)))
+        return phases
+    
     @property
     def actionSpace(self):
         """ Returns the number of available phases as discrete actions. """
@@ -139,13 +382,62 @@ class TrafficLight:
         # Transition to the next phase by setting the appropriate state string.
 
                 nextPhaseState = self.PHASES[self.nextPhase].state
-                traci.trafficlight.setRedYellowGreenState(self.id, nextPhaseState)
+                self.connection.trafficlight.setRedYellowGreenState(self.id, nextPhaseState)
                 self.currentPhase = self.nextPhase
                 self.currentPhaseTime = 0
                 self.yellow = False
         # Progress the simulation and update phase time.
-        traci.simulationStep() 
+        self.connection.simulationStep() 
         self.currentPhaseTime += 1
+        
+    def _stepsUntilSwitch(self):
+        """
+        Number of simulation steps until the scheduled phase change is applied, following the
+        same rules as update(). Returns None if no phase change is scheduled.
+        """
+        if (self.currentPhase == self.nextPhase):
+            return None
+        if self.yellow:
+            return max(0, self.yellowTime - self.currentPhaseTime)
+        return 0
+    
+    def advance(self, deltaTime, currentTime):
+        """
+        Advance the simulation deltaTime steps, applying the scheduled phase change at the
+        same step update() would. Equivalent to calling update() deltaTime times, but SUMO is
+        advanced with at most two simulationStep calls (up to the switch point and up to the end).
+
+        Args:
+            deltaTime (int): Number of simulation steps (seconds) to advance.
+            currentTime (float): Current simulation time.
+
+        Returns:
+            float: The simulation time after advancing.
+        """
+        targetTime = currentTime + deltaTime
+        switchStep = self._stepsUntilSwitch()
+        if switchStep is not None and switchStep < deltaTime:
+            if switchStep > 0:
+                self.connection.simulationStep(currentTime + switchStep)
+            self.switchPhase(deltaTime - switchStep)
+        else:
+            self.currentPhaseTime += deltaTime
+        self.connection.simulationStep(targetTime)
+        return targetTime
+    
+    def switchPhase(self, currentPhaseTime=0):
+        """
+        Applies the scheduled phase change, setting the state of the next phase in SUMO.
+
+        Args:
+            currentPhaseTime (int): Time the new phase will have lasted when the simulation is advanced
+                to the end of the current step.
+        """
+        nextPhaseState = self.PHASES[self.nextPhase].state
+        self.connection.trafficlight.setRedYellowGreenState(self.id, nextPhaseState)
+        self.currentPhase = self.nextPhase
+        self.currentPhaseTime = currentPhaseTime
+        self.yellow = False
     
     def canChange(self):
         """
@@ -179,7 +471,7 @@ class TrafficLight:
             if self.canChange() or (self.currentPhase == self.initIndex):
                 if (self.currentPhase != self.initIndex):  
                     yellowPhaseState = self.PHASES[self.currentPhase].yellowTransition
-                    traci.trafficlight.setRedYellowGreenState(self.id, yellowPhaseState)
+                    self.connection.trafficlight.setRedYellowGreenState(self.id, yellowPhaseState)
                     self.yellow = True
                     
                 previousPhaseTime = self.currentPhaseTime
@@ -199,7 +491,7 @@ class State:
 
     Attributes:
         tlPhase (int): Current traffic light phase index.
-        discreteLaneInfo (list): A list of discretized values representing lane metrics.
+        discreteLaneInfo (np.ndarray): Discretized values representing lane metrics.
         discreteClass (Discrete): An instance used to convert raw lane metrics into discrete values.
     """
     def __init__(self, tlPhase, lanes: Dict[str, Lane], discreteClass, laneInfo="halted"):
@@ -229,22 +521,305 @@ class State:
             laneInfo (str): Specifies which metric to use ('waitingTime' or 'halted').
 
         Returns:
-            list: A list of discretized values for each lane.
+            np.ndarray: The discretized values for each lane.
         """
         # discreteLaneQueue: Dict[str, int] = {}
-        discreteLaneInfo = []
         if laneInfo == "waitingTime":
-            for lane in lanes.values():
-                discreteLaneInfo.append(self.discreteClass.log_interval(lane.lastStepWaitingTime))
-            return discreteLaneInfo
+            return self.discreteClass.log_interval_array([lane.lastStepWaitingTime for lane in lanes.values()])
         else:
-            for lane in lanes.values():
-                discreteLaneInfo.append(self.discreteClass.log_interval(lane.lastStepHaltedVehicles))
             if laneInfo != "halted":
                 print("Warning: " + "Invalid laneInfo value = " + laneInfo + ". \"halted\" value was assigned instead.")
-            return discreteLaneInfo          
+            return self.discreteClass.log_interval_array([lane.lastStepHaltedVehicles for lane in lanes.values()])
         
-class SumoEnvironment(gym.Env):
+class SumoSimulation:
+    """
+    Base of the environments that run a SUMO simulation: starts SUMO (through traci, libsumo or a
+    connection factory), warms up the simulation saving the warm-up state (or loading it from the state
+    cache) and closes it. Subclasses create the traffic lights, the lanes (lanes, a dict of Lane sharing
+    the laneData buffer) and the vehicleTracker (None for the polling backend and the mesoscopic
+    simulation), and bind them to the
+    connection in _bindConnection.
+    """
+    def _setSimulationOptions(self, sumocfgFile, gui, sumoLog, waitingTimeMemory, observationBackend, label,
+                              useLibsumo, sumoSeed, stateCache, connectionFactory, profile=False, fidelity=MICRO):
+        """
+        Validates and stores the options of the simulation (see SumoEnvironment).
+        """
+        self.profile = profile
+        # Timing of the phases of step and counting of the TraCI calls, only when profiling
+        self.phaseTimer = PhaseTimer() if profile else NullTimer()
+        self.callCounter = CallCounter() if profile else NullTimer()
+        self.sumocfgFile = sumocfgFile
+        # Label of the TraCI connection, unique across processes unless given
+        self.label = label if label is not None else "sumo_" + str(os.getpid()) + "_" + str(next(_labelCounter))
+        self.stateFile = os.path.join(state_dir, 'initialState_' + self.label + '.xml')
+        # Snapshot bank: (time, state file) of the states episodes can start from (see _buildSnapshotBank)
+        self.snapshots = []
+        self.connection = None
+        if useLibsumo and (libsumo is None or gui or libsumo.simulation.isLoaded()):
+            # libsumo has no GUI and runs a single simulation per process
+            useLibsumo = False
+            print("Warning: libsumo is not available (not installed, gui=True or already running in this process). traci was used instead.")
+        self.useLibsumo = useLibsumo
+        self.gui = gui
+        if gui:
+            self.sumoBinary = checkBinary("sumo-gui")
+        else:
+            self.sumoBinary = checkBinary("sumo")
+        self.sumoLog = sumoLog
+        self.waitingTimeMemory = waitingTimeMemory
+        self.sumoSeed = sumoSeed
+        self.stateCache = StateCache() if stateCache is True else stateCache
+        self.connectionFactory = connectionFactory
+        
+        if observationBackend in [POLLING, SUBSCRIPTION]:
+            self.observationBackend = observationBackend
+        else:
+            self.observationBackend = POLLING
+            print("Warning: Invalid observationBackend value. \"" + POLLING + "\" value was assigned instead.")
+        if fidelity in [MICRO, MESO]:
+            self.fidelity = fidelity
+        else:
+            self.fidelity = MICRO
+            print("Warning: Invalid fidelity value. \"" + MICRO + "\" value was assigned instead.")
+        if self.fidelity == MESO and self.stateCache is not None:
+            # Cached states would be loaded with loadState (see SumoEnvironment.reset)
+            self.stateCache = None
+            print("Warning: The state cache is not supported by the mesoscopic simulation and was disabled.")
+    
+    @property
+    def simStep(self):
+        """
+        Get the current simulation time step.
+        """
+        if self.observationBackend == SUBSCRIPTION:
+            return self.connection.simulation.getSubscriptionResults()[tc.VAR_TIME]
+        return self.connection.simulation.getTime()
+    
+    @property
+    def sumoOptions(self):
+        """
+        SUMO options that determine the simulation (output and GUI options excluded).
+        """
+        sumoOptions = ["-c", self.sumocfgFile, "--waiting-time-memory", str(self.waitingTimeMemory)
+                       #"--tripinfo-output", "tripinfo.xml"
+                       ]
+        if self.sumoSeed is not None:
+            sumoOptions += ["--seed", str(self.sumoSeed)]
+        if self.fidelity == MESO:
+            sumoOptions += MESO_OPTIONS
+        return sumoOptions
+    
+    def _sumoCommand(self):
+        """
+        Command line SUMO is started with: the binary, the simulation options and the log and GUI options.
+        """
+        sumoCMD = [self.sumoBinary] + self.sumoOptions
+        
+        if not(self.sumoLog):
+            sumoCMD.append("--no-step-log")
+            sumoCMD.append("--no-warnings")
+        if self.gui:
+            sumoCMD.append("-S")
+            sumoCMD.append("--quit-on-end")
+        return sumoCMD
+    
+    def _initializeSimulation(self):
+        """
+        Starts the SUMO simulation with the specified configuration and parameters.
+        """
+        sumoCMD = self._sumoCommand()
+        
+        if self.connectionFactory is not None:
+            self.connection = self.connectionFactory(sumoCMD, self.label)
+        elif self.useLibsumo:
+            libsumo.start(sumoCMD)
+            # The libsumo module provides the same API as a traci connection
+            self.connection = libsumo
+        else:
+            self._startTraci(sumoCMD)
+        if self.profile:
+            self.connection = CountingConnection(self.connection, self.callCounter)
+    
+    def _startTraci(self, sumoCMD):
+        """
+        Starts SUMO and connects to it through traci, with the label of the environment.
+        """
+        try:
+            traci.start(sumoCMD, label=self.label)
+            
+        except traci.TraCIException as traci_e:
+            print(traci_e, end="")
+            print(" Closing connection...")
+            traci.getConnection(self.label).close()
+            from time import sleep
+            sleep(1)
+            print(traci_e, end="")
+            print(" Starting new connection...")
+            traci.start(sumoCMD, label=self.label)
+            print("OK")
+        self.connection = traci.getConnection(self.label)
+    
+    def _bindConnection(self):
+        """
+        Binds the objects of the environment to the current connection (after restarting SUMO).
+        """
+        pass
+    
+    def getProfile(self, clear=False):
+        """
+        Time spent in each phase of step and number and latency of the TraCI calls, since the environment
+        was created or the profile was last cleared. Empty unless the environment profiles (profile=True).
+
+        Args:
+            clear (bool): Clear the profile after reading it.
+
+        Returns:
+            dict: Summaries of the phases ("phases") and of the TraCI calls by API ("traci"), as returned
+                by PhaseTimer.summary.
+        """
+        profile = {"phases": self.phaseTimer.summary(), "traci": self.callCounter.summary()}
+        if clear:
+            self.phaseTimer.clear()
+            self.callCounter.clear()
+        return profile
+    
+    def _warmUpState(self, warmingTime, trafficLights):
+        """
+        Runs the simulation for the warming time and saves the state the environment is reset to.
+        If the warm-up state is in the state cache, it is loaded instead.
+        
+        Args:
+            warmingTime (int): Number of simulation steps to warm up.
+            trafficLights (list): Traffic lights of the environment, set to their first phase at the end
+                of the warm-up.
+        """
+        cachedStateFile = None
+        if self.stateCache is not None:
+            cacheKey = self.stateCache.getKey(self.sumocfgFile, warmingTime, self.sumoOptions,
+                                              *[trafficLight.PHASES[0].state for trafficLight in trafficLights],
+                                              self.connection.getVersion())
+            cachedStateFile = self.stateCache.get(cacheKey)
+        if cachedStateFile is not None:
+            # The environment loads its own copy, the cached one may be evicted
+            shutil.copyfile(cachedStateFile, self.stateFile)
+            self.connection.simulation.loadState(self.stateFile)
+        else:
+            self.connection.simulationStep(warmingTime-1) # Warming Time
+            for trafficLight in trafficLights:
+                self.connection.trafficlight.setRedYellowGreenState(trafficLight.id, trafficLight.PHASES[0].state)
+            self.connection.simulationStep()
+            self.connection.simulation.saveState(self.stateFile)
+            if self.stateCache is not None:
+                self.stateCache.put(cacheKey, self.stateFile)
+            if self.fidelity != MESO:
+                # Saved states do not include the random number generators (SUMO does not reproduce the
+                # loads of states saved with --save-state.rng either). The simulation is reloaded, which seeds
+                # them again as a new SUMO process would, and the state loaded, as on a cache hit, so the
+                # results are the same without state cache, on a cache miss and on a cache hit. States are
+                # not loaded in the mesoscopic simulation (see SumoEnvironment.reset).
+                self.connection.load(self._sumoCommand()[1:])
+                self.connection.simulation.loadState(self.stateFile)
+    
+    def _buildSnapshotBank(self, interval, endTime, trafficLights, programID):
+        """
+        Runs the simulation from the warm-up state until endTime with the traffic lights running a
+        fixed-time program, saving a state every interval seconds. Then the warm-up state is loaded back.
+
+        Args:
+            interval (int): Time between snapshots.
+            endTime (int): Time of the last snapshot (at most).
+            trafficLights (list): Traffic lights of the environment.
+            programID (str): Program run by the traffic lights (the baseline controller).
+
+        Returns:
+            list: (time, state file) of each snapshot, starting with the warm-up state.
+        """
+        currentTime = self.simStep
+        snapshots = [(currentTime, self.stateFile)]
+        for trafficLight in trafficLights:
+            self.connection.trafficlight.setProgram(trafficLight.id, programID)
+        currentTime += interval
+        while currentTime <= endTime:
+            self.connection.simulationStep(currentTime)
+            if self.connection.simulation.getMinExpectedNumber() == 0:
+                break
+            snapshotFile = os.path.splitext(self.stateFile)[0] + '_' + str(int(currentTime)) + '.xml'
+            self.connection.simulation.saveState(snapshotFile)
+            snapshots.append((currentTime, snapshotFile))
+            currentTime += interval
+        self.connection.simulation.loadState(self.stateFile)
+        self._subscribe()
+        return snapshots
+
+    def _subscribe(self):
+        """
+        Registers the TraCI subscriptions used by the subscription backend. SUMO drops the subscriptions
+        when a state is loaded, so this must be called again after each loadState.
+        """
+        if self.observationBackend != SUBSCRIPTION:
+            return
+        for lane in self.lanes.values():
+            lane.subscribe()
+        self.connection.simulation.subscribe([tc.VAR_TIME, tc.VAR_MIN_EXPECTED_VEHICLES] + VehicleTracker.SIMULATION_VARIABLES)
+        # An empty object ID subscribes to the variables of the vehicle domain itself
+        self.connection.vehicle.subscribe("", [tc.ID_COUNT])
+        if self.vehicleTracker is not None:
+            self.vehicleTracker.reset()
+    
+    def _updateLanes(self):
+        """
+        Updates the traffic data of every lane, either querying SUMO lane by lane or reading
+        the subscription results received with the last simulation step (along with the
+        vehicles of the VehicleTracker).
+        """
+        if self.observationBackend == SUBSCRIPTION:
+            laneDomain = self.connection.edge if self.edges else self.connection.lane
+            subscriptionResults = laneDomain.getAllSubscriptionResults()
+            for lane in self.lanes.values():
+                lane.update(subscriptionResults[lane.laneId])
+            if self.vehicleTracker is not None:
+                self.vehicleTracker.update(self._getVehicleCount())
+        else:
+            for lane in self.lanes.values():
+                lane.update()
+                
+    def _getVehicleCount(self):
+        """
+        Get the number of vehicles currently in the simulation.
+        """
+        if self.observationBackend == SUBSCRIPTION:
+            return self.connection.vehicle.getSubscriptionResults("")[tc.ID_COUNT]
+        return self.connection.vehicle.getIDCount()
+    
+    def _getMinExpectedNumber(self):
+        """
+        Get the number of vehicles in the simulation plus the ones waiting to start.
+        """
+        if self.observationBackend == SUBSCRIPTION:
+            return self.connection.simulation.getSubscriptionResults()[tc.VAR_MIN_EXPECTED_VEHICLES]
+        return self.connection.simulation.getMinExpectedNumber()
+        
+    def close(self):
+        """
+        Close the SUMO simulation connection and remove the saved state.
+        """
+        if self.connection is None:
+            return
+        self.connection.close()
+        self.connection = None
+        for stateFile in [self.stateFile] + [snapshotFile for _, snapshotFile in self.snapshots]:
+            if os.path.exists(stateFile):
+                os.remove(stateFile)
+        
+
+    def __del__(self):
+        """
+        Destructor to ensure the simulation is closed upon deletion of the environment.
+        """
+        self.close()
+
+class SumoEnvironment(SumoSimulation, gym.Env):
     """
     Farama Gym-compatible environment for traffic signal control using SUMO.
 
@@ -254,9 +829,85 @@ class SumoEnvironment(gym.Env):
     Attributes:
         simTime (int): Total simulation time.
         deltaTime (int): Time step interval for the simulation.
+        currentTime (float): Simulation time, tracked locally to avoid querying SUMO on every step.
         fixedTL (bool): Flag to determine if the traffic light operates under a fixed program.
         lanes (dict): Dictionary of Lane objects controlled by the traffic light.
         rewardFn (function): Function used to compute the reward for an action.
+        sumoSeed (int): Seed of the SUMO random number generator (SUMO's default seed if None).
+        stateCache (StateCache): Cache of warm-up states. If the state for the same scenario files, warm-up
+            time and SUMO options is cached, it is loaded instead of warming up the simulation. True uses
+            a StateCache with the default directory. The episodes are the same with or without cache (the
+            warm-up state is always reloaded, see _warmUpState).
+        useLibsumo (bool): Run SUMO in-process through libsumo instead of connecting to a sumo process
+            through a socket. Falls back to traci if libsumo is not installed, gui is True or another
+            libsumo simulation is running in the process.
+        label (str): Label of the TraCI connection owned by the environment. It also names the file where
+            the warm-up state is saved, so several environments can run in the same or parallel processes.
+        observationBackend (str): How lane data is retrieved from SUMO. "polling" queries every lane
+            on each step, "subscription" registers TraCI subscriptions once and reads all lane
+            data from the results sent along with each simulation step. The subscription backend
+            also keeps the accumulated waiting time of the vehicles with a VehicleTracker.
+        connectionFactory (callable): Starts the simulation instead of traci/libsumo. It is called with the
+            SUMO command and the label, and returns an object call-compatible with a traci connection
+            (e.g. a FakeConnection, to measure the Python-side overhead without SUMO, or the lease of a
+            SumoPool, to reuse running SUMO processes).
+        profile (bool): Profile the environment: time each phase of step (phaseTimer) and count the TraCI
+            calls and their latency by API (callCounter, through a CountingConnection). See getProfile.
+        phaseTimer (PhaseTimer): Accumulates the time spent in each phase of step (advance, lanes,
+            encode, reward, truncation, info). A NullTimer (no timing) unless profiling.
+        callCounter (CallCounter): Number and latency of the TraCI calls by API. A NullTimer unless
+            profiling.
+        snapshotInterval (int): If given, a bank of states is saved every snapshotInterval seconds of the
+            simulation (after warming up, with the fixed-time program running), and each reset starts the
+            episode from a snapshot sampled uniformly from the bank (see reset). None starts every episode
+            from the warm-up state.
+        episodeLength (int): Maximum simulated time of an episode, from the state it starts from. None runs
+            episodes until simTime. totalTimeSteps counts the steps of an episode of this length.
+        skipNonActionable (bool): Fast-forward through the decision points where the traffic light cannot
+            change phase (yellow or under minGreenTime), where any action would be ignored. A step then
+            advances as many deltaTime intervals as needed to reach the next actionable decision point (or the
+            end of the episode) in one simulation advance, and its reward is the sum of the rewards of those
+            intervals (the reward functions are differences, so the sum telescopes into the difference over
+            the whole advance). The number of intervals is reported as "decision_steps" in info. Only for
+            agent-controlled traffic lights (fixedTL=False).
+        fidelity (str): "micro" runs SUMO's microscopic simulation. "meso" runs the mesoscopic simulation
+            (see MESO_OPTIONS), several times faster, for cheap pretraining or screening of hyperparameters
+            before training on the microscopic simulation. SUMO only reports the halting number and waiting
+            time per edge in the mesoscopic simulation (the lane values are 0), so edges is set to True. The
+            accumulated waiting time of the vehicles is not available either: the total waiting time of the
+            edges (the time each vehicle has been waiting in its current queue) is used instead, in the
+            "diff_cumulativeWaitingTime" reward and in "mean_acc_waiting_time". SUMO cannot load states of
+            the mesoscopic simulation with traffic light control, so reset reloads the simulation and warms it
+            up again, and the state cache and the snapshot bank are not supported.
+        infoFields (list): Fields of the info (from INFO_FIELDS). None includes all of them. Fields that are
+            not read (e.g. by a callback) are better left out, as computing them takes TraCI calls on every
+            step ("mean_acc_waiting_time" queries every vehicle unless the subscription backend is used). The
+            agents add the fields their metrics need (see requireInfoFields).
+        infoFrequency (int or str): The info fields are computed every infoFrequency steps, or only at the
+            end of the episodes with "episode_end". They are always computed on reset and when the episode is
+            truncated. The info of the other steps leaves them out.
+        lazyInfo (bool): Return the info as a LazyInfo, whose fields are only computed if they are read
+            before the next step or reset (from the info or its copies, e.g. the ones returned by DummyVecEnv).
+            SubprocVecEnv pickles the infos, which computes every field: use infoFields and infoFrequency there.
+        snapshots (list): (time, state file) of the snapshot bank, the warm-up state being the first one.
+        episodeEndTime (float): Simulation time the current episode is truncated at.
+        episodeStateFile (str): State file the current episode started from (the warm-up state or a snapshot).
+        outputDir (str): If given, SUMO writes the tripinfo and summary outputs of each episode (from a
+            reset, or the first step if the environment is stepped without a reset, to the next reset or
+            close), partitioned by run (the label) and episode (see episodeOutputFiles). SUMO only opens
+            outputs when the simulation is loaded, so each episode reloads the simulation and loads the
+            state it starts from (as on a state cache hit). The reload seeds the random number generators
+            again (states do not include them), so every episode starts with the same random numbers, while
+            without outputs they keep running from the previous episode: enabling the outputs changes the
+            trajectories (they are another sample of the scenario). In the mesoscopic simulation the outputs
+            include the warm-up of the episode (trips can be filtered by their arrival time). Outputs are
+            off by default.
+        outputFormat (str): "xml" keeps SUMO's outputs. "parquet" or "arrow" convert the outputs of each
+            episode when it ends, streaming them (see convertOutput), and remove the XML files. The converted
+            outputs of many runs can be queried with queryTrips. Needs pyarrow.
+        episode (int): Number of the current episode (its outputs), -1 until the outputs start (or without
+            outputs).
+        info (dict): Info of the last step or reset.
     """
     MAX_VEH_LANE = 30      # adjust according to lane length? Param?
     MAX_WAITING_TIME = 500 # Param?
@@ -276,79 +927,145 @@ class SumoEnvironment(gym.Env):
         simTime=43800,
         warmingTime=600,
         sumoLog=False,
-        waitingTimeMemory=1000
+        waitingTimeMemory=1000,
+        observationBackend=POLLING,
+        label=None,
+        useLibsumo=False,
+        sumoSeed=None,
+        stateCache=None,
+        connectionFactory=None,
+        snapshotInterval=None,
+        episodeLength=None,
+        skipNonActionable=False,
+        profile=False,
+        fidelity=MICRO,
+        infoFields=None,
+        infoFrequency=1,
+        lazyInfo=False,
+        outputDir=None,
+        outputFormat=XML
     ) -> None:
-        self.sumocfgFile = sumocfgFile
-        self.stateFile = os.path.join(state_dir, 'initialState.xml')
-        self.gui = gui
-        if gui:
-            self.sumoBinary = checkBinary("sumo-gui")
-        else:
-            self.sumoBinary = checkBinary("sumo")
+        # Constructor arguments, for creating copies of the environment (e.g. in vectorized environments)
+        self.envArgs = {key: value for key, value in locals().items() if key not in ("self", "__class__")}
+        self._setSimulationOptions(sumocfgFile, gui, sumoLog, waitingTimeMemory, observationBackend, label,
+                                   useLibsumo, sumoSeed, stateCache, connectionFactory, profile, fidelity)
         self.simTime = simTime
         assert(yellowTime < deltaTime)
         self.deltaTime = deltaTime
         self.fixedTL=fixedTL
+        if self.fidelity == MESO and not edges:
+            # The mesoscopic simulation has no lane data
+            edges = True
+            print("Warning: The mesoscopic simulation only provides edge data. edges=True was assigned instead.")
+        self.edges = edges
         self.haltedVehicles = 0
         self.waitingTime = 0
         self.cumulativeWaitingTime = 0
         
-        self.laneInfo = laneInfo
+        if laneInfo in LANE_DATA_ROWS:
+            self.laneInfo = laneInfo
+        else:
+            self.laneInfo = HALTED
+            print("Warning: " + "Invalid laneInfo value = " + laneInfo + ". \"halted\" value was assigned instead.")
         if rewardFn in self.rewardFns.keys():
             self.rewardFn = self.rewardFns[rewardFn]
         else:
             self.rewardFn = self.rewardFns["diff_halted"]
             print("Warning: Invalid rewardFn value. \"diff_halted\" value was assigned instead.")
         
-        self.sumoLog = sumoLog
-        self.waitingTimeMemory = waitingTimeMemory
+        self.warmingTime = warmingTime
+        if self.fidelity == MESO and snapshotInterval is not None:
+            # The snapshots would be loaded with loadState (see reset)
+            snapshotInterval = None
+            print("Warning: The snapshot bank is not supported by the mesoscopic simulation. snapshotInterval=None was assigned instead.")
+        self.snapshotInterval = snapshotInterval
+        self.episodeLength = episodeLength
+        self.skipNonActionable = skipNonActionable
+        self.decisionSteps = 1
+        
+        if infoFields is None:
+            self.infoFields = list(INFO_FIELDS)
+        else:
+            self.infoFields = [field for field in infoFields if field in INFO_FIELDS]
+            if len(self.infoFields) < len(infoFields):
+                print("Warning: Invalid infoFields values were ignored. Valid values: " + str(INFO_FIELDS) + ".")
+        if infoFrequency == EPISODE_END or (isinstance(infoFrequency, int) and infoFrequency > 0):
+            self.infoFrequency = infoFrequency
+        else:
+            self.infoFrequency = 1
+            print("Warning: Invalid infoFrequency value = " + str(infoFrequency) + ". 1 was assigned instead.")
+        self.lazyInfo = lazyInfo
+        self.infoStep = 0
+        self.info = {}
+        self.outputDir = outputDir
+        if outputFormat not in FILE_EXTENSIONS:
+            outputFormat = XML
+            print("Warning: Invalid outputFormat value. \"" + XML + "\" value was assigned instead.")
+        elif outputFormat != XML and pyarrow is None:
+            outputFormat = XML
+            print("Warning: pyarrow is not installed. \"" + XML + "\" outputFormat was assigned instead.")
+        self.outputFormat = outputFormat
+        self.episode = -1
         
         # Start SUMO, load network, set waiting time memory
         self._initializeSimulation()
         
-        tls_ids = traci.trafficlight.getIDList()
+        tls_ids = self.connection.trafficlight.getIDList()
         
-        self.trafficLight = TrafficLight(tls_ids[0], 0, yellowTime, minGreenTime)  
-        lanesIds = traci.trafficlight.getControlledLanes(tls_ids[0])
-        self.lanes: Dict[str, Lane] = {}
+        self.trafficLight = TrafficLight(tls_ids[0], 0, yellowTime, minGreenTime, connection=self.connection)  
+        lanesIds = self.connection.trafficlight.getControlledLanes(tls_ids[0])
+        incomingLanesIds = []
+        lanesLengths = {}
         for laneId in lanesIds:
             if "in" in laneId:
+                laneLength = self.connection.lane.getLength(laneId)
                 if edges:
-                    laneId = traci.lane.getEdgeID(laneId) 
-                if laneId not in self.lanes:
-                    self.lanes[laneId] = Lane(laneId, traci.lane.getLength(laneId), edge = edges)
+                    laneId = self.connection.lane.getEdgeID(laneId) 
+                if laneId not in incomingLanesIds:
+                    incomingLanesIds.append(laneId)
+                    lanesLengths[laneId] = laneLength
+        # Lane data buffer shared by the lanes (the lane order is fixed from here on)
+        self.laneData = np.zeros((len(LANE_DATA_ROWS), len(incomingLanesIds)))
+        self.lanes: Dict[str, Lane] = {}
+        for index, laneId in enumerate(incomingLanesIds):
+            self.lanes[laneId] = Lane(laneId, lanesLengths[laneId], edge = edges, connection=self.connection,
+                                      laneData=self.laneData, index=index)
+        # Observation buffer: traffic light phase followed by the discretized lane info
+        self.observation = np.zeros(len(self.lanes)+1, dtype=np.int64)
+        
+        if self.observationBackend == SUBSCRIPTION and self.fidelity == MICRO:
+            self.vehicleTracker = VehicleTracker(self.lanes.keys(), edge=edges, connection=self.connection)
+        else:
+            self.vehicleTracker = None
         
         # Discrete Class. For encoding lane info
         self.discreteClass = Discrete(discreteIntervals, maxLaneValue)
-        warmingTime = 600
         #Warming up
         self._warmingUpSimulation(warmingTime)
+        if snapshotInterval is not None:
+            # Snapshots late enough to leave less than an episode are not taken
+            lastSnapshotTime = self.simTime - (episodeLength if episodeLength is not None else 1)
+            self.snapshots = self._buildSnapshotBank(snapshotInterval, lastSnapshotTime, [self.trafficLight], "2")
+        self.episodeEndTime = self._episodeEndTime()
+        self.episodeStateFile = self.stateFile
         
-        self.totalTimeSteps = self.simTime // self.deltaTime
-        
-        # Program ID
-        if self.fixedTL:
-            traci.trafficlight.setProgram(tls_ids[0], "2")
+        if episodeLength is not None:
+            self.totalTimeSteps = episodeLength // self.deltaTime
         else:
-            traci.trafficlight.setProgram(tls_ids[0], "0")
+            self.totalTimeSteps = self.simTime // self.deltaTime
+        
+        self._setControlProgram()
             
         # Action space
         self.action_space = self.trafficLight.actionSpace
 
         # Observation space
         low = np.zeros(len(self.lanes)+1)
-        high = np.full(self.action_space.n + 1, discreteIntervals)
+        high = np.full(len(self.lanes) + 1, discreteIntervals)
         high[0] = self.action_space.n
         self.observation_space = spaces.Box(low=low, high=high, dtype=np.int64)
         
 
-    @property
-    def simStep(self):
-        """
-        Get the current simulation time step.
-        """
-        return traci.simulation.getTime()
-    
     @property
     def actionSpace(self):
         """
@@ -356,53 +1073,119 @@ class SumoEnvironment(gym.Env):
         """
         return [actionKey for actionKey in self.trafficLight.PHASES if actionKey != 'init']
        
-    def _initializeSimulation(self):
+    def _bindConnection(self):
         """
-        Starts the SUMO simulation with the specified configuration and parameters.
+        Binds the traffic light, lanes and vehicle tracker to the current connection (after restarting SUMO).
         """
-        sumoCMD = [self.sumoBinary, "-c", self.sumocfgFile, "--waiting-time-memory", str(self.waitingTimeMemory)
-                   #"--tripinfo-output", "tripinfo.xml"
-                   ]
-        
-        if not(self.sumoLog):
-            sumoCMD.append("--no-step-log")
-            sumoCMD.append("--no-warnings")
-        if self.gui:
-            sumoCMD.append("-S")
-            sumoCMD.append("--quit-on-end")
-        
-        try:
-            traci.start(sumoCMD)
-            
-        except traci.TraCIException as traci_e:
-            print(traci_e, end="")
-            print(" Closing connection...")
-            traci.close()
-            from time import sleep
-            sleep(1)
-            print(traci_e, end="")
-            print(" Starting new connection...")
-            traci.start(sumoCMD)
-            print("OK")
+        self.trafficLight.connection = self.connection
+        for lane in self.lanes.values():
+            lane.connection = self.connection
+        if self.vehicleTracker is not None:
+            self.vehicleTracker.connection = self.connection
     
     def _warmingUpSimulation(self, warmingTime):
         """
         Runs the simulation for a given warming time to stabilize initial conditions.
+        If the warm-up state is in the state cache, it is loaded instead.
         
         Args:
             warmingTime (int): Number of simulation steps to warm up.
         """
-        traci.simulationStep(warmingTime-1) # Warming Time
-        traci.trafficlight.setRedYellowGreenState(self.trafficLight.id, self.trafficLight.PHASES[0].state)
-        traci.simulationStep()
+        self._warmUpState(warmingTime, [self.trafficLight])
         self.waitingTime = self._getTotalWaitingTime()
         self.haltedVehicles = self._getTotalHaltedVehicles()
         self.trafficLight.currentPhase = self.trafficLight.initIndex
         self.trafficLight.nextPhase = self.trafficLight.initIndex
-        for lane in self.lanes.values():
-            lane.update()
-        traci.simulation.saveState(self.stateFile)
+        self._subscribe()
+        self._updateLanes()
+        self.currentTime = self.simStep
         
+    def _episodeEndTime(self):
+        """
+        Time the episode starting at the current time is truncated at.
+        """
+        if self.episodeLength is None:
+            return self.simTime
+        return min(self.simTime, self.currentTime + self.episodeLength)
+    
+    def _getDecisionSteps(self):
+        """
+        Number of deltaTime intervals from the current time until the traffic light can change phase again,
+        after a phase change request. It is at least one, and at most the intervals left until the episode
+        is truncated.
+        """
+        trafficLight = self.trafficLight
+        # Phase time after one interval (yellowTime < deltaTime, so a scheduled change is applied in it)
+        switchStep = trafficLight._stepsUntilSwitch()
+        if switchStep is not None and switchStep < self.deltaTime:
+            currentPhaseTime = self.deltaTime - switchStep
+        else:
+            currentPhaseTime = trafficLight.currentPhaseTime + self.deltaTime
+        remainingTime = max(trafficLight.minGreenTime, trafficLight.yellowTime) - currentPhaseTime
+        decisionSteps = 1 + max(0, -(-remainingTime // self.deltaTime))
+        lastStep = int((self.episodeEndTime - self.currentTime) // self.deltaTime) + 1
+        return max(1, min(decisionSteps, lastStep))
+    
+    def _setControlProgram(self):
+        """
+        Sets the program of the traffic light at the start of the episodes: the fixed-time program ("2") or
+        the program the agent controls ("0").
+        """
+        # Program ID
+        if self.fixedTL:
+            self.connection.trafficlight.setProgram(self.trafficLight.id, "2")
+        else:
+            self.connection.trafficlight.setProgram(self.trafficLight.id, "0")
+    
+    def _startEpisodeOutputs(self, stateFile):
+        """
+        Starts the outputs of a new episode (see outputDir): reloads the simulation with them and loads the
+        state the episode starts from (or warms up again in the mesoscopic simulation, see reset). The reload
+        closes the outputs of the previous episode, which are then converted.
+
+        Args:
+            stateFile (str): State file the episode starts from.
+        """
+        self.episode += 1
+        outputFiles = episodeOutputFiles(self.outputDir, self.label, self.episode)
+        outputOptions = []
+        for output, outputFile in outputFiles.items():
+            os.makedirs(os.path.dirname(outputFile), exist_ok=True)
+            outputOptions += ["--" + output + "-output", outputFile]
+        self.connection.load(self._sumoCommand()[1:] + outputOptions)
+        if self.fidelity == MESO:
+            self._warmUpState(self.warmingTime, [self.trafficLight])
+        else:
+            self.connection.simulation.loadState(stateFile)
+        # The program of the traffic light is not saved in the states
+        self._setControlProgram()
+        if self.episode > 0:
+            self._convertEpisodeOutputs(self.episode - 1)
+
+    def _convertEpisodeOutputs(self, episode):
+        """
+        Converts the outputs of an episode to the output format (see outputFormat), removing the XML files.
+        """
+        if self.outputFormat == XML:
+            return
+        xmlFiles = episodeOutputFiles(self.outputDir, self.label, episode)
+        outputFiles = episodeOutputFiles(self.outputDir, self.label, episode, self.outputFormat)
+        for output, tag in OUTPUT_TAGS.items():
+            if os.path.exists(xmlFiles[output]):
+                convertOutput(xmlFiles[output], outputFiles[output], tag, self.outputFormat)
+                os.remove(xmlFiles[output])
+
+    def close(self):
+        """
+        Close the SUMO simulation connection and remove the saved state. The outputs of the last episode
+        are closed (reloading the simulation, as the connection may return SUMO to a SumoPool) and converted.
+        """
+        if self.connection is not None and self.outputDir is not None and self.episode >= 0:
+            self.connection.load(self._sumoCommand()[1:])
+            self.connection.simulation.getTime()
+            self._convertEpisodeOutputs(self.episode)
+        super().close()
+
     def _setTLProgram(self, programID: int):
         """
         Sets the traffic light program based on a given ID.
@@ -411,34 +1194,37 @@ class SumoEnvironment(gym.Env):
             programID (int): The identifier for the desired traffic light program.
         """
         try:
-            traci.trafficlight.setProgram(tls_ids[0], programID)
-        except traci.TraCIException as traci_e:
+            self.connection.trafficlight.setProgram(self.trafficLight.id, programID)
+        except TraCIExceptions as traci_e:
             print(traci_e, end="")
             print(" Program ID setted to 1.")
-            traci.trafficlight.setProgram(tls_ids[0], "1")
+            self.connection.trafficlight.setProgram(self.trafficLight.id, "1")
             
     def getCurrentState(self):
         """
         Retrieve the current state of the environment.
 
+        The observation is written into a preallocated buffer, read directly from the lane data buffer.
+
         Returns:
-            np.array: A numerical representation combining traffic light phase and discretized lane metrics.
+            np.array: A numerical representation combining traffic light phase and discretized lane metrics
+                (a copy of the observation buffer).
         """
-        state = State(self.trafficLight.currentPhase, self.lanes, self.discreteClass, self.laneInfo)
-        return state.getArrayState()
-        #return state.getTupleState()
+        self.observation[0] = self.trafficLight.currentPhase
+        self.observation[1:] = self.discreteClass.log_interval_array(self.laneData[LANE_DATA_ROWS[self.laneInfo]])
+        return self.observation.copy()
     
     def _getTotalHaltedVehicles(self):
         """
         Calculate the total number of halted vehicles across all lanes.
         """
-        return sum(lane.lastStepHaltedVehicles for lane in self.lanes.values())
+        return self.laneData[LANE_DATA_ROWS[HALTED]].sum()
     
     def _getTotalWaitingTime(self):
         """
         Calculate the total waiting time across all lanes.
         """
-        return sum(lane.lastStepWaitingTime for lane in self.lanes.values())
+        return self.laneData[LANE_DATA_ROWS[WAITING_TIME]].sum()
     
     def computeReward(self):
         """
@@ -456,11 +1242,16 @@ class SumoEnvironment(gym.Env):
         Returns:
             float: Total accumulated waiting time.
         """
+        if self.fidelity == MESO:
+            # Not available in the mesoscopic simulation (see fidelity)
+            return self._getTotalWaitingTime()
+        if self.vehicleTracker is not None:
+            return self.vehicleTracker.getAccumulatedWaitingTime()
         accumulatedWaitingTime = 0
         for lane in self.lanes.values():
-            vehicles = traci.lane.getLastStepVehicleIDs(lane.laneId)
+            vehicles = lane.domain.getLastStepVehicleIDs(lane.laneId)
             for vehicle in vehicles:
-                accumulatedWaitingTime += traci.vehicle.getAccumulatedWaitingTime(vehicle)
+                accumulatedWaitingTime += self.connection.vehicle.getAccumulatedWaitingTime(vehicle)
                 
         return accumulatedWaitingTime
     
@@ -491,33 +1282,79 @@ class SumoEnvironment(gym.Env):
         self.cumulativeWaitingTime = currentAccWaitingTime
         return reward
 
-    def getInfo(self):
+    def _getInfoFunctions(self):
+        """
+        Functions computing each info field (of infoFields) from the current state of the simulation. They
+        only read the simulation, so the reward bookkeeping is not affected by the info.
+
+        Returns:
+            dict: Function of each field, in computation order.
+        """
+        vehicleCount = []
+
+        def getVehicleCount():
+            # Queried once, by the first field that needs it
+            if not vehicleCount:
+                vehicleCount.append(self._getVehicleCount())
+            return vehicleCount[0]
+
+        def meanWaitingTime():
+            count = getVehicleCount()
+            return self._getTotalWaitingTime() / count if count > 0 else 0
+
+        def meanAccWaitingTime():
+            count = getVehicleCount()
+            # The cumulative waiting time reward already keeps the accumulated waiting time of this step
+            if self.rewardFn == self.rewardFns["diff_cumulativeWaitingTime"]:
+                accWaitingTime = self.cumulativeWaitingTime
+            else:
+                accWaitingTime = self._getAccumulatedWaitingTime()
+            return accWaitingTime / count if count > 0 else 0
+
+        functions = {"mean_waiting_time": meanWaitingTime,
+                     "mean_acc_waiting_time": meanAccWaitingTime,
+                     "sim_step": lambda: self.simStep}
+        return {field: function for field, function in functions.items() if field in self.infoFields}
+
+    def requireInfoFields(self, fields):
+        """
+        Makes the info of every step include the given fields, whatever infoFields and infoFrequency were,
+        for callers whose metrics are computed from the info of every step.
+
+        Args:
+            fields (list): Info fields (from INFO_FIELDS).
+        """
+        self.infoFields += [field for field in fields if field in INFO_FIELDS and field not in self.infoFields]
+        self.infoFrequency = 1
+
+    def getInfo(self, computeFields=True):
         """
         Retrieve additional information from the simulation, such as average waiting time.
 
+        Args:
+            computeFields (bool): Include the info fields (infoFields). Otherwise only the step data
+                ("decision_steps") is included.
+
         Returns:
-            dict: A dictionary containing simulation step, mean waiting time, and mean accumulated waiting time.
-        """        
-        vehicleCount = traci.vehicle.getIDCount()
-        
-        if (self.rewardFn in [self.rewardFns["diff_halted"], self.rewardFns["diff_cumulativeWaitingTime"]]):
-            self.waitingTime = self._getTotalWaitingTime()
-        elif (self.rewardFn == self.rewardFns["diff_waitingTime"]):
-            self.haltedVehicles = self._getTotalHaltedVehicles()
-            
-        meanWaitingTime = self.waitingTime / vehicleCount if vehicleCount > 0 else 0
-        
-        if self.rewardFn != self.rewardFns["diff_cumulativeWaitingTime"]:
-            self.cumulativeWaitingTime = self._getAccumulatedWaitingTime()
-            
-        meanAccWaitingTime = self.cumulativeWaitingTime / vehicleCount if vehicleCount > 0 else 0
+            dict: A dictionary containing simulation step, mean waiting time, and mean accumulated waiting time
+                (a LazyInfo with lazyInfo).
+        """
+        functions = self._getInfoFunctions() if computeFields else {}
+        values = {}
+        if self.skipNonActionable:
+            values["decision_steps"] = self.decisionSteps
+        if self.lazyInfo:
+            return LazyInfo(values, functions)
+        for field, function in functions.items():
+            values[field] = function()
+        return values
 
-        info = {
-            "sim_step": self.simStep,
-            "mean_waiting_time": meanWaitingTime,
-            "mean_acc_waiting_time": meanAccWaitingTime
-        }
-        return info
+    def _expireInfo(self):
+        """
+        Drops the unread fields of the last info, before the simulation advances.
+        """
+        if isinstance(self.info, LazyInfo):
+            self.info.expire()
         
     def step(self, action=None):
         """
@@ -531,39 +1368,62 @@ class SumoEnvironment(gym.Env):
                    truncated flag (if simulation ended), and additional info.
         """
         # previousPhaseTime = 0
+        self._expireInfo()
+        if self.outputDir is not None and self.episode < 0:
+            # Stepped without a reset (as QLAgent and FixedTLAgent do on their first episode): the outputs
+            # start from the state of the environment, the one the first episode starts from
+            self._startEpisodeOutputs(self.episodeStateFile)
+            self._subscribe()
+        self.phaseTimer.start()
         # TOMAR ACCIÓN
         if (self.fixedTL):
-            for _ in range(self.deltaTime):
-                traci.simulationStep()
+            self.currentTime += self.deltaTime
+            self.connection.simulationStep(self.currentTime)
         else:
             self.trafficLight.changePhase(action)
             # PASO DE TIEMPO (deltaTime)   
-            for _ in range(self.deltaTime):
-                self.trafficLight.update()
+            if self.skipNonActionable:
+                self.decisionSteps = self._getDecisionSteps()
+            self.currentTime = self.trafficLight.advance(self.decisionSteps * self.deltaTime, self.currentTime)
+        self.phaseTimer.lap("advance")
             
-        for lane in self.lanes.values():
-            lane.update()
+        self._updateLanes()
+        self.phaseTimer.lap("lanes")
         
         # Retrieve new state, compute reward, and check termination conditions.
         state = self.getCurrentState()
+        self.phaseTimer.lap("encode")
         reward = self.computeReward()
-        truncated = traci.simulation.getMinExpectedNumber() == 0 or traci.simulation.getTime() > self.simTime
+        self.phaseTimer.lap("reward")
+        truncated = self._getMinExpectedNumber() == 0 or self.currentTime > self.episodeEndTime
+        self.phaseTimer.lap("truncation")
   
-        info = self.getInfo()
-        return state, reward, False, truncated, info
+        self.infoStep += 1
+        if truncated:
+            # Vectorized environments reset right after the last step, so its info is not left lazy
+            self.info = self.getInfo()
+            if isinstance(self.info, LazyInfo):
+                self.info.resolve()
+        else:
+            self.info = self.getInfo(self.infoFrequency != EPISODE_END and self.infoStep % self.infoFrequency == 0)
+        self.phaseTimer.lap("info")
+        return state, reward, False, truncated, self.info
         
     def reset(self, seed=None, options=None):
         """
-        Reset the environment to its initial state.
+        Reset the environment to its initial state: the warm-up state, or a snapshot sampled from the
+        snapshot bank (with the random generator of the environment, seeded by seed).
 
         Args:
             seed (int, optional): Random seed.
-            options (dict, optional): Additional options for resetting.
+            options (dict, optional): Additional options for resetting. "snapshot" selects the index of
+                the snapshot to start from.
 
         Returns:
             tuple: The initial state and additional info.
         """
         super().reset(seed=seed)
+        self._expireInfo()
         # Reset traffic light parameters to initial conditions.
         self.trafficLight.yellow = False
         self.trafficLight.currentPhase = self.trafficLight.initIndex
@@ -574,38 +1434,127 @@ class SumoEnvironment(gym.Env):
         self.waitingTime = 0
         self.cumulativeWaitingTime = 0
         
-        for laneKey in self.lanes:
-            self.lanes[laneKey].lastStepHaltedVehicles = 0
-            self.lanes[laneKey].waitingTime = 0
-            
-        try:
-            # Load the saved state from the warm-up phase.
-            traci.simulation.loadState(self.stateFile)
-        except traci.TraCIException:
-            self._initializeSimulation()
-            traci.simulation.loadState(self.stateFile)
+        self.laneData[LANE_DATA_ROWS[HALTED]] = 0
+        
+        stateFile = self.stateFile
+        if self.snapshots:
+            if options is not None and "snapshot" in options:
+                snapshot = options["snapshot"]
+            else:
+                snapshot = self.np_random.integers(len(self.snapshots))
+            stateFile = self.snapshots[snapshot][1]
+        self.episodeStateFile = stateFile
+        if self.outputDir is not None:
+            self._startEpisodeOutputs(stateFile)
+        elif self.fidelity == MESO:
+            # SUMO crashes loading states of the mesoscopic simulation with junction control. The simulation
+            # is reloaded and warmed up again instead, which gives the same state (the seed is the same) and
+            # is fast in the mesoscopic simulation.
+            self.connection.load(self._sumoCommand()[1:])
+            self._warmUpState(self.warmingTime, [self.trafficLight])
+            self._setControlProgram()
+        else:
+            try:
+                # Load the saved state from the warm-up phase (or the snapshot).
+                self.connection.simulation.loadState(stateFile)
+            except TraCIExceptions:
+                # SUMO is restarted, closing the current connection first (a PooledConnection returns its
+                # worker to the pool)
+                try:
+                    self.connection.close()
+                except (traci.FatalTraCIError, OSError):
+                    pass
+                self._initializeSimulation()
+                self._bindConnection()
+                self.connection.simulation.loadState(stateFile)
+        self._subscribe()
+        self.currentTime = self.simStep
+        self.episodeEndTime = self._episodeEndTime()
+        if self.skipNonActionable:
+            self.decisionSteps = 0
         
         self.waitingTime = self._getTotalWaitingTime()
         self.haltedVehicles = self._getTotalHaltedVehicles()
         
         state = self.getCurrentState()
-        info = self.getInfo()
-        
-        return state, info
-    
-    def close(self):
-        """
-        Close the SUMO simulation connection.
-        """
-        traci.close()
-        
+        self.infoStep = 0
+        self.info = self.getInfo()
 
-    def __del__(self):
+        return state, self.info
+
+    def runFixedTimeEpisode(self, tripinfoFile, summaryFile):
         """
-        Destructor to ensure the simulation is closed upon deletion of the environment.
+        Runs the episode started by the last reset with the fixed-time program, letting SUMO run it to the
+        end in a single simulation step (no TraCI calls during the episode), and collects its metrics from
+        the tripinfo and summary outputs of SUMO. The simulation is reloaded with the outputs and the state
+        the episode started from, and reloaded again at the end to close them, so the environment must be
+        reset afterwards. fixedTL is restored at the end.
+
+        The native episode is a different run from the stepped one: states do not include the random number
+        generators, and the reload seeds them again, while reset (without outputDir) keeps them running
+        from the previous episode. So the native metrics are not equal to the ones of stepping the episode
+        after reset (they differ as two samples of the scenario do), but every native run of an episode
+        gives the same results.
+        The step rewards are differences between consecutive steps, so the cumulative reward is the reward
+        between the first and last steps of the episode, computed once at the end: the same as stepping the
+        reloaded simulation to the same last step.
+
+        The metrics have the keys of stepping the episode (e.g. FixedTLAgent.run, evaluatePolicy), filled from
+        the SUMO outputs instead of the per-step info: "mean_waiting_time" is the mean of the meanWaitingTime
+        of the summary output over the steps, and "mean_acc_waiting_time" the mean accumulated waiting time
+        of the trips (their waitingTime in the tripinfo output, the same as "mean_trip_waiting_time"). They
+        are computed by SUMO over other vehicles and times than the info ones, so they are comparable between
+        native episodes, not with the values of stepped episodes.
+
+        Args:
+            tripinfoFile (str): Path SUMO writes the tripinfo output to.
+            summaryFile (str): Path SUMO writes the summary output to.
+
+        Returns:
+            dict: Cumulative reward and number of steps of the episode, the mean waiting and accumulated
+                waiting times, the trips that arrived during the episode (see readTripinfo) and the mean
+                number of running and halting vehicles in the network at the steps of the episode (see
+                readSummary).
         """
-        self.close()
-        
+        outputOptions = ["--tripinfo-output", tripinfoFile, "--summary-output", summaryFile]
+        startTime = self.simStep
+        if self.fidelity == MESO:
+            # States are not loaded in the mesoscopic simulation (see reset)
+            self.connection.load(self._sumoCommand()[1:] + outputOptions)
+            self._warmUpState(self.warmingTime, [self.trafficLight])
+        else:
+            # The state is loaded, as in reset (saving the current state again would not do: states saved
+            # right after loading one do not keep the timing of the traffic lights)
+            self.connection.load(self._sumoCommand()[1:] + outputOptions)
+            self.connection.simulation.loadState(self.episodeStateFile)
+        fixedTL = self.fixedTL
+        self.fixedTL = True
+        try:
+            self._setControlProgram()
+            self._subscribe()
+            # Time of the last step: the first one after the end of the episode (see step)
+            steps = int((self.episodeEndTime - startTime) // self.deltaTime) + 1
+            endTime = startTime + steps * self.deltaTime
+            self.connection.simulationStep(endTime)
+            self.currentTime = self.simStep
+            self._updateLanes()
+            cumulativeReward = self.computeReward()
+            stepLength = self.connection.simulation.getDeltaT()
+        finally:
+            self.fixedTL = fixedTL
+        # SUMO closes the outputs when the simulation is reloaded (done once it answers the next command)
+        self.connection.load(self._sumoCommand()[1:])
+        self.connection.simulation.getTime()
+
+        metrics = {"cumulative_reward": float(cumulativeReward), "steps": steps}
+        metrics.update(readTripinfo(tripinfoFile, startTime))
+        metrics["mean_acc_waiting_time"] = metrics["mean_trip_waiting_time"]
+        # The summary of a step has the time it started at, so the state at each step is reported a step
+        # length earlier
+        stepTimes = {startTime + step * self.deltaTime - stepLength for step in range(1, steps + 1)}
+        metrics.update(readSummary(summaryFile, stepTimes))
+        return metrics
+
     # Define reward function mappings (functions defined later in the class)     
     rewardFns = {"diff_halted": _diffHalted,
                 "diff_waitingTime": _diffWaitingTime,
@@ -0,0 +1,286 @@
+import os
+import pickle
+import random
+import xml.etree.ElementTree as ET
+from collections import deque
+
+import traci.constants as tc
+import sumolib
+
+
+class _Domain:
+    """
+    Base of the fake TraCI domains. Keeps the variable subscriptions of the domain objects and computes
+    their results from the getters of the domain when they are read.
+    """
+    def __init__(self, connection):
+        self.connection = connection
+        self.subscriptions = {}
+        self.getters = {}
+
+    def subscribe(self, objectId, varIDs):
+        self.subscriptions[objectId] = list(varIDs)
+
+    def _exists(self, objectId):
+        return True
+
+    def getSubscriptionResults(self, objectId):
+        varIDs = self.subscriptions.get(objectId)
+        if varIDs is None or not self._exists(objectId):
+            return {}
+        return {varID: self.getters[varID](objectId) for varID in varIDs}
+
+    def getAllSubscriptionResults(self):
+        return {objectId: self.getSubscriptionResults(objectId)
+                for objectId in list(self.subscriptions) if self._exists(objectId)}
+
+
+class _SimulationDomain(_Domain):
+    def __init__(self, connection):
+        super().__init__(connection)
+        self.getters = {tc.VAR_TIME: lambda _: self.getTime(),
+                        tc.VAR_MIN_EXPECTED_VEHICLES: lambda _: self.getMinExpectedNumber(),
+                        tc.VAR_DEPARTED_VEHICLES_IDS: lambda _: tuple(connection.departed),
+                        tc.VAR_ARRIVED_VEHICLES_IDS: lambda _: tuple(connection.arrived)}
+
+    def subscribe(self, varIDs):
+        super().subscribe("", varIDs)
+
+    def getSubscriptionResults(self, objectId=""):
+        return super().getSubscriptionResults(objectId)
+
+    def getTime(self):
+        return float(self.connection.time)
+
+    def getMinExpectedNumber(self):
+        connection = self.connection
+        return len(connection.vehicles) + (1 if connection.time < connection.endTime else 0)
+
+    def saveState(self, fileName):
+        self.connection.saveState(fileName)
+
+    def loadState(self, fileName):
+        self.connection.loadState(fileName)
+
+
+class _LaneDomain(_Domain):
+    def __init__(self, connection):
+        super().__init__(connection)
+        self.getters = {tc.LAST_STEP_VEHICLE_HALTING_NUMBER: self.getLastStepHaltingNumber,
+                        tc.VAR_WAITING_TIME: self.getWaitingTime}
+
+    def _queues(self, laneId):
+        index = self.connection.laneIndex.get(laneId)
+        return [] if index is None else [index]
+
+    def getLength(self, laneId):
+        return self.connection.net.getLane(laneId).getLength()
+
+    def getEdgeID(self, laneId):
+        return self.connection.net.getLane(laneId).getEdge().getID()
+
+    def getLastStepHaltingNumber(self, objectId):
+        queues = self.connection.queues
+        return sum(len(queues[index]) for index in self._queues(objectId))
+
+    def getWaitingTime(self, objectId):
+        connection = self.connection
+        return float(sum(len(connection.queues[index]) * connection.time - connection.departSum[index]
+                         for index in self._queues(objectId)))
+
+    def getLastStepVehicleIDs(self, objectId):
+        queues = self.connection.queues
+        return tuple(vehicleId for index in self._queues(objectId) for vehicleId, _ in queues[index])
+
+
+class _EdgeDomain(_LaneDomain):
+    def _queues(self, edgeId):
+        return self.connection.edgeLanes.get(edgeId, [])
+
+
+class _VehicleDomain(_Domain):
+    def __init__(self, connection):
+        super().__init__(connection)
+        self.getters = {tc.ID_COUNT: lambda _: self.getIDCount(),
+                        tc.VAR_ACCUMULATED_WAITING_TIME: self.getAccumulatedWaitingTime,
+                        tc.VAR_LANE_ID: self.getLaneID,
+                        tc.VAR_ROAD_ID: self.getRoadID}
+
+    def _exists(self, vehicleId):
+        return vehicleId == "" or vehicleId in self.connection.vehicles
+
+    def getIDCount(self):
+        return len(self.connection.vehicles)
+
+    def getIDList(self):
+        return tuple(self.connection.vehicles)
+
+    def getAccumulatedWaitingTime(self, vehicleId):
+        return float(self.connection.time - self.connection.vehicles[vehicleId][1])
+
+    def getLaneID(self, vehicleId):
+        return self.connection.lanes[self.connection.vehicles[vehicleId][0]]
+
+    def getRoadID(self, vehicleId):
+        return self.getEdgeID(self.getLaneID(vehicleId))
+
+    def getEdgeID(self, laneId):
+        return self.connection.net.getLane(laneId).getEdge().getID()
+
+
+class _TrafficLightDomain(_Domain):
+    def getIDList(self):
+        return (self.connection.tlsId,)
+
+    def getControlledLanes(self, tlsId):
+        return tuple(self.connection.controlledLanes)
+
+    def setProgram(self, tlsId, programID):
+        # Programs are not run: the state only changes with setRedYellowGreenState
+        pass
+
+    def getRedYellowGreenState(self, tlsId):
+        return self.connection.tlsState
+
+    def setRedYellowGreenState(self, tlsId, state):
+        self.connection.setTLState(state)
+
+
+class FakeConnection:
+    """
+    Stand-in for a traci connection that runs a toy queue model instead of SUMO. It implements the part of
+    the TraCI API used by SumoEnvironment (polling and subscriptions), so the Python-side overhead of the
+    environment can be measured (and the environment run) on machines without SUMO.
+
+    The network and the traffic light are read from the net file of the SUMO configuration. Every second a
+    vehicle arrives at each controlled lane with probability arrivalRate and stops at the end of the queue
+    of the lane, and the first vehicle of each lane with a green signal leaves with probability
+    dischargeRate. Every vehicle on a controlled lane is halted, and its waiting time is the time since it
+    arrived. Vehicles stop arriving at the end time of the configuration. (The queue model calibrated on the
+    route files, for pretraining, is surrogate.QueueSimulation; see that module for why both exist.)
+
+    Args:
+        sumoCMD (list): SUMO command. Only the configuration file ("-c") and the seed ("--seed") are used.
+        label (str): Label of the connection (unused).
+        arrivalRate (float): Probability of a vehicle arriving at each lane every second.
+        dischargeRate (float): Probability of a vehicle leaving each lane with green every second.
+    """
+    def __init__(self, sumoCMD, label=None, arrivalRate=0.05, dischargeRate=0.5):
+        self.label = label
+        self.arrivalRate = arrivalRate
+        self.dischargeRate = dischargeRate
+        sumocfgFile = sumoCMD[sumoCMD.index("-c") + 1]
+        self.random = random.Random(self._seed(sumoCMD))
+
+        root = ET.parse(sumocfgFile).getroot()
+        netFile = root.find("input/net-file").get("value")
+        end = root.find("time/end")
+        self.endTime = float(end.get("value")) if end is not None else float("inf")
+        self.net = sumolib.net.readNet(os.path.join(os.path.dirname(os.path.abspath(sumocfgFile)), netFile),
+                                       withPrograms=True)
+        tls = self.net.getTrafficLights()[0]
+        self.tlsId = tls.getID()
+        links = sorted((linkIndex, inLane.getID()) for inLane, _, linkIndex in tls.getConnections())
+        self.controlledLanes = [laneId for _, laneId in links]
+        # Queue model of the controlled lanes
+        self.lanes = list(dict.fromkeys(self.controlledLanes))
+        self.laneIndex = {laneId: index for index, laneId in enumerate(self.lanes)}
+        self.edgeLanes = {}
+        for index, laneId in enumerate(self.lanes):
+            self.edgeLanes.setdefault(self.net.getLane(laneId).getEdge().getID(), []).append(index)
+        self.linkLanes = [self.laneIndex[laneId] for laneId in self.controlledLanes]
+        programs = tls.getPrograms()
+        if programs:
+            state = next(iter(programs.values())).getPhases()[0].state
+        else:
+            state = "r" * len(self.controlledLanes)
+
+        self.simulation = _SimulationDomain(self)
+        self.lane = _LaneDomain(self)
+        self.edge = _EdgeDomain(self)
+        self.vehicle = _VehicleDomain(self)
+        self.trafficlight = _TrafficLightDomain(self)
+        self._clear()
+        self.setTLState(state)
+
+    @staticmethod
+    def _seed(options):
+        # SUMO's default seed
+        return int(options[options.index("--seed") + 1]) if "--seed" in options else 23423
+
+    def _clear(self):
+        self.time = 0
+        self.nextVehicle = 0
+        self.queues = [deque() for _ in self.lanes]
+        # Sum of the arrival times of the vehicles of each queue, for the waiting time of the lanes
+        self.departSum = [0 for _ in self.lanes]
+        # Lane index and arrival time of each vehicle
+        self.vehicles = {}
+        self.departed = []
+        self.arrived = []
+
+    def setTLState(self, state):
+        self.tlsState = state
+        green = set()
+        for linkIndex, signal in enumerate(state):
+            if signal in "Gg":
+                green.add(self.linkLanes[linkIndex])
+        self.greenLanes = sorted(green)
+
+    def _step(self):
+        self.time += 1
+        time = self.time
+        rand = self.random.random
+        if time <= self.endTime:
+            for index, queue in enumerate(self.queues):
+                if rand() < self.arrivalRate:
+                    vehicleId = "f" + str(self.nextVehicle)
+                    self.nextVehicle += 1
+                    queue.append((vehicleId, time))
+                    self.departSum[index] += time
+                    self.vehicles[vehicleId] = (index, time)
+                    self.departed.append(vehicleId)
+        for index in self.greenLanes:
+            queue = self.queues[index]
+            if queue and rand() < self.dischargeRate:
+                vehicleId, departTime = queue.popleft()
+                self.departSum[index] -= departTime
+                del self.vehicles[vehicleId]
+                self.vehicle.subscriptions.pop(vehicleId, None)
+                self.arrived.append(vehicleId)
+
+    def simulationStep(self, step=0.):
+        """ Runs the model until the given time (or one second if it is 0). """
+        self.departed = []
+        self.arrived = []
+        target = step if step > 0 else self.time + 1
+        while self.time < target:
+            self._step()
+
+    def saveState(self, fileName):
+        with open(fileName, "wb") as file:
+            pickle.dump((self.time, self.nextVehicle, self.queues, self.departSum, self.vehicles,
+                         self.tlsState), file)
+
+    def loadState(self, fileName):
+        with open(fileName, "rb") as file:
+            self.time, self.nextVehicle, self.queues, self.departSum, self.vehicles, state = pickle.load(file)
+        self.departed = []
+        self.arrived = []
+        self.setTLState(state)
+        # As SUMO, loading a state drops every subscription
+        for domain in (self.simulation, self.lane, self.edge, self.vehicle, self.trafficlight):
+            domain.subscriptions.clear()
+
+    def load(self, args):
+        """ Reloads the simulation (args are the SUMO options, without the binary), seeding it again. """
+        self.random = random.Random(self._seed(args))
+        self._clear()
+        for domain in (self.simulation, self.lane, self.edge, self.vehicle, self.trafficlight):
+            domain.subscriptions.clear()
+
+    def getVersion(self):
+        return (0, "FakeConnection")
+
+    def close(self):
+        pass
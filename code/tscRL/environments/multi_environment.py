@@ -0,0 +1,400 @@
+import numpy as np
+from typing import Dict, List
+
+from gymnasium import spaces
+
+from tscRL.environments.environment import (SumoSimulation, TrafficLight, Lane, VehicleTracker, TraCIExceptions,
+                                            LANE_DATA_ROWS, HALTED, WAITING_TIME, SUBSCRIPTION)
+from tscRL.util.discrete import Discrete
+try:
+    # PettingZoo is optional, the environment follows its parallel API either way
+    from pettingzoo import ParallelEnv
+except ImportError:
+    ParallelEnv = object
+
+
+class MultiSumoEnvironment(SumoSimulation, ParallelEnv):
+    """
+    Multi-agent environment for traffic signal control where every traffic light of the network is an
+    agent, all of them driven by the same SUMO simulation.
+
+    It follows the PettingZoo parallel API (agents are the traffic light IDs, and reset/step take and
+    return dicts keyed by agent). The data of every controlled lane is stored in one buffer and, with
+    the subscription backend, retrieved with a single call per step, so the observations and rewards of
+    all the agents are computed at once as stacked arrays (see resetArray and stepArray). The cost of the
+    simulation is shared across the agents instead of multiplied by them.
+
+    Each agent has the observation and the reward of a SumoEnvironment: its current phase followed by
+    the discretized lane info of its controlled lanes, and the difference of the halted vehicles, the
+    waiting time or the accumulated waiting time on its lanes.
+
+    The phases of each traffic light are built from the green phases of its programs in the network (see
+    TrafficLight.phasesFromProgram), or are the predefined phases of the 2x2 intersection if
+    predefinedPhases is True (e.g. for networks made of copies of it).
+
+    Attributes:
+        possible_agents (list): IDs of the traffic lights (all the traffic lights of the network unless
+            tlsIds is given).
+        agents (list): Agents of the current episode (empty once it is truncated).
+        trafficLights (list): TrafficLight of each agent.
+        lanes (dict): Lane objects controlled by the traffic lights, grouped by agent.
+        laneAgent (np.ndarray): Index of the agent controlling each lane.
+        observations (np.ndarray): Observation of each agent (one row per agent). Agents with fewer lanes
+            than the others are padded with zeros.
+    """
+    metadata = {"name": "multi_sumo_v0"}
+
+    def __init__(
+        self,
+        sumocfgFile,
+        deltaTime=5,
+        yellowTime=4,
+        minGreenTime=5,
+        gui=False,
+        edges=False,
+        discreteIntervals=6,
+        maxLaneValue=60,
+        laneInfo="halted",
+        rewardFn="diff_halted",
+        simTime=43800,
+        warmingTime=600,
+        sumoLog=False,
+        waitingTimeMemory=1000,
+        observationBackend=SUBSCRIPTION,
+        label=None,
+        useLibsumo=False,
+        sumoSeed=None,
+        stateCache=None,
+        connectionFactory=None,
+        tlsIds=None,
+        predefinedPhases=False,
+        profile=False
+    ) -> None:
+        # Constructor arguments, for creating copies of the environment
+        self.envArgs = {key: value for key, value in locals().items() if key not in ("self", "__class__")}
+        self._setSimulationOptions(sumocfgFile, gui, sumoLog, waitingTimeMemory, observationBackend, label,
+                                   useLibsumo, sumoSeed, stateCache, connectionFactory, profile)
+        self.simTime = simTime
+        assert(yellowTime < deltaTime)
+        self.deltaTime = deltaTime
+        self.edges = edges
+        self.warmingTime = warmingTime
+
+        if laneInfo in LANE_DATA_ROWS:
+            self.laneInfo = laneInfo
+        else:
+            self.laneInfo = HALTED
+            print("Warning: " + "Invalid laneInfo value = " + laneInfo + ". \"halted\" value was assigned instead.")
+        if rewardFn in self.rewardFns.keys():
+            self.rewardFn = self.rewardFns[rewardFn]
+        else:
+            self.rewardFn = self.rewardFns["diff_halted"]
+            print("Warning: Invalid rewardFn value. \"diff_halted\" value was assigned instead.")
+
+        self._initializeSimulation()
+
+        if tlsIds is None:
+            tlsIds = self.connection.trafficlight.getIDList()
+        self.possible_agents: List[str] = list(tlsIds)
+        self.agents: List[str] = list(self.possible_agents)
+        self.agentIndex = {agent: index for index, agent in enumerate(self.possible_agents)}
+
+        self.trafficLights: List[TrafficLight] = []
+        agentLanes = []
+        laneLengths = {}
+        for tlsId in self.possible_agents:
+            lanesIds = self.connection.trafficlight.getControlledLanes(tlsId)
+            phases = None if predefinedPhases else TrafficLight.phasesFromProgram(tlsId, self.connection)
+            self.trafficLights.append(TrafficLight(tlsId, 0, yellowTime, minGreenTime,
+                                                   connection=self.connection, phases=phases))
+            incomingLanesIds = []
+            for laneId in lanesIds:
+                laneLength = self.connection.lane.getLength(laneId)
+                if edges:
+                    laneId = self.connection.lane.getEdgeID(laneId)
+                if laneId not in incomingLanesIds:
+                    incomingLanesIds.append(laneId)
+                    laneLengths[laneId] = laneLength
+            agentLanes.append(incomingLanesIds)
+
+        # Lane data buffer shared by the lanes of every agent, grouped by agent
+        nLanes = sum(len(lanesIds) for lanesIds in agentLanes)
+        self.laneData = np.zeros((len(LANE_DATA_ROWS), nLanes))
+        self.lanes: Dict[str, Lane] = {}
+        self.laneAgent = np.zeros(nLanes, dtype=np.int64)
+        laneColumns = np.zeros(nLanes, dtype=np.int64)
+        for agentIndex, lanesIds in enumerate(agentLanes):
+            for position, laneId in enumerate(lanesIds):
+                index = len(self.lanes)
+                self.lanes[laneId] = Lane(laneId, laneLengths[laneId], edge=edges, connection=self.connection,
+                                          laneData=self.laneData, index=index)
+                self.laneAgent[index] = agentIndex
+                laneColumns[index] = position + 1
+        self.agentLanes = {agent: lanesIds for agent, lanesIds in zip(self.possible_agents, agentLanes)}
+        self._laneColumns = laneColumns
+        # Observation buffer: one row per agent, traffic light phase followed by the discretized lane info
+        maxLanes = max(len(lanesIds) for lanesIds in agentLanes)
+        self.observations = np.zeros((len(self.possible_agents), maxLanes + 1), dtype=np.int64)
+
+        if self.observationBackend == SUBSCRIPTION:
+            self.vehicleTracker = VehicleTracker(self.lanes.keys(), edge=edges, connection=self.connection)
+        else:
+            self.vehicleTracker = None
+
+        # Discrete Class. For encoding lane info
+        self.discreteClass = Discrete(discreteIntervals, maxLaneValue)
+        nAgents = len(self.possible_agents)
+        self.haltedVehicles = np.zeros(nAgents)
+        self.waitingTime = np.zeros(nAgents)
+        self.cumulativeWaitingTime = np.zeros(nAgents)
+        #Warming up
+        self._warmingUpSimulation(warmingTime)
+
+        self.action_spaces = {}
+        self.observation_spaces = {}
+        for agent, trafficLight in zip(self.possible_agents, self.trafficLights):
+            self.action_spaces[agent] = trafficLight.actionSpace
+            low = np.zeros(len(self.agentLanes[agent]) + 1)
+            high = np.full(len(self.agentLanes[agent]) + 1, discreteIntervals)
+            high[0] = trafficLight.actionSpace.n
+            self.observation_spaces[agent] = spaces.Box(low=low, high=high, dtype=np.int64)
+
+    def observation_space(self, agent):
+        return self.observation_spaces[agent]
+
+    def action_space(self, agent):
+        return self.action_spaces[agent]
+
+    def _bindConnection(self):
+        """
+        Binds the traffic lights, lanes and vehicle tracker to the current connection (after restarting SUMO).
+        """
+        for trafficLight in self.trafficLights:
+            trafficLight.connection = self.connection
+        for lane in self.lanes.values():
+            lane.connection = self.connection
+        if self.vehicleTracker is not None:
+            self.vehicleTracker.connection = self.connection
+
+    def _warmingUpSimulation(self, warmingTime):
+        """
+        Runs the simulation for a given warming time to stabilize initial conditions.
+        If the warm-up state is in the state cache, it is loaded instead.
+
+        Args:
+            warmingTime (int): Number of simulation steps to warm up.
+        """
+        self._warmUpState(warmingTime, self.trafficLights)
+        for trafficLight in self.trafficLights:
+            trafficLight.currentPhase = trafficLight.initIndex
+            trafficLight.nextPhase = trafficLight.initIndex
+        self._subscribe()
+        self._updateLanes()
+        self.currentTime = self.simStep
+
+    def _advance(self):
+        """
+        Advance the simulation deltaTime steps, applying the scheduled phase change of each traffic light
+        at the same step TrafficLight.advance would. SUMO is advanced once per distinct switch point.
+        """
+        targetTime = self.currentTime + self.deltaTime
+        switches: Dict[int, List[TrafficLight]] = {}
+        for trafficLight in self.trafficLights:
+            switchStep = trafficLight._stepsUntilSwitch()
+            if switchStep is not None and switchStep < self.deltaTime:
+                switches.setdefault(switchStep, []).append(trafficLight)
+            else:
+                trafficLight.currentPhaseTime += self.deltaTime
+        for switchStep in sorted(switches):
+            if switchStep > 0:
+                self.connection.simulationStep(self.currentTime + switchStep)
+            for trafficLight in switches[switchStep]:
+                trafficLight.switchPhase(self.deltaTime - switchStep)
+        self.connection.simulationStep(targetTime)
+        self.currentTime = targetTime
+
+    def _sumByAgent(self, laneValues):
+        """ Sums lane values over the lanes of each agent. """
+        return np.bincount(self.laneAgent, weights=laneValues, minlength=len(self.possible_agents))
+
+    def getCurrentState(self):
+        """
+        Retrieve the current observation of every agent.
+
+        Returns:
+            np.ndarray: Observations, one row per agent (a copy of the observation buffer).
+        """
+        self.observations[:, 0] = [trafficLight.currentPhase for trafficLight in self.trafficLights]
+        self.observations[self.laneAgent, self._laneColumns] = self.discreteClass.log_interval_array(
+            self.laneData[LANE_DATA_ROWS[self.laneInfo]])
+        return self.observations.copy()
+
+    def _getHaltedVehicles(self):
+        """ Number of halted vehicles on the lanes of each agent. """
+        return self._sumByAgent(self.laneData[LANE_DATA_ROWS[HALTED]])
+
+    def _getWaitingTime(self):
+        """ Waiting time on the lanes of each agent. """
+        return self._sumByAgent(self.laneData[LANE_DATA_ROWS[WAITING_TIME]])
+
+    def _getAccumulatedWaitingTime(self):
+        """ Accumulated waiting time of the vehicles on the lanes of each agent. """
+        if self.vehicleTracker is not None:
+            return self._sumByAgent(self.vehicleTracker.getAccumulatedWaitingTimeByLane())
+        laneValues = np.zeros(len(self.lanes))
+        for index, lane in enumerate(self.lanes.values()):
+            for vehicle in lane.domain.getLastStepVehicleIDs(lane.laneId):
+                laneValues[index] += self.connection.vehicle.getAccumulatedWaitingTime(vehicle)
+        return self._sumByAgent(laneValues)
+
+    def computeReward(self):
+        """
+        Compute the reward of every agent using the selected reward function.
+
+        Returns:
+            np.ndarray: The reward of each agent.
+        """
+        return self.rewardFn(self)
+
+    def _diffHalted(self):
+        currentHaltedVehicles = self._getHaltedVehicles()
+        reward = self.haltedVehicles - currentHaltedVehicles
+        self.haltedVehicles = currentHaltedVehicles
+        return reward
+
+    def _diffWaitingTime(self):
+        currentWaitingTime = self._getWaitingTime()
+        reward = self.waitingTime - currentWaitingTime
+        self.waitingTime = currentWaitingTime
+        return reward
+
+    def _diffAccumulatedWaitingTime(self):
+        currentAccWaitingTime = self._getAccumulatedWaitingTime()
+        reward = self.cumulativeWaitingTime - currentAccWaitingTime
+        self.cumulativeWaitingTime = currentAccWaitingTime
+        return reward
+
+    def getInfo(self):
+        """
+        Retrieve additional information from the simulation.
+
+        Returns:
+            dict: Simulation step, number of vehicles, and the halted vehicles and waiting time on the lanes
+                of each agent (arrays).
+        """
+        return {"sim_step": self.simStep,
+                "vehicles": self._getVehicleCount(),
+                "halted": self._getHaltedVehicles(),
+                "waiting_time": self._getWaitingTime()}
+
+    def _agentInfos(self, info):
+        """ Splits the info into a dict per agent. """
+        return {agent: {"sim_step": info["sim_step"],
+                        "halted": info["halted"][index],
+                        "waiting_time": info["waiting_time"][index]}
+                for agent, index in self.agentIndex.items()}
+
+    def _agentObservations(self, observations):
+        return {agent: observations[index, :len(self.agentLanes[agent]) + 1]
+                for agent, index in self.agentIndex.items()}
+
+    def stepArray(self, actions):
+        """
+        Advance the simulation by one step, with the actions and results of the agents as arrays.
+
+        Args:
+            actions (array_like): The action (new phase) of each agent, in the order of possible_agents.
+
+        Returns:
+            tuple: Observations (one row per agent), rewards (one per agent), truncated flag (if the
+                simulation ended) and info.
+        """
+        self.phaseTimer.start()
+        for trafficLight, action in zip(self.trafficLights, actions):
+            trafficLight.changePhase(int(action))
+        self._advance()
+        self.phaseTimer.lap("advance")
+
+        self._updateLanes()
+        self.phaseTimer.lap("lanes")
+
+        observations = self.getCurrentState()
+        self.phaseTimer.lap("encode")
+        rewards = self.computeReward()
+        self.phaseTimer.lap("reward")
+        truncated = self._getMinExpectedNumber() == 0 or self.currentTime > self.simTime
+        self.phaseTimer.lap("truncation")
+
+        info = self.getInfo()
+        self.phaseTimer.lap("info")
+        return observations, rewards, truncated, info
+
+    def step(self, actions):
+        """
+        Advance the simulation by one step (PettingZoo parallel API).
+
+        Args:
+            actions (dict): The action of each agent. Agents without an action keep their phase.
+
+        Returns:
+            tuple: Observations, rewards, terminations (always False), truncations and infos, as dicts
+                keyed by agent.
+        """
+        actionArray = [actions.get(agent, trafficLight.currentPhase)
+                       for agent, trafficLight in zip(self.possible_agents, self.trafficLights)]
+        observations, rewards, truncated, info = self.stepArray(actionArray)
+        agents = self.agents
+        if truncated:
+            self.agents = []
+        return (self._agentObservations(observations),
+                {agent: float(rewards[self.agentIndex[agent]]) for agent in agents},
+                {agent: False for agent in agents},
+                {agent: truncated for agent in agents},
+                self._agentInfos(info))
+
+    def resetArray(self, seed=None, options=None):
+        """
+        Reset the environment to its initial state.
+
+        Returns:
+            tuple: Observations (one row per agent) and info.
+        """
+        for trafficLight in self.trafficLights:
+            trafficLight.yellow = False
+            trafficLight.currentPhase = trafficLight.initIndex
+            trafficLight.nextPhase = trafficLight.initIndex
+            trafficLight.currentPhaseTime = 0
+        self.laneData[LANE_DATA_ROWS[HALTED]] = 0
+
+        try:
+            # Load the saved state from the warm-up phase.
+            self.connection.simulation.loadState(self.stateFile)
+        except TraCIExceptions:
+            self._initializeSimulation()
+            self._bindConnection()
+            self.connection.simulation.loadState(self.stateFile)
+        self._subscribe()
+        self._updateLanes()
+        self.currentTime = self.simStep
+        self.agents = list(self.possible_agents)
+
+        self.haltedVehicles = self._getHaltedVehicles()
+        self.waitingTime = self._getWaitingTime()
+        self.cumulativeWaitingTime = self._getAccumulatedWaitingTime()
+
+        return self.getCurrentState(), self.getInfo()
+
+    def reset(self, seed=None, options=None):
+        """
+        Reset the environment to its initial state (PettingZoo parallel API).
+
+        Returns:
+            tuple: The observations and infos, as dicts keyed by agent.
+        """
+        observations, info = self.resetArray(seed, options)
+        return self._agentObservations(observations), self._agentInfos(info)
+
+    # Reward function mappings
+    rewardFns = {"diff_halted": _diffHalted,
+                 "diff_waitingTime": _diffWaitingTime,
+                 "diff_cumulativeWaitingTime": _diffAccumulatedWaitingTime}
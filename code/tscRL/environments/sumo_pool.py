@@ -0,0 +1,173 @@
+import os
+import itertools
+import subprocess
+
+import traci
+from sumolib import checkBinary
+from sumolib.miscutils import getFreeSocketPort
+
+# Counter for generating worker labels unique within the process
+_workerCounter = itertools.count()
+
+
+class _Worker:
+    """
+    A SUMO process of the pool and its TraCI connection.
+    """
+    def __init__(self, sumoCMD, waitBetweenRetries):
+        self.label = "sumopool_" + str(os.getpid()) + "_" + str(next(_workerCounter))
+        port = getFreeSocketPort()
+        self.process = subprocess.Popen(sumoCMD + ["--remote-port", str(port)])
+        self.port = port
+        self.waitBetweenRetries = waitBetweenRetries
+        self.connection = None
+
+    def connect(self):
+        """
+        Connects to the process (started in the constructor, so several workers can start at the same time).
+        """
+        self.connection = traci.connect(self.port, proc=self.process, waitBetweenRetries=self.waitBetweenRetries,
+                                        label=self.label)
+
+    @property
+    def alive(self):
+        return self.connection is not None and self.process.poll() is None
+
+    def close(self):
+        if self.connection is None:
+            return
+        try:
+            self.connection.close()
+        except (traci.TraCIException, traci.FatalTraCIError, OSError):
+            self.process.kill()
+        self.connection = None
+
+
+class PooledConnection:
+    """
+    traci connection leased from a SumoPool. It is used as the traci connection of the worker, except that
+    closing it returns the worker to the pool instead of closing SUMO.
+    """
+    def __init__(self, pool, worker):
+        self._pool = pool
+        self._worker = worker
+
+    def __getattr__(self, name):
+        if self._worker is None:
+            raise traci.FatalTraCIError("Not connected (the connection was returned to the pool).")
+        value = getattr(self._worker.connection, name)
+        # Cached, so later accesses skip __getattr__
+        setattr(self, name, value)
+        return value
+
+    def close(self):
+        if self._worker is None:
+            return
+        worker = self._worker
+        self._worker = None
+        for name in [name for name in vars(self) if not name.startswith("_")]:
+            delattr(self, name)
+        self._pool.release(worker)
+
+
+class SumoPool:
+    """
+    Pool of headless SUMO processes reused by the environments, to take the start of SUMO (spawning the
+    process, loading the network and routes and connecting the socket) out of the construction of the
+    environments, e.g. in hyperparameter studies and scenario sweeps that create many environments.
+
+    An environment leases a worker by passing lease as its connectionFactory. The leased worker loads the
+    configuration and options of the environment with traci.load, which is much faster than starting a new
+    process, and is returned to the pool when the environment closes the connection. Workers are started
+    when the pool is created (size workers, running sumocfgFile, all starting at the same time) or when a
+    lease finds no idle worker. The pool belongs to the process that created it (it is not shared with
+    the subprocesses of a SubprocVecEnv).
+
+    Args:
+        size (int): Number of workers started when the pool is created.
+        sumocfgFile (str): Configuration the workers are started with (needed if size > 0, as SUMO does not
+            start without a network).
+        sumoBinary (str): SUMO binary of the workers (sumo by default, the pool is headless).
+        waitBetweenRetries (float): Seconds between the attempts to connect to a starting worker (traci.start
+            waits a whole second).
+    """
+    def __init__(self, size=0, sumocfgFile=None, sumoBinary=None, waitBetweenRetries=0.05):
+        self.sumoBinary = sumoBinary if sumoBinary is not None else checkBinary("sumo")
+        self.waitBetweenRetries = waitBetweenRetries
+        self.idle = []
+        self.workers = []
+        if size > 0:
+            if sumocfgFile is None:
+                raise ValueError("A sumocfgFile is needed to start the workers of the pool.")
+            sumoCMD = [self.sumoBinary, "-c", sumocfgFile, "--no-step-log", "--no-warnings"]
+            workers = [_Worker(sumoCMD, waitBetweenRetries) for _ in range(size)]
+            for worker in workers:
+                worker.connect()
+            self.workers += workers
+            self.idle += workers
+
+    def _startWorker(self, sumoCMD):
+        worker = _Worker(sumoCMD, self.waitBetweenRetries)
+        worker.connect()
+        self.workers.append(worker)
+        return worker
+
+    def lease(self, sumoCMD, label=None):
+        """
+        Leases a worker running the simulation of a SUMO command (connection factory of SumoEnvironment).
+
+        Args:
+            sumoCMD (list): SUMO binary followed by the options of the simulation (without --remote-port).
+            label (str): Label of the environment (unused, the workers have their own labels).
+
+        Returns:
+            PooledConnection: Connection to the worker, returning it to the pool on close.
+        """
+        if os.path.basename(sumoCMD[0]) != os.path.basename(self.sumoBinary):
+            raise ValueError("The pool runs " + self.sumoBinary + ", not " + sumoCMD[0] + " (gui=True?).")
+        while self.idle:
+            worker = self.idle.pop()
+            if not worker.alive:
+                self._discard(worker)
+                continue
+            try:
+                worker.connection.load(sumoCMD[1:])
+                # SUMO acknowledges the load before loading, and quits if the options cannot be loaded
+                worker.connection.simulation.getTime()
+            except (traci.TraCIException, traci.FatalTraCIError):
+                self._discard(worker)
+                raise
+            return PooledConnection(self, worker)
+        return PooledConnection(self, self._startWorker(sumoCMD))
+
+    def release(self, worker):
+        """
+        Returns a leased worker to the pool (called when its PooledConnection is closed).
+        """
+        if worker.alive:
+            self.idle.append(worker)
+        else:
+            self._discard(worker)
+
+    def _discard(self, worker):
+        worker.close()
+        if worker in self.workers:
+            self.workers.remove(worker)
+
+    def close(self):
+        """
+        Closes every worker of the pool, including the leased ones.
+        """
+        for worker in self.workers:
+            worker.close()
+        self.workers = []
+        self.idle = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __del__(self):
+        self.close()
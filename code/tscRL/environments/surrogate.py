@@ -0,0 +1,556 @@
+"""
+Surrogate of the SUMO simulation for cheap pretraining: a NumPy queue model of the intersection
+(QueueSimulation) and the environments running it (SurrogateEnvironment, or a batch of them in
+SurrogateVecEnv).
+
+fake_traci.FakeConnection is also a toy queue model, but it serves another purpose and the two are kept
+apart on purpose. FakeConnection stands in for a TraCI connection: SumoEnvironment runs unchanged on it,
+one simulation per connection and one TraCI call at a time, so it measures the Python-side overhead of
+the environment and replays its phase traces without SUMO, and its trajectories must not change.
+QueueSimulation skips TraCI and advances a batch of environments with array operations, with arrivals
+calibrated from the flows of the route files and travel times from the network, so it must stay
+vectorized and can be refined without breaking the traces and benchmarks recorded over FakeConnection.
+"""
+import os
+import xml.etree.ElementTree as ET
+import numpy as np
+
+import gymnasium as gym
+from gymnasium import spaces
+import sumolib
+from stable_baselines3.common.vec_env import VecEnv
+
+from tscRL.environments.environment import TrafficLight, LANE_DATA_ROWS, HALTED, WAITING_TIME
+from tscRL.util.discrete import Discrete
+from tscRL.util.routeFlows import flowRate
+
+
+def readFlows(routeFile):
+    """
+    Reads the flows of a route file.
+
+    Args:
+        routeFile (str): Path of the route file.
+
+    Returns:
+        list: Tuples (origin, destination, begin, end, rate), where origin and destination are junction
+            IDs (fromJunction/toJunction) or edge IDs (from/to), and rate is the mean number of vehicles
+            per second.
+    """
+    flows = []
+    for flow in ET.parse(routeFile).getroot().iter("flow"):
+        begin = float(flow.get("begin", 0))
+        end = float(flow.get("end", 3600))
+        rate = flowRate(flow)
+        if rate is None:
+            continue
+        if flow.get("fromJunction") is not None:
+            flows.append((flow.get("fromJunction"), flow.get("toJunction"), begin, end, rate))
+        else:
+            flows.append((flow.get("from"), flow.get("to"), begin, end, rate))
+    return flows
+
+
+class QueueSimulation:
+    """
+    Queue model of the intersection of a SUMO scenario, simulated with NumPy second by second for a batch of
+    environments at once. It does not need SUMO.
+
+    Each link (connection of an incoming lane controlled by the traffic light) has a point queue. The flows
+    of the route files generate Poisson arrivals at the start of the incoming lanes, split evenly between the
+    links of their movement. Vehicles reach the stop line after driving the lane at its speed limit and join
+    the queue of their link. Every second the first vehicle of a queue crosses the junction with probability
+    saturationFlow if the link has a major green signal ("G"), permissiveFactor times that with a minor green
+    signal ("g"), and does not cross otherwise. Queued vehicles are halted and wait; vehicles leave the model
+    after driving the outgoing lane. Crossing vehicles take the mean waiting time of their queue with them,
+    and, as vehicles halt once in the model, their accumulated waiting time is their waiting time.
+
+    The traffic lights follow the rules of TrafficLight (TrafficLight.PHASES, yellow transitions, minimum
+    green time), vectorized over the batch, or run the fixed-time program of the network (program "2", see
+    runFixedProgram).
+
+    Attributes:
+        nEnvs (int): Number of environments of the batch.
+        time (int): Simulation time (shared by the environments).
+        lanes (list): IDs of the incoming lanes (or edges) of the observation, in the order of SumoEnvironment.
+        queue (np.ndarray): Queued (halted) vehicles of each link, one row per environment.
+        waitingTime (np.ndarray): Waiting time of the queued vehicles of each link.
+        lastArrival (int): Last second with arrivals in the route files.
+    """
+    def __init__(self, sumocfgFile, nEnvs=1, yellowTime=4, minGreenTime=5, edges=False, seed=None,
+                 saturationFlow=0.5, permissiveFactor=0.5):
+        self.nEnvs = nEnvs
+        self.yellowTime = yellowTime
+        self.minGreenTime = minGreenTime
+        self.saturationFlow = saturationFlow
+        self.permissiveFactor = permissiveFactor
+        self.rng = np.random.default_rng(seed)
+
+        cfgDir = os.path.dirname(os.path.abspath(sumocfgFile))
+        root = ET.parse(sumocfgFile).getroot()
+        netFile = os.path.join(cfgDir, root.find("input/net-file").get("value"))
+        routeFiles = root.find("input/route-files").get("value").replace(",", " ").split()
+        end = root.find("time/end")
+        self.endTime = int(float(end.get("value"))) if end is not None else 86400
+
+        net = sumolib.net.readNet(netFile, withPrograms=True)
+        tls = net.getTrafficLights()[0]
+        connections = sorted(tls.getConnections(), key=lambda connection: connection[2])
+        nLinks = len(connections)
+        # Observed lanes (or edges), as selected by SumoEnvironment. Links of other lanes are simulated
+        # but not observed.
+        self.lanes = []
+        self.linkLanes = np.full(nLinks, -1)
+        for link, (inLane, _, _) in enumerate(connections):
+            if "in" not in inLane.getID():
+                continue
+            laneId = inLane.getEdge().getID() if edges else inLane.getID()
+            if laneId not in self.lanes:
+                self.lanes.append(laneId)
+            self.linkLanes[link] = self.lanes.index(laneId)
+        # Driving times (seconds) to the stop line and out of the junction
+        self.approachTime = np.array([max(1, round(inLane.getLength() / inLane.getSpeed()))
+                                      for inLane, _, _ in connections])
+        self.exitTime = np.array([max(1, round(outLane.getLength() / outLane.getSpeed()))
+                                  for _, outLane, _ in connections])
+        self.ringSize = int(max(self.approachTime.max(), self.exitTime.max())) + 1
+
+        # Arrival rate of each link, by second
+        self.arrivalRates = np.zeros((self.endTime + 1, nLinks))
+        for routeFile in routeFiles:
+            for origin, destination, begin, end, rate in readFlows(os.path.join(cfgDir, routeFile)):
+                links = [link for link, (inLane, outLane, _) in enumerate(connections)
+                         if origin in (inLane.getEdge().getFromNode().getID(), inLane.getEdge().getID())
+                         and destination in (outLane.getEdge().getToNode().getID(), outLane.getEdge().getID())]
+                if links:
+                    self.arrivalRates[int(begin):int(min(end, self.endTime + 1)), links] += rate / len(links)
+        arrivalTimes = np.nonzero(self.arrivalRates.any(axis=1))[0]
+        self.lastArrival = int(arrivalTimes.max()) if len(arrivalTimes) > 0 else 0
+
+        # Discharge probability of each link for each signal: the phases followed by their yellow transitions
+        phases = TrafficLight.PHASES
+        self.nPhases = len(phases)
+        self.initIndex = self.nPhases - 1
+        states = [phase.state for phase in phases] + [phase.yellowTransition for phase in phases]
+        self.dischargeProbability = np.array([self._dischargeProbability(state) for state in states])
+        # Program run by SUMO while warming up (the last program loaded)
+        program = list(tls.getPrograms().values())[-1]
+        self.warmingProgram = self._programCycle(program)
+        # Fixed-time program, run by SumoEnvironment with fixedTL
+        programs = tls.getPrograms()
+        self.fixedProgram = self._programCycle(programs["2"]) if "2" in programs else self.warmingProgram
+
+        self._clear()
+
+    def _dischargeProbability(self, state):
+        """ Discharge probability of each link with the given traffic light state. """
+        signalFactors = {"G": 1.0, "g": self.permissiveFactor}
+        return np.array([self.saturationFlow * signalFactors.get(signal, 0.0) for signal in state])
+
+    def _programCycle(self, program):
+        """ Discharge probability of each link at each second of the cycle of a traffic light program. """
+        return [self._dischargeProbability(phase.state) for phase in program.getPhases()
+                for _ in range(int(phase.duration))]
+
+    def _clear(self):
+        nLinks = len(self.linkLanes)
+        self.time = 0
+        # Seconds run by the fixed-time program since it was started (see runFixedProgram)
+        self.programTime = 0
+        self.queue = np.zeros((self.nEnvs, nLinks))
+        self.waitingTime = np.zeros((self.nEnvs, nLinks))
+        # Vehicles driving to the stop line (per link) and out of the junction, by the second they get there
+        self.approaching = np.zeros((self.ringSize, self.nEnvs, nLinks))
+        self.exiting = np.zeros((self.ringSize, self.nEnvs))
+        self.signal = np.full(self.nEnvs, self.initIndex)
+        self.currentPhase = np.full(self.nEnvs, self.initIndex)
+        self.nextPhase = np.full(self.nEnvs, self.initIndex)
+        self.yellow = np.zeros(self.nEnvs, dtype=bool)
+        self.currentPhaseTime = np.zeros(self.nEnvs, dtype=np.int64)
+
+    def _simulateSecond(self, dischargeProbability):
+        """
+        Simulates one second.
+
+        Args:
+            dischargeProbability (np.ndarray): Discharge probability of each link, one row per environment.
+        """
+        slot = self.time % self.ringSize
+        self.exiting[slot] = 0
+        arrivals = self.rng.poisson(self.arrivalRates[min(self.time, self.endTime)], size=self.queue.shape)
+        self.approaching[(self.time + self.approachTime) % self.ringSize, :, np.arange(self.queue.shape[1])] += arrivals.T
+        newVehicles = self.approaching[slot].copy()
+        self.approaching[slot] = 0
+
+        crossing = np.minimum(self.queue + newVehicles, self.rng.random(self.queue.shape) < dischargeProbability)
+        # Queued vehicles cross first
+        crossingQueued = np.minimum(crossing, self.queue)
+        meanWaitingTime = np.divide(self.waitingTime, self.queue, out=np.zeros_like(self.waitingTime),
+                                    where=self.queue > 0)
+        self.waitingTime -= crossingQueued * meanWaitingTime
+        self.queue += newVehicles - crossing
+        self.waitingTime += self.queue
+        np.add.at(self.exiting, (self.time + self.exitTime) % self.ringSize, crossing.T)
+        self.time += 1
+
+    def warmUp(self, warmingTime):
+        """
+        Runs the model from the start for warmingTime seconds with the program SUMO runs while warming up.
+        The traffic lights are left in the initial phase.
+        """
+        self._clear()
+        cycle = self.warmingProgram
+        for second in range(warmingTime):
+            self._simulateSecond(cycle[second % len(cycle)])
+
+    def changePhase(self, actions):
+        """
+        Requests a phase change of each traffic light (see TrafficLight.changePhase).
+
+        Args:
+            actions (array_like): New phase of each environment.
+        """
+        actions = np.asarray(actions, dtype=np.int64)
+        canChange = ~self.yellow & (self.currentPhaseTime >= self.minGreenTime) & (self.currentPhaseTime >= self.yellowTime)
+        change = (self.currentPhase != actions) & (canChange | (self.currentPhase == self.initIndex))
+        setYellow = change & (self.currentPhase != self.initIndex)
+        self.yellow |= setYellow
+        self.signal = np.where(setYellow, self.nPhases + self.currentPhase, self.signal)
+        self.currentPhaseTime = np.where(change, 0, self.currentPhaseTime)
+        self.nextPhase = np.where(change, actions, self.nextPhase)
+
+    def advance(self, deltaTime):
+        """
+        Advances deltaTime seconds, applying the scheduled phase changes at the same second as
+        TrafficLight.advance.
+        """
+        switchStep = np.where(self.yellow, np.maximum(0, self.yellowTime - self.currentPhaseTime), 0)
+        switching = (self.currentPhase != self.nextPhase) & (switchStep < deltaTime)
+        for second in range(deltaTime):
+            signal = np.where(switching & (second >= switchStep), self.nextPhase, self.signal)
+            self._simulateSecond(self.dischargeProbability[signal])
+        self.signal = np.where(switching, self.nextPhase, self.signal)
+        self.currentPhase = np.where(switching, self.nextPhase, self.currentPhase)
+        self.currentPhaseTime = np.where(switching, deltaTime - switchStep, self.currentPhaseTime + deltaTime)
+        self.yellow &= ~switching
+
+    def runFixedProgram(self, deltaTime):
+        """
+        Advances deltaTime seconds with every traffic light running the fixed-time program from the second of
+        its cycle it was left at (programTime), as SUMO runs program "2" with fixedTL. The phases of the
+        agent (currentPhase...) are left as they are.
+        """
+        cycle = self.fixedProgram
+        for _ in range(deltaTime):
+            self._simulateSecond(cycle[self.programTime % len(cycle)])
+            self.programTime += 1
+
+    def laneData(self):
+        """
+        Returns:
+            np.ndarray: Lane data of each environment, with shape (nEnvs, rows, lanes) and rows as in
+                LANE_DATA_ROWS.
+        """
+        laneData = np.zeros((self.nEnvs, len(LANE_DATA_ROWS), len(self.lanes)))
+        observed = self.linkLanes >= 0
+        for row, values in ((LANE_DATA_ROWS[HALTED], self.queue), (LANE_DATA_ROWS[WAITING_TIME], self.waitingTime)):
+            np.add.at(laneData[:, row], (slice(None), self.linkLanes[observed]), values[:, observed])
+        return laneData
+
+    def vehicleCount(self):
+        """ Number of vehicles of each environment. """
+        return self.approaching.sum(axis=(0, 2)) + self.queue.sum(axis=1) + self.exiting.sum(axis=0)
+
+    def getState(self):
+        """ Copy of the state of the model, traffic lights included (the random generator is not included). """
+        return {key: np.copy(getattr(self, key)) for key in
+                ("queue", "waitingTime", "approaching", "exiting", "signal", "currentPhase", "nextPhase", "yellow",
+                 "currentPhaseTime")} | {"time": self.time, "programTime": self.programTime}
+
+    def setState(self, state):
+        for key, value in state.items():
+            setattr(self, key, np.copy(value) if isinstance(value, np.ndarray) else value)
+
+
+class SurrogateSimulation:
+    """
+    Batch of environments with the observation, action, reward and info of SumoEnvironment, run on a
+    QueueSimulation instead of SUMO. Results are returned as arrays (one row per environment), as in
+    MultiSumoEnvironment.stepArray.
+
+    The environments share the simulation time, so their episodes end (and are reset) at the same time.
+    Episodes start from the state after warming up, with the random generator carrying on, so every episode
+    gets a different realization of the demand.
+
+    Args:
+        sumocfgFile (str): SUMO configuration file of the scenario.
+        nEnvs (int): Number of environments.
+        seed (int): Seed of the random generator of the demand and the discharges.
+        saturationFlow (float): Discharge probability per second of a link with a major green signal.
+        permissiveFactor (float): Factor of the discharge probability of a link with a minor green signal.
+        Other arguments as in SumoEnvironment. With fixedTL the traffic lights run the fixed-time program of
+        the network (from the start of its cycle on every reset) and the actions are ignored.
+    """
+    def __init__(self, sumocfgFile, nEnvs=1, deltaTime=5, yellowTime=4, minGreenTime=5, edges=False,
+                 discreteIntervals=6, maxLaneValue=60, laneInfo="halted", rewardFn="diff_halted", fixedTL=False,
+                 simTime=43800, warmingTime=600, seed=None, saturationFlow=0.5, permissiveFactor=0.5):
+        assert(yellowTime < deltaTime)
+        self.deltaTime = deltaTime
+        self.fixedTL = fixedTL
+        self.simTime = simTime
+        self.warmingTime = warmingTime
+        if laneInfo in LANE_DATA_ROWS:
+            self.laneInfo = laneInfo
+        else:
+            self.laneInfo = HALTED
+            print("Warning: " + "Invalid laneInfo value = " + laneInfo + ". \"halted\" value was assigned instead.")
+        if rewardFn in self.rewardFns.keys():
+            self.rewardFn = self.rewardFns[rewardFn]
+        else:
+            self.rewardFn = self.rewardFns["diff_halted"]
+            print("Warning: Invalid rewardFn value. \"diff_halted\" value was assigned instead.")
+        self.model = QueueSimulation(sumocfgFile, nEnvs, yellowTime, minGreenTime, edges, seed, saturationFlow,
+                                     permissiveFactor)
+        self.discreteClass = Discrete(discreteIntervals, maxLaneValue)
+        self.totalTimeSteps = self.simTime // self.deltaTime
+
+        self.action_space = spaces.Discrete(self.model.nPhases - 1, start=0)
+        low = np.zeros(len(self.model.lanes) + 1)
+        high = np.full(len(self.model.lanes) + 1, discreteIntervals)
+        high[0] = self.action_space.n
+        self.observation_space = spaces.Box(low=low, high=high, dtype=np.int64)
+
+        self.model.warmUp(warmingTime)
+        self.warmState = self.model.getState()
+        self._readModel()
+        # As in SumoEnvironment, the rewards of the steps before the first reset are relative to the warm-up
+        self._resetRewardState()
+
+    def _readModel(self):
+        self.laneData = self.model.laneData()
+        self.vehicleCount = self.model.vehicleCount()
+
+    def _resetRewardState(self):
+        """ Sets the values the rewards are differences of to the ones of the current state. """
+        self.haltedVehicles = self._getHaltedVehicles()
+        self.waitingTime = self._getWaitingTime()
+        self.cumulativeWaitingTime = self._getAccumulatedWaitingTime()
+
+    def getCurrentState(self):
+        """
+        Returns:
+            np.ndarray: Observation of each environment (traffic light phase followed by the discretized lane
+                metrics), one row per environment.
+        """
+        observations = np.zeros((self.model.nEnvs, len(self.model.lanes) + 1), dtype=np.int64)
+        observations[:, 0] = self.model.currentPhase
+        observations[:, 1:] = self.discreteClass.log_interval_array(self.laneData[:, LANE_DATA_ROWS[self.laneInfo]])
+        return observations
+
+    def _getHaltedVehicles(self):
+        return self.laneData[:, LANE_DATA_ROWS[HALTED]].sum(axis=1)
+
+    def _getWaitingTime(self):
+        return self.laneData[:, LANE_DATA_ROWS[WAITING_TIME]].sum(axis=1)
+
+    def _getAccumulatedWaitingTime(self):
+        # Vehicles halt once in the model, so their accumulated waiting time is their waiting time
+        return self.model.waitingTime.sum(axis=1)
+
+    def computeReward(self):
+        """
+        Returns:
+            np.ndarray: Reward of each environment, computed with the selected reward function.
+        """
+        return self.rewardFn(self)
+
+    def _diffHalted(self):
+        currentHaltedVehicles = self._getHaltedVehicles()
+        reward = self.haltedVehicles - currentHaltedVehicles
+        self.haltedVehicles = currentHaltedVehicles
+        return reward
+
+    def _diffWaitingTime(self):
+        currentWaitingTime = self._getWaitingTime()
+        reward = self.waitingTime - currentWaitingTime
+        self.waitingTime = currentWaitingTime
+        return reward
+
+    def _diffAccumulatedWaitingTime(self):
+        currentAccWaitingTime = self._getAccumulatedWaitingTime()
+        reward = self.cumulativeWaitingTime - currentAccWaitingTime
+        self.cumulativeWaitingTime = currentAccWaitingTime
+        return reward
+
+    def getInfo(self):
+        """
+        Returns:
+            list: Info of each environment, as returned by SumoEnvironment.getInfo.
+        """
+        vehicles = np.maximum(self.vehicleCount, 1)
+        meanWaitingTime = np.where(self.vehicleCount > 0, self._getWaitingTime() / vehicles, 0)
+        meanAccWaitingTime = np.where(self.vehicleCount > 0, self._getAccumulatedWaitingTime() / vehicles, 0)
+        return [{"sim_step": float(self.model.time),
+                 "mean_waiting_time": meanWaitingTime[env],
+                 "mean_acc_waiting_time": meanAccWaitingTime[env]}
+                for env in range(self.model.nEnvs)]
+
+    def stepArray(self, actions):
+        """
+        Advance the environments by one step.
+
+        Args:
+            actions (array_like): The action (new phase) of each environment.
+
+        Returns:
+            tuple: Observations (one row per environment), rewards, truncated flag (if the episodes ended)
+                and infos.
+        """
+        if self.fixedTL:
+            self.model.runFixedProgram(self.deltaTime)
+        else:
+            self.model.changePhase(actions)
+            self.model.advance(self.deltaTime)
+        self._readModel()
+        observations = self.getCurrentState()
+        rewards = self.computeReward()
+        # As SUMO, the simulation ends when no more vehicles are expected
+        truncated = (self.model.time > self.simTime
+                     or (self.model.time > self.model.lastArrival and not self.vehicleCount.any()))
+        return observations, rewards, truncated, self.getInfo()
+
+    def resetArray(self, seed=None):
+        """
+        Reset the environments to the state after warming up.
+
+        Args:
+            seed (int, optional): Reseeds the random generator.
+
+        Returns:
+            tuple: Observations (one row per environment) and infos.
+        """
+        if seed is not None:
+            self.model.rng = np.random.default_rng(seed)
+        self.model.setState(self.warmState)
+        self._readModel()
+        self._resetRewardState()
+        return self.getCurrentState(), self.getInfo()
+
+    rewardFns = {"diff_halted": _diffHalted,
+                 "diff_waitingTime": _diffWaitingTime,
+                 "diff_cumulativeWaitingTime": _diffAccumulatedWaitingTime}
+
+
+class SurrogateEnvironment(gym.Env):
+    """
+    Farama Gym-compatible environment with the API of SumoEnvironment, run on a NumPy queue model of the
+    scenario (see QueueSimulation) instead of SUMO. It is much faster than SUMO and does not need it, for
+    debugging agents and tuning hyperparameters before training on SUMO.
+
+    Args:
+        Arguments of SurrogateSimulation (without nEnvs).
+    """
+    def __init__(self, sumocfgFile, **simulationArgs):
+        self.simulation = SurrogateSimulation(sumocfgFile, nEnvs=1, **simulationArgs)
+        self.action_space = self.simulation.action_space
+        self.observation_space = self.simulation.observation_space
+        self.totalTimeSteps = self.simulation.totalTimeSteps
+
+    @property
+    def rewardFn(self):
+        return self.simulation.rewardFn
+
+    @property
+    def fixedTL(self):
+        return self.simulation.fixedTL
+
+    @fixedTL.setter
+    def fixedTL(self, fixedTL):
+        # Set by FixedTLAgent, as on SumoEnvironment
+        self.simulation.fixedTL = fixedTL
+
+    def getCurrentState(self):
+        """
+        Retrieve the current state of the environment.
+
+        Returns:
+            np.ndarray: Traffic light phase followed by the discretized lane metrics.
+        """
+        return self.simulation.getCurrentState()[0]
+
+    def requireInfoFields(self, fields):
+        """
+        Makes the info of every step include the given fields (see SumoEnvironment.requireInfoFields). The
+        info of the surrogate always includes every field of INFO_FIELDS, on every step.
+
+        Args:
+            fields (list): Info fields (from INFO_FIELDS).
+        """
+        pass
+
+    def step(self, action=None):
+        observations, rewards, truncated, infos = self.simulation.stepArray([action])
+        return observations[0], float(rewards[0]), False, truncated, infos[0]
+
+    def reset(self, seed=None, options=None):
+        super().reset(seed=seed)
+        observations, infos = self.simulation.resetArray(seed)
+        return observations[0], infos[0]
+
+    def close(self):
+        pass
+
+
+class SurrogateVecEnv(VecEnv):
+    """
+    Stable Baselines3 vectorized environment of nEnvs SurrogateEnvironment, simulated as one batch. Episodes
+    of all the environments end (and are reset) at the same time.
+
+    Args:
+        sumocfgFile (str): SUMO configuration file of the scenario.
+        nEnvs (int): Number of environments.
+        **simulationArgs: Other arguments of SurrogateSimulation.
+    """
+    def __init__(self, sumocfgFile, nEnvs, **simulationArgs):
+        self.simulation = SurrogateSimulation(sumocfgFile, nEnvs=nEnvs, **simulationArgs)
+        self.totalTimeSteps = self.simulation.totalTimeSteps
+        self.actions = None
+        super().__init__(nEnvs, self.simulation.observation_space, self.simulation.action_space)
+
+    def reset(self):
+        seed = self._seeds[0] if self._seeds and self._seeds[0] is not None else None
+        observations, self.reset_infos = self.simulation.resetArray(seed)
+        self._reset_seeds()
+        self._reset_options()
+        return observations
+
+    def step_async(self, actions):
+        self.actions = actions
+
+    def step_wait(self):
+        observations, rewards, truncated, infos = self.simulation.stepArray(self.actions)
+        dones = np.full(self.num_envs, truncated)
+        for env in range(self.num_envs):
+            infos[env]["TimeLimit.truncated"] = truncated
+        if truncated:
+            for env in range(self.num_envs):
+                infos[env]["terminal_observation"] = observations[env]
+            observations, self.reset_infos = self.simulation.resetArray()
+        return observations, rewards.astype(np.float32), dones, infos
+
+    def close(self):
+        pass
+
+    def get_attr(self, attr_name, indices=None):
+        """ Attributes are read from the (shared) SurrogateSimulation. """
+        return [getattr(self.simulation, attr_name) for _ in self._get_indices(indices)]
+
+    def set_attr(self, attr_name, value, indices=None):
+        setattr(self.simulation, attr_name, value)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        result = getattr(self.simulation, method_name)(*method_args, **method_kwargs)
+        return [result for _ in self._get_indices(indices)]
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return [False for _ in self._get_indices(indices)]
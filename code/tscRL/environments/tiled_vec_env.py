@@ -0,0 +1,113 @@
+import os
+import shutil
+import tempfile
+import xml.etree.ElementTree as ET
+import numpy as np
+
+from stable_baselines3.common.vec_env import VecEnv
+
+from tscRL.environments.multi_environment import MultiSumoEnvironment
+from tscRL.util.tileScenario import tileScenario, copyPrefix, getTrafficLightIds
+
+
+class TiledVecEnv(VecEnv):
+    """
+    Stable Baselines3 vectorized environment that runs copies of a single intersection scenario in one SUMO
+    simulation, so one simulation step advances the episodes of all the copies.
+
+    The network and the demand of the scenario are tiled into disconnected copies (see tileScenario) and
+    driven by a MultiSumoEnvironment. Each copy is a sub-environment with the observation, action, reward
+    and info of a SumoEnvironment of the scenario. The copies share the simulation, so their episodes end
+    (and are reset) at the same time.
+
+    Args:
+        sumocfgFile (str): SUMO configuration file of the scenario.
+        copies (int): Number of copies (sub-environments).
+        demandSeed (int): Seed of the demand of the copies (see tileRoutes). None lets SUMO draw it.
+        spacing (float): Distance between copies in the tiled network.
+        outputDir (str): Directory of the tiled scenario files. A temporary directory, removed on close,
+            by default.
+        **envArgs: Arguments of the MultiSumoEnvironment (deltaTime, laneInfo, rewardFn...).
+    """
+    def __init__(self, sumocfgFile, copies, demandSeed=None, spacing=100, outputDir=None, **envArgs):
+        self.tmpDir = tempfile.mkdtemp(prefix="tiled_") if outputDir is None else None
+        tiledCfgFile = tileScenario(sumocfgFile, copies, outputDir or self.tmpDir, spacing, demandSeed)
+        # Each copy is controlled by the first traffic light of the scenario, as in SumoEnvironment
+        netFile = ET.parse(sumocfgFile).getroot().find("input/net-file").get("value")
+        tlsId = getTrafficLightIds(os.path.join(os.path.dirname(os.path.abspath(sumocfgFile)), netFile))[0]
+        tlsIds = [copyPrefix(copy) + tlsId for copy in range(copies)]
+        self.env = MultiSumoEnvironment(tiledCfgFile, tlsIds=tlsIds, predefinedPhases=True, **envArgs)
+        self.totalTimeSteps = self.env.simTime // self.env.deltaTime
+        self.actions = None
+        agent = self.env.possible_agents[0]
+        super().__init__(copies, self.env.observation_space(agent), self.env.action_space(agent))
+
+    def _copyVehicleCounts(self):
+        """ Number of vehicles of each copy in the simulation (vehicle IDs are prefixed by copy). """
+        if self.env.vehicleTracker is not None:
+            vehicleIds = self.env.vehicleTracker.slots.keys()
+        else:
+            vehicleIds = self.env.connection.vehicle.getIDList()
+        copies = [int(vehicleId[1:vehicleId.index("_")]) for vehicleId in vehicleIds]
+        return np.bincount(copies, minlength=self.num_envs)
+
+    def _getInfos(self, info):
+        """ Info of each copy, as returned by SumoEnvironment.getInfo. """
+        vehicleCounts = self._copyVehicleCounts()
+        # The cumulative waiting time reward already keeps the accumulated waiting time of this step. The info
+        # only reads it, so the reward bookkeeping is not affected
+        if self.env.rewardFn == MultiSumoEnvironment.rewardFns["diff_cumulativeWaitingTime"]:
+            accWaitingTime = self.env.cumulativeWaitingTime
+        else:
+            accWaitingTime = self.env._getAccumulatedWaitingTime()
+        vehicles = np.maximum(vehicleCounts, 1)
+        meanWaitingTime = np.where(vehicleCounts > 0, info["waiting_time"] / vehicles, 0)
+        meanAccWaitingTime = np.where(vehicleCounts > 0, accWaitingTime / vehicles, 0)
+        return [{"sim_step": info["sim_step"],
+                 "mean_waiting_time": meanWaitingTime[copy],
+                 "mean_acc_waiting_time": meanAccWaitingTime[copy]}
+                for copy in range(self.num_envs)]
+
+    def reset(self):
+        observations, info = self.env.resetArray()
+        self.reset_infos = self._getInfos(info)
+        self._reset_seeds()
+        self._reset_options()
+        return observations
+
+    def step_async(self, actions):
+        self.actions = actions
+
+    def step_wait(self):
+        observations, rewards, truncated, info = self.env.stepArray(self.actions)
+        infos = self._getInfos(info)
+        dones = np.full(self.num_envs, truncated)
+        for copy in range(self.num_envs):
+            infos[copy]["TimeLimit.truncated"] = truncated
+        if truncated:
+            # All the copies end at the same time
+            for copy in range(self.num_envs):
+                infos[copy]["terminal_observation"] = observations[copy]
+            observations, info = self.env.resetArray()
+            self.reset_infos = self._getInfos(info)
+        return observations, rewards.astype(np.float32), dones, infos
+
+    def close(self):
+        self.env.close()
+        if self.tmpDir is not None:
+            shutil.rmtree(self.tmpDir, ignore_errors=True)
+            self.tmpDir = None
+
+    def get_attr(self, attr_name, indices=None):
+        """ Attributes are read from the (shared) MultiSumoEnvironment. """
+        return [getattr(self.env, attr_name) for _ in self._get_indices(indices)]
+
+    def set_attr(self, attr_name, value, indices=None):
+        setattr(self.env, attr_name, value)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        result = getattr(self.env, method_name)(*method_args, **method_kwargs)
+        return [result for _ in self._get_indices(indices)]
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return [False for _ in self._get_indices(indices)]
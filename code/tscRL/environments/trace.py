@@ -0,0 +1,250 @@
+import copy
+import pickle
+import numpy as np
+
+import traci
+
+from tscRL.util.connectionProxy import DOMAINS, DomainProxy, ConnectionProxy
+
+# Kinds of recorded results
+NONE = 0
+INT = 1
+FLOAT = 2
+OBJECT = 3
+# Calls whose arguments are not part of the call key (the state files depend on the label of the environment)
+UNKEYED_ARGUMENTS = ("simulation.saveState", "simulation.loadState")
+
+
+class Trace:
+    """
+    Sequence of TraCI calls (domain, method and arguments) and their results, as consumed by an environment.
+
+    Traces are saved as compressed NumPy (.npz) files with one column per field: the index of each call in
+    the table of distinct calls, the kind of its result, numeric results (ints and floats) in a float64
+    column, and other results (IDs, subscription results...) pickled into a byte column with their offsets.
+
+    Attributes:
+        calls (list): Call keys, as "domain.method(args)".
+        results (list): Result of each call.
+    """
+    def __init__(self, calls=None, results=None):
+        self.calls = calls if calls is not None else []
+        self.results = results if results is not None else []
+
+    def __len__(self):
+        return len(self.calls)
+
+    def append(self, call, result):
+        self.calls.append(call)
+        self.results.append(result)
+
+    def save(self, traceFile):
+        """
+        Saves the trace to an .npz file.
+        """
+        callTable = list(dict.fromkeys(self.calls))
+        callIndex = {call: index for index, call in enumerate(callTable)}
+        kinds = np.zeros(len(self), dtype=np.int8)
+        numbers = np.zeros(len(self))
+        objects = []
+        offsets = [0]
+        for index, result in enumerate(self.results):
+            # bool is an int, but it is pickled so it is replayed as a bool
+            if isinstance(result, (int, np.integer)) and not isinstance(result, bool):
+                kinds[index] = INT
+                numbers[index] = result
+            elif isinstance(result, (float, np.floating)):
+                kinds[index] = FLOAT
+                numbers[index] = result
+            elif result is not None:
+                kinds[index] = OBJECT
+                objects.append(pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+                offsets.append(offsets[-1] + len(objects[-1]))
+        np.savez_compressed(traceFile,
+                            callTable=np.array(callTable, dtype=str),
+                            calls=np.array([callIndex[call] for call in self.calls], dtype=np.int32),
+                            kinds=kinds,
+                            numbers=numbers,
+                            objects=np.frombuffer(b"".join(objects), dtype=np.uint8),
+                            offsets=np.array(offsets, dtype=np.int64))
+
+    @staticmethod
+    def load(traceFile):
+        """
+        Loads a trace saved with save.
+
+        Returns:
+            Trace: The trace.
+        """
+        with np.load(traceFile) as data:
+            callTable = data["callTable"].tolist()
+            calls = [callTable[index] for index in data["calls"].tolist()]
+            kinds = data["kinds"]
+            numbers = data["numbers"].tolist()
+            objects = data["objects"].tobytes()
+            offsets = data["offsets"].tolist()
+        results = []
+        objectIndex = 0
+        for kind, number in zip(kinds.tolist(), numbers):
+            if kind == INT:
+                results.append(int(number))
+            elif kind == FLOAT:
+                results.append(number)
+            elif kind == OBJECT:
+                results.append(pickle.loads(objects[offsets[objectIndex]:offsets[objectIndex+1]]))
+                objectIndex += 1
+            else:
+                results.append(None)
+        return Trace(calls, results)
+
+
+def _callKey(name, args, kwargs):
+    if name in UNKEYED_ARGUMENTS:
+        return name + "(...)"
+    return name + repr(args) + (repr(sorted(kwargs.items())) if kwargs else "")
+
+
+class _RecordingDomain(DomainProxy):
+    def __init__(self, recorder, name, domain):
+        super().__init__(name, domain)
+        self._recorder = recorder
+
+    def _wrap(self, call, function):
+        trace = self._recorder.trace
+
+        def record(*args, **kwargs):
+            result = function(*args, **kwargs)
+            # traci updates the subscription results in place, so results are copied
+            trace.append(_callKey(call, args, kwargs), copy.deepcopy(result))
+            return result
+        return record
+
+
+class RecordingConnection(ConnectionProxy):
+    """
+    Wraps a traci connection (or a call-compatible one, e.g. libsumo) and records every call made through it,
+    with its result, into a Trace. The trace is saved to traceFile when the connection is closed, so it can
+    be replayed with a ReplayConnection.
+
+    Args:
+        connection (traci.Connection): The connection to record.
+        trace (Trace): Trace the calls are appended to (shared by the connections started by an environment
+            when it restarts SUMO).
+        traceFile (str): Path of the .npz file the trace is saved to on close (not saved if None).
+    """
+    def __init__(self, connection, trace=None, traceFile=None):
+        self.trace = trace if trace is not None else Trace()
+        self.traceFile = traceFile
+        super().__init__(connection)
+
+    def _domainProxy(self, name, domain):
+        return _RecordingDomain(self, name, domain)
+
+    def close(self):
+        self.connection.close()
+        self.trace.append(_callKey("connection.close", (), {}), None)
+        if self.traceFile is not None:
+            self.trace.save(self.traceFile)
+
+    @staticmethod
+    def factory(traceFile, connectionFactory=None):
+        """
+        Connection factory (see SumoEnvironment) that records the calls of the environment to traceFile.
+
+        Args:
+            traceFile (str): Path of the .npz file of the trace.
+            connectionFactory (callable): Factory of the recorded connections. By default SUMO is started
+                through traci with the label of the environment.
+
+        Returns:
+            callable: The connection factory.
+        """
+        trace = Trace()
+
+        def startConnection(sumoCMD, label):
+            if connectionFactory is not None:
+                connection = connectionFactory(sumoCMD, label)
+            else:
+                traci.start(sumoCMD, label=label)
+                connection = traci.getConnection(label)
+            return RecordingConnection(connection, trace, traceFile)
+        return startConnection
+
+
+class _ReplayDomain:
+    def __init__(self, replay, name):
+        self._replay = replay
+        self._name = name
+
+    def __getattr__(self, method):
+        name = self._name + "." + method
+        replay = self._replay
+
+        def serve(*args, **kwargs):
+            return replay.next(name, args, kwargs)
+        setattr(self, method, serve)
+        return serve
+
+
+class ReplayConnection:
+    """
+    Stand-in for a traci connection that serves the results of a recorded Trace, in order, without running
+    SUMO. The environment must make the same calls it made when it was recorded (same options, actions and
+    number of steps), as each call is checked against the trace.
+
+    Args:
+        trace (Trace): The recorded trace, or the path of its .npz file.
+        strict (bool): Check every call against the trace, raising a ValueError on the first difference.
+            With False, only the number of calls is checked.
+    """
+    def __init__(self, trace, strict=True):
+        self.trace = Trace.load(trace) if isinstance(trace, str) else trace
+        self.strict = strict
+        self.position = 0
+        for domain in DOMAINS:
+            setattr(self, domain, _ReplayDomain(self, domain))
+
+    def next(self, name, args, kwargs):
+        """
+        Returns:
+            The recorded result of the next call, checking the call against the trace.
+        """
+        if self.position >= len(self.trace.calls):
+            raise ValueError("Trace exhausted: " + name + " was called after the end of the trace")
+        if self.strict:
+            call = _callKey(name, args, kwargs)
+            if call != self.trace.calls[self.position]:
+                raise ValueError("Call " + str(self.position) + " differs from the trace: expected "
+                                 + self.trace.calls[self.position] + ", got " + call)
+        result = self.trace.results[self.position]
+        self.position += 1
+        return result
+
+    def close(self):
+        # Closing never fails (environments close on deletion, also after a mismatch)
+        if self.position < len(self.trace.calls) and self.trace.calls[self.position] == "connection.close()":
+            self.position += 1
+
+    def __getattr__(self, method):
+        serve = _ReplayDomain(self, "connection").__getattr__(method)
+        setattr(self, method, serve)
+        return serve
+
+    @staticmethod
+    def factory(trace, strict=True):
+        """
+        Connection factory (see SumoEnvironment) that replays a recorded trace. If the environment restarts
+        SUMO, the replay continues where the previous connection was closed.
+
+        Args:
+            trace (Trace): The recorded trace, or the path of its .npz file.
+            strict (bool): See ReplayConnection.
+
+        Returns:
+            callable: The connection factory.
+        """
+        connection = ReplayConnection(trace, strict)
+
+        def startConnection(sumoCMD, label):
+            return connection
+        return startConnection
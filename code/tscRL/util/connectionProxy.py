@@ -0,0 +1,67 @@
+# Domains of a traci connection that are wrapped by a ConnectionProxy
+DOMAINS = ("simulation", "lane", "edge", "vehicle", "trafficlight", "junction", "route", "person")
+
+
+class DomainProxy:
+    """
+    Proxy of a domain of a traci connection (or of the connection itself, for its connection-level methods)
+    that wraps each method of the domain the first time it is accessed. Subclasses define the wrapper.
+
+    Args:
+        name (str): Name of the domain ("connection" for the connection-level methods).
+        domain: The proxied domain.
+    """
+    def __init__(self, name, domain):
+        self._name = name
+        self._domain = domain
+
+    def _wrap(self, call, function):
+        """
+        Args:
+            call (str): Name of the call, as "domain.method".
+            function (callable): The method of the domain.
+
+        Returns:
+            callable: The function called instead of the method.
+        """
+        raise NotImplementedError
+
+    def __getattr__(self, method):
+        function = getattr(self._domain, method)
+        if not callable(function):
+            return function
+        wrapper = self._wrap(self._name + "." + method, function)
+        # Cached, so later calls skip __getattr__
+        setattr(self, method, wrapper)
+        return wrapper
+
+
+class ConnectionProxy:
+    """
+    Wraps a traci connection (or a call-compatible one, e.g. libsumo or a FakeConnection) with a
+    DomainProxy for each of its domains and one for its connection-level methods. Subclasses define the
+    domain proxy.
+
+    Args:
+        connection (traci.Connection): The wrapped connection.
+    """
+    DOMAINS = DOMAINS
+
+    def __init__(self, connection):
+        self.connection = connection
+        for domain in self.DOMAINS:
+            if hasattr(connection, domain):
+                setattr(self, domain, self._domainProxy(domain, getattr(connection, domain)))
+
+    def _domainProxy(self, name, domain):
+        """
+        Returns:
+            DomainProxy: The proxy of a domain of the connection.
+        """
+        raise NotImplementedError
+
+    def __getattr__(self, method):
+        # Connection-level methods (simulationStep, getVersion, close...)
+        wrapper = self._domainProxy("connection", self.connection).__getattr__(method)
+        setattr(self, method, wrapper)
+        return wrapper
@@ -1,4 +1,5 @@
-from math import ceil, log2
+from math import log2
+import numpy as np
 
 class Discrete:
     def __init__(self, I, M):
@@ -10,18 +11,51 @@ class Discrete:
         self.L=self.I/self.M
         self.F=(1-self.L)*(self.I/(log2(M/(M*self.L)+1)))
         self.max_x=0
-             
+        self.bin_edges=self._compute_bin_edges()
+
     def log_interval(self, x):
-        if x>self.max_x:
-            self.max_x=x
-        if (x>self.M):
-            return self.I
-        if (x<0):
+        return int(self.log_interval_array(x))
+
+    def log_interval_array(self, x, lookup=False):
+        """
+        Encodes every value of x (a lane vector, or a batch of them) into its logarithmic interval.
+
+        Args:
+            x (array_like): Non-negative values.
+            lookup (bool): Use the precomputed bin edges (np.searchsorted) instead of the formula.
+
+        Returns:
+            np.ndarray: Intervals (int64) with the same shape as x.
+        """
+        x = np.asarray(x)
+        if x.size > 0:
+            self.max_x = max(self.max_x, x.max().item())
+        if (x<0).any():
             raise ValueError("Argument must be a non-negative value")
-        interval = ceil(self.F*(log2(x/(self.M*self.L)+1))+pow(self.L,2)*x)
-        return interval
-    
-    
+        if lookup:
+            return np.where(x>self.M, self.I, np.searchsorted(self.bin_edges, x, side="left"))
+        return self._encode(x)
+
+    def _encode(self, x):
+        interval = np.ceil(self.F*(np.log2(x/(self.M*self.L)+1))+pow(self.L,2)*x).astype(np.int64)
+        return np.where(x>self.M, self.I, interval)
+
+    def _compute_bin_edges(self):
+        """
+        Computes, for each interval k lower than the interval of M, the largest value encoded into an
+        interval <= k, so that the interval of x is the number of edges lower than x. The edges are found
+        by bisection over the (ordered) bit patterns of non-negative doubles, so the lookup matches the
+        formula exactly.
+        """
+        k = np.arange(self._encode(np.float64(self.M)))
+        low = np.zeros(len(k), dtype=np.int64)
+        high = np.full(len(k), np.float64(self.M).view(np.int64))
+        while (high-low > 1).any():
+            middle = low + (high-low)//2
+            below = self._encode(middle.view(np.float64)) <= k
+            low = np.where(below, middle, low)
+            high = np.where(below, high, middle)
+        return low.view(np.float64)
+
     def get_max_encoded_value(self):
         return self.max_x
-
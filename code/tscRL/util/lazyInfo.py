@@ -0,0 +1,103 @@
+from copy import deepcopy
+
+
+class _LazyFields:
+    """
+    Pending fields of a LazyInfo, shared by the info and its copies: each field is computed once, by the
+    first copy that reads it, and expiring the info expires every copy.
+    """
+    def __init__(self, functions):
+        self.functions = dict(functions)
+        self.values = {}
+        self.expired = False
+
+    def __contains__(self, key):
+        return key in self.values or (not self.expired and key in self.functions)
+
+    def compute(self, key):
+        if key not in self.values:
+            if self.expired or key not in self.functions:
+                raise KeyError(key)
+            self.values[key] = self.functions.pop(key)()
+        return self.values[key]
+
+    def pending(self):
+        return list(self.values) + ([] if self.expired else list(self.functions))
+
+
+class LazyInfo(dict):
+    """
+    Info dictionary whose fields are computed when they are first read (with [], get or in), so the
+    diagnostics nobody reads are never computed. Read values are stored as regular items.
+
+    The fields are computed from the current state of the environment, so they can only be read until the
+    environment advances: then the environment calls expire and the unread fields are dropped. resolve
+    computes all the pending fields (e.g. before iterating over the items, which only include the computed
+    fields).
+
+    Copies (copy.copy and copy.deepcopy, e.g. the infos returned by DummyVecEnv) share the pending fields
+    with the original info instead of computing them: a field read from any of them is computed once, and
+    they all expire with the original. Pickling (e.g. by SubprocVecEnv, to send the info to another process)
+    cannot carry the functions computing the fields, so it resolves the info and produces a plain dict:
+    there, infoFields and infoFrequency are the way to skip fields.
+
+    Args:
+        values (dict): Fields already computed.
+        lazyFields (dict): Functions computing the pending fields, by field name.
+    """
+    def __init__(self, values=None, lazyFields=None):
+        super().__init__(values if values is not None else {})
+        self.lazyFields = _LazyFields(lazyFields if lazyFields is not None else {})
+
+    def __missing__(self, key):
+        value = self[key] = self.lazyFields.compute(key)
+        return value
+
+    def __contains__(self, key):
+        return super().__contains__(key) or key in self.lazyFields
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def resolve(self):
+        """
+        Computes every pending field.
+
+        Returns:
+            LazyInfo: The info itself.
+        """
+        for key in self.lazyFields.pending():
+            if not super().__contains__(key):
+                self[key]
+        return self
+
+    def expire(self):
+        """
+        Drops the pending fields (they can no longer be computed for the state the info belongs to).
+        """
+        self.lazyFields.expired = True
+        self.lazyFields.functions.clear()
+
+    def _copy(self, values):
+        info = LazyInfo(values)
+        info.lazyFields = self.lazyFields
+        return info
+
+    def copy(self):
+        return self._copy(dict(self))
+
+    def __copy__(self):
+        return self.copy()
+
+    def __deepcopy__(self, memo):
+        info = self._copy({})
+        memo[id(self)] = info
+        for key, value in dict.items(self):
+            info[deepcopy(key, memo)] = deepcopy(value, memo)
+        return info
+
+    def __reduce__(self):
+        return (dict, (dict(self.resolve()),))
@@ -0,0 +1,124 @@
+from time import perf_counter
+
+from tscRL.util.connectionProxy import DomainProxy, ConnectionProxy
+
+
+class PhaseTimer:
+    """
+    Accumulates the wall time spent in each phase of a repeated procedure (e.g. the phases of
+    SumoEnvironment.step). start() marks the beginning of an iteration and lap(phase) adds the time
+    elapsed since the previous mark to the phase.
+
+    Attributes:
+        times (dict): Cumulative time of each phase, in seconds.
+        counts (dict): Number of laps of each phase.
+    """
+    def __init__(self):
+        self.times = {}
+        self.counts = {}
+        self.last = perf_counter()
+
+    def start(self):
+        self.last = perf_counter()
+
+    def lap(self, phase):
+        now = perf_counter()
+        self.times[phase] = self.times.get(phase, 0.0) + now - self.last
+        self.counts[phase] = self.counts.get(phase, 0) + 1
+        self.last = now
+
+    def clear(self):
+        self.times.clear()
+        self.counts.clear()
+
+    def summary(self):
+        """
+        Returns:
+            dict: Total time, number of laps and mean time per lap of each phase.
+        """
+        return {phase: {"total": total,
+                        "count": self.counts[phase],
+                        "mean": total / self.counts[phase]}
+                for phase, total in self.times.items()}
+
+
+class NullTimer:
+    """ PhaseTimer that does nothing, used when timing is disabled. """
+    times = {}
+    counts = {}
+
+    def start(self):
+        pass
+
+    def lap(self, phase):
+        pass
+
+    def clear(self):
+        pass
+
+    def summary(self):
+        return {}
+
+
+class CallCounter(PhaseTimer):
+    """
+    PhaseTimer whose phases are the TraCI calls (as "domain.method") made through a CountingConnection:
+    the number of calls and their cumulative latency per API.
+    """
+    def add(self, call, elapsed):
+        self.times[call] = self.times.get(call, 0.0) + elapsed
+        self.counts[call] = self.counts.get(call, 0) + 1
+
+
+class _CountingDomain(DomainProxy):
+    def __init__(self, counter, name, domain):
+        super().__init__(name, domain)
+        self._counter = counter
+
+    def _wrap(self, call, function):
+        counter = self._counter
+
+        def count(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                counter.add(call, perf_counter() - start)
+        return count
+
+
+class CountingConnection(ConnectionProxy):
+    """
+    Wraps a traci connection (or a call-compatible one, e.g. libsumo or a FakeConnection) and counts every
+    call made through it, with its latency, in a CallCounter. Only used when profiling is enabled, so the
+    connection is not wrapped otherwise.
+
+    Args:
+        connection (traci.Connection): The connection to count the calls of.
+        counter (CallCounter): Counter of the calls.
+    """
+    def __init__(self, connection, counter):
+        self.counter = counter
+        super().__init__(connection)
+
+    def _domainProxy(self, name, domain):
+        return _CountingDomain(self.counter, name, domain)
+
+
+def mergeSummaries(summaries):
+    """
+    Merges summaries of PhaseTimer (e.g. of several environments) into one.
+
+    Args:
+        summaries (list): Summaries, as returned by PhaseTimer.summary.
+
+    Returns:
+        dict: Total time, number of laps and mean time per lap of each phase.
+    """
+    merged = {}
+    for summary in summaries:
+        for phase, values in summary.items():
+            total, count = merged.get(phase, (0.0, 0))
+            merged[phase] = (total + values["total"], count + values["count"])
+    return {phase: {"total": total, "count": count, "mean": total / count if count > 0 else 0.0}
+            for phase, (total, count) in merged.items()}
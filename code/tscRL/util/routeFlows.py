@@ -0,0 +1,47 @@
+import re
+
+# Exponentially distributed period of a flow (period="exp(rate)"), with the rate in vehicles per second
+EXP_PERIOD = re.compile(r"exp\((\d+\.?\d*)\)")
+
+
+def exponentialRate(period):
+    """
+    Rate of an exponentially distributed flow period.
+
+    Args:
+        period (str): Value of the period attribute of a flow (None if it has no period).
+
+    Returns:
+        float: Mean number of vehicles per second of a period "exp(rate)", or None if the period is not
+            exponential.
+    """
+    match = EXP_PERIOD.fullmatch(period) if period is not None else None
+    return float(match.group(1)) if match else None
+
+
+def flowRate(flow):
+    """
+    Mean number of vehicles per second of a flow of a route file, from whichever attribute defines it:
+    period (exponential or fixed), vehsPerHour, probability or number (over the duration of the flow).
+
+    Args:
+        flow (xml.etree.ElementTree.Element): The flow element.
+
+    Returns:
+        float: The rate, or None if the flow does not define one.
+    """
+    period = flow.get("period")
+    rate = exponentialRate(period)
+    if rate is not None:
+        return rate
+    if period is not None:
+        return 1 / float(period)
+    if flow.get("vehsPerHour") is not None:
+        return float(flow.get("vehsPerHour")) / 3600
+    if flow.get("probability") is not None:
+        return float(flow.get("probability"))
+    if flow.get("number") is not None:
+        begin = float(flow.get("begin", 0))
+        end = float(flow.get("end", 3600))
+        return float(flow.get("number")) / max(end - begin, 1)
+    return None
@@ -0,0 +1,127 @@
+import os
+import hashlib
+import shutil
+import tempfile
+import xml.etree.ElementTree as ET
+
+# Default directory for cached SUMO states
+cache_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.states', 'cache')
+
+# Options of a SUMO configuration file that reference the input files of the scenario
+INPUT_FILE_OPTIONS = ["net-file", "route-files", "additional-files"]
+
+def getScenarioFiles(sumocfgFile):
+    """
+    List the input files (net, routes and additionals) referenced by a SUMO configuration file.
+
+    Args:
+        sumocfgFile (str): Path of the SUMO configuration file.
+
+    Returns:
+        list: Paths of the configuration file and its input files.
+    """
+    files = [sumocfgFile]
+    cfgDir = os.path.dirname(os.path.abspath(sumocfgFile))
+    root = ET.parse(sumocfgFile).getroot()
+    for option in INPUT_FILE_OPTIONS:
+        for element in root.iter(option):
+            for fileName in element.get("value", "").replace(",", " ").split():
+                files.append(os.path.join(cfgDir, fileName))
+    return files
+
+def getScenarioKey(sumocfgFile, *params):
+    """
+    Hash of the contents of the scenario files and of the given parameters, e.g. for caching the results
+    of simulating a scenario.
+
+    Args:
+        sumocfgFile (str): Path of the SUMO configuration file.
+        *params: Parameters that determine the results (their repr is hashed).
+
+    Returns:
+        str: The key (hex digest).
+    """
+    digest = hashlib.sha256()
+    for fileName in getScenarioFiles(sumocfgFile):
+        with open(fileName, "rb") as file:
+            for chunk in iter(lambda: file.read(2**20), b""):
+                digest.update(chunk)
+    digest.update(repr(params).encode())
+    return digest.hexdigest()
+
+class StateCache:
+    """
+    Content-addressed cache of SUMO states (e.g. the state after warming up a simulation).
+
+    States are stored as files named by a key, a hash of the scenario files contents and of the
+    parameters that determine the state. When the total size of the cache exceeds maxSize, the least
+    recently used states are evicted (file modification times are updated on every hit).
+
+    Attributes:
+        cacheDir (str): Directory where the states are stored.
+        maxSize (int): Maximum total size of the cached states, in bytes.
+    """
+    def __init__(self, cacheDir=cache_dir, maxSize=512 * 2**20):
+        self.cacheDir = cacheDir
+        self.maxSize = maxSize
+        os.makedirs(cacheDir, exist_ok=True)
+
+    def getKey(self, sumocfgFile, *params):
+        """
+        Compute the key of a state from the contents of the scenario files and the given parameters.
+
+        Args:
+            sumocfgFile (str): Path of the SUMO configuration file.
+            *params: Parameters that determine the state (warm-up time, SUMO options, version...).
+
+        Returns:
+            str: The key (hex digest).
+        """
+        return getScenarioKey(sumocfgFile, *params)
+
+    def _path(self, key):
+        return os.path.join(self.cacheDir, key + ".xml")
+
+    def get(self, key):
+        """
+        Returns:
+            str: Path of the cached state with the given key, or None if it is not cached.
+        """
+        path = self._path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key, stateFile):
+        """
+        Store a copy of the state file with the given key and evict the least recently used states
+        if the cache is over its maximum size.
+        """
+        # Copy and rename, so other processes never read a partially written state
+        fd, tmpPath = tempfile.mkstemp(dir=self.cacheDir, suffix=".tmp")
+        os.close(fd)
+        shutil.copyfile(stateFile, tmpPath)
+        os.replace(tmpPath, self._path(key))
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for entry in os.scandir(self.cacheDir):
+            if entry.name.endswith(".xml"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+        totalSize = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if totalSize <= self.maxSize:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            totalSize -= size
@@ -0,0 +1,222 @@
+import os
+import glob
+import xml.etree.ElementTree as ET
+
+import numpy as np
+try:
+    # For converting the outputs to columnar files and querying them (optional)
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# Formats of the outputs: SUMO's XML, or converted to Parquet or Arrow (IPC) files
+XML = "xml"
+PARQUET = "parquet"
+ARROW = "arrow"
+FILE_EXTENSIONS = {XML: ".xml", PARQUET: ".parquet", ARROW: ".arrow"}
+# Outputs written per episode (see SumoEnvironment outputDir), with the tag of their elements
+OUTPUT_TAGS = {"tripinfo": "tripinfo", "summary": "step"}
+# Attributes of the outputs that are read as strings (the others are read as numbers when possible)
+STRING_ATTRIBUTES = ["id", "departLane", "arrivalLane", "devices", "vType", "vaporized"]
+
+
+def iterElements(fileName, tag):
+    """
+    Iterates over the elements of a SUMO output file with the given tag (e.g. "tripinfo" or "step"),
+    parsing the file incrementally. Each element is cleared after it is yielded, so the memory used does
+    not grow with the size of the file.
+
+    Args:
+        fileName (str): Path of the output file.
+        tag (str): Tag of the elements.
+
+    Yields:
+        dict: Attributes of each element.
+    """
+    context = ET.iterparse(fileName, events=("start", "end"))
+    _, root = next(context)
+    for event, element in context:
+        if event == "end" and element.tag == tag:
+            yield dict(element.attrib)
+            # Elements already read are dropped from the tree
+            root.clear()
+
+
+def readTripinfo(fileName, begin=0):
+    """
+    Aggregates the trips of a tripinfo output that arrived after a given time.
+
+    Args:
+        fileName (str): Path of the tripinfo output.
+        begin (float): Trips that arrived up to this time (e.g. during the warm-up) are ignored.
+
+    Returns:
+        dict: Number of trips and mean duration, waiting time (time spent halted) and time loss of the trips.
+    """
+    durations = []
+    waitingTimes = []
+    timeLosses = []
+    for trip in iterElements(fileName, "tripinfo"):
+        if float(trip["arrival"]) > begin:
+            durations.append(float(trip["duration"]))
+            waitingTimes.append(float(trip["waitingTime"]))
+            timeLosses.append(float(trip["timeLoss"]))
+    return {"trips": len(durations),
+            "mean_trip_duration": float(np.mean(durations)) if durations else 0.0,
+            "mean_trip_waiting_time": float(np.mean(waitingTimes)) if waitingTimes else 0.0,
+            "mean_trip_time_loss": float(np.mean(timeLosses)) if timeLosses else 0.0}
+
+
+def readSummary(fileName, times):
+    """
+    Means of the summary output of the simulation over the given times.
+
+    Args:
+        fileName (str): Path of the summary output.
+        times (set): Times of the steps to aggregate (the time of a step of the summary is the time the
+            simulation step started at).
+
+    Returns:
+        dict: Mean number of running and halting vehicles in the network and mean of the meanWaitingTime
+            of the steps.
+    """
+    running = []
+    halting = []
+    waitingTimes = []
+    for step in iterElements(fileName, "step"):
+        if float(step["time"]) in times:
+            running.append(int(step["running"]))
+            halting.append(int(step["halting"]))
+            waitingTimes.append(float(step["meanWaitingTime"]))
+    return {"mean_running_vehicles": float(np.mean(running)) if running else 0.0,
+            "mean_halting_vehicles": float(np.mean(halting)) if halting else 0.0,
+            "mean_waiting_time": float(np.mean(waitingTimes)) if waitingTimes else 0.0}
+
+
+def episodeOutputFiles(outputDir, run, episode, outputFormat=XML):
+    """
+    Paths of the outputs of an episode. Each output is a dataset partitioned by run and episode
+    (<outputDir>/<output>/run=<run>/episode=<episode>/data.<format>), so the episodes of many runs can be
+    queried together (see queryTrips).
+
+    Args:
+        outputDir (str): Root directory of the outputs.
+        run (str): Name of the run (e.g. the label of the environment).
+        episode (int): Episode number.
+        outputFormat (str): "xml", "parquet" or "arrow".
+
+    Returns:
+        dict: Path of each output (see OUTPUT_TAGS).
+    """
+    return {output: os.path.join(outputDir, output, "run=" + str(run), "episode=" + str(episode),
+                                 "data" + FILE_EXTENSIONS[outputFormat])
+            for output in OUTPUT_TAGS}
+
+
+def _parse(value, dataType):
+    if pa.types.is_string(dataType):
+        return value
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _inferSchema(attributes):
+    """ Schema of the elements of an output, from the attributes of the first one. """
+    fields = []
+    for name, value in attributes.items():
+        dataType = pa.string()
+        if name not in STRING_ATTRIBUTES and _parse(value, pa.float64()) is not None:
+            dataType = pa.float64()
+        fields.append(pa.field(name, dataType))
+    return pa.schema(fields)
+
+
+def convertOutput(xmlFile, outputFile, tag, outputFormat=PARQUET, batchSize=65536):
+    """
+    Converts a SUMO output to a Parquet or Arrow (IPC) file, streaming it: the elements are parsed
+    incrementally (see iterElements) and written in batches of batchSize rows, so the memory used is bounded
+    by the batch size and not by the size of the output. The columns are the attributes of the first
+    element, numeric unless they are in STRING_ATTRIBUTES or not numbers (missing values are null).
+
+    Args:
+        xmlFile (str): Path of the SUMO output.
+        outputFile (str): Path of the converted file.
+        tag (str): Tag of the elements (see OUTPUT_TAGS).
+        outputFormat (str): "parquet" or "arrow".
+        batchSize (int): Number of rows written at a time.
+
+    Returns:
+        int: Number of rows written (no file is written if the output is empty).
+    """
+    if pa is None:
+        raise ImportError("Converting the outputs needs pyarrow.")
+    schema = None
+    writer = None
+    columns = {}
+    rows = 0
+
+    def writeBatch():
+        writer.write_batch(pa.record_batch([pa.array(values, type=schema.field(name).type)
+                                            for name, values in columns.items()], schema=schema))
+        for values in columns.values():
+            values.clear()
+
+    try:
+        for attributes in iterElements(xmlFile, tag):
+            if schema is None:
+                schema = _inferSchema(attributes)
+                columns = {name: [] for name in schema.names}
+                if outputFormat == ARROW:
+                    writer = pa.ipc.new_file(outputFile, schema)
+                else:
+                    writer = pq.ParquetWriter(outputFile, schema)
+            for name, values in columns.items():
+                values.append(_parse(attributes.get(name), schema.field(name).type))
+            rows += 1
+            if rows % batchSize == 0:
+                writeBatch()
+        if writer is not None and rows % batchSize != 0:
+            writeBatch()
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def queryTrips(outputDir, groupBy=("run", "episode"), outputFormat=PARQUET, filter=None):
+    """
+    Travel time and delay aggregates of the trips of the converted tripinfo outputs of many runs and
+    episodes (see episodeOutputFiles), computed by pyarrow without loading the XML outputs.
+
+    Args:
+        outputDir (str): Root directory of the outputs.
+        groupBy (tuple): Columns the trips are grouped by (partitions, "run" and "episode", or tripinfo
+            attributes such as "vType").
+        outputFormat (str): "parquet" or "arrow".
+        filter (pyarrow.compute.Expression): Filter of the trips (e.g. pc.field("arrival") > 600).
+
+    Returns:
+        pyarrow.Table: Per group, number of trips and mean and maximum travel time (duration), time loss
+            (delay), waiting time and departure delay. Table.to_pandas() converts it to a DataFrame.
+    """
+    if pa is None:
+        raise ImportError("Querying the outputs needs pyarrow.")
+    root = os.path.join(outputDir, "tripinfo")
+    files = sorted(glob.glob(os.path.join(root, "**", "*" + FILE_EXTENSIONS[outputFormat]), recursive=True))
+    dataset = ds.dataset(files, format="ipc" if outputFormat == ARROW else "parquet", partitioning="hive",
+                         partition_base_dir=root)
+    table = dataset.to_table(columns=list(groupBy) + ["duration", "timeLoss", "waitingTime", "departDelay"],
+                             filter=filter)
+    aggregates = [("duration", "count"), ("duration", "mean"), ("duration", "max"), ("timeLoss", "mean"),
+                  ("timeLoss", "max"), ("waitingTime", "mean"), ("waitingTime", "max"), ("departDelay", "mean")]
+    result = table.group_by(list(groupBy)).aggregate(aggregates)
+    names = {"duration_count": "trips", "duration_mean": "mean_travel_time", "duration_max": "max_travel_time",
+             "timeLoss_mean": "mean_time_loss", "timeLoss_max": "max_time_loss",
+             "waitingTime_mean": "mean_waiting_time", "waitingTime_max": "max_waiting_time",
+             "departDelay_mean": "mean_depart_delay"}
+    result = result.rename_columns([names.get(name, name) for name in result.column_names])
+    return result.sort_by([(name, "ascending") for name in groupBy])
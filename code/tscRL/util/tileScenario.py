@@ -0,0 +1,236 @@
+import os
+import argparse
+import xml.etree.ElementTree as ET
+import numpy as np
+
+from tscRL.util.routeFlows import exponentialRate
+
+# Attributes holding IDs (or lists of IDs) of network elements, for each element of a network file
+NET_ID_ATTRIBUTES = {
+    "edge": ["id", "from", "to"],
+    "lane": ["id"],
+    "neigh": ["lane"],
+    "junction": ["id", "incLanes", "intLanes"],
+    "connection": ["from", "to", "via", "tl"],
+    "tlLogic": ["id"],
+    "roundabout": ["nodes", "edges"],
+}
+# Attributes holding shapes or x coordinates, shifted to place each copy
+NET_X_ATTRIBUTES = {
+    "edge": ["shape"],
+    "lane": ["shape"],
+    "junction": ["x", "shape", "customShape"],
+}
+# Attributes of the demand elements referencing the network, or naming the vehicles
+ROUTE_ID_ATTRIBUTES = {
+    "flow": ["id", "from", "to", "via", "fromJunction", "toJunction", "route"],
+    "trip": ["id", "from", "to", "via", "fromJunction", "toJunction"],
+    "vehicle": ["id", "route"],
+    "route": ["id", "edges"],
+}
+
+def copyPrefix(copy):
+    """ Prefix of the IDs of the given copy. """
+    return "c" + str(copy) + "_"
+
+def _renameId(elementId, prefix):
+    # Internal elements keep the leading colon
+    if elementId.startswith(":"):
+        return ":" + prefix + elementId[1:]
+    return prefix + elementId
+
+def _renameAttributes(element, attributes, prefix):
+    for attribute in attributes.get(element.tag, []):
+        value = element.get(attribute)
+        if value:
+            element.set(attribute, " ".join(_renameId(elementId, prefix) for elementId in value.split()))
+
+def _shiftAttributes(element, offset):
+    for attribute in NET_X_ATTRIBUTES.get(element.tag, []):
+        value = element.get(attribute)
+        if not value:
+            continue
+        if attribute == "x":
+            element.set(attribute, "%.2f" % (float(value) + offset))
+        else:
+            points = []
+            for point in value.split():
+                coordinates = point.split(",")
+                coordinates[0] = "%.2f" % (float(coordinates[0]) + offset)
+                points.append(",".join(coordinates))
+            element.set(attribute, " ".join(points))
+
+def getTrafficLightIds(netFile):
+    """
+    Returns:
+        list: IDs of the traffic lights of a network file.
+    """
+    root = ET.parse(netFile).getroot()
+    return list(dict.fromkeys(tlLogic.get("id") for tlLogic in root.iter("tlLogic")))
+
+def tileNetwork(netFile, copies, outputFile, spacing=100):
+    """
+    Writes a network made of disconnected copies of a network, placed side by side along the x axis.
+    The IDs of the elements of each copy are prefixed with copyPrefix(copy).
+
+    Args:
+        netFile (str): Path of the network file.
+        copies (int): Number of copies.
+        outputFile (str): Path of the tiled network file.
+        spacing (float): Distance between copies.
+    """
+    tree = ET.parse(netFile)
+    root = tree.getroot()
+    location = root.find("location")
+    xMin, yMin, xMax, yMax = (float(value) for value in location.get("convBoundary").split(","))
+    width = xMax - xMin + spacing
+
+    tiledRoot = ET.Element(root.tag, root.attrib)
+    tiledRoot.text = root.text
+    for element in root:
+        if element.tag == "location":
+            tiledLocation = ET.SubElement(tiledRoot, "location", element.attrib)
+            tiledLocation.set("convBoundary", "%.2f,%.2f,%.2f,%.2f" % (xMin, yMin, xMax + (copies-1) * width, yMax))
+            tiledLocation.tail = element.tail
+        elif element.tag not in NET_ID_ATTRIBUTES:
+            # Network-wide elements (e.g. edge types) are not copied
+            tiledRoot.append(element)
+    # The elements of every copy are grouped by type, in the order of the original file
+    tags = list(dict.fromkeys(element.tag for element in root if element.tag in NET_ID_ATTRIBUTES))
+    for tag in tags:
+        for copy in range(copies):
+            prefix = copyPrefix(copy)
+            for element in root.findall(tag):
+                copied = ET.fromstring(ET.tostring(element))
+                for child in copied.iter():
+                    _renameAttributes(child, NET_ID_ATTRIBUTES, prefix)
+                    _shiftAttributes(child, copy * width)
+                copied.tail = element.tail
+                tiledRoot.append(copied)
+    ET.ElementTree(tiledRoot).write(outputFile, encoding="UTF-8", xml_declaration=True)
+
+def _sampleFlow(flow, rng):
+    """
+    Samples the departures of a flow with an exponential period (period="exp(rate)") and returns them
+    as trips.
+    """
+    rate = exponentialRate(flow.get("period"))
+    begin = float(flow.get("begin", 0))
+    end = float(flow.get("end", 3600))
+    trips = []
+    attributes = {key: value for key, value in flow.attrib.items() if key not in ("id", "begin", "end", "period", "number")}
+    depart = begin + rng.exponential(1 / rate)
+    while depart < end:
+        trip = ET.Element("trip", {"id": flow.get("id") + "." + str(len(trips)), "depart": "%.2f" % depart, **attributes})
+        trips.append(trip)
+        depart += rng.exponential(1 / rate)
+    return trips
+
+def _departTime(element):
+    return float(element.get("depart", element.get("begin", 0)))
+
+def tileRoutes(routeFile, copies, outputFile, seed=None):
+    """
+    Writes the demand of a route file for each copy of a tiled network (see tileNetwork).
+
+    Vehicle types are shared by the copies. Flows, trips, vehicles and routes are copied with their IDs
+    (and the network elements they reference) prefixed with copyPrefix(copy). By default the departures
+    of the flows are drawn by SUMO, so every copy gets a different realization of the demand. If a seed is
+    given, the departures of the flows with an exponential period are sampled beforehand with an
+    independent random generator per copy (seeded with seed and the copy), so the demand of each copy is
+    reproducible and does not depend on the number of copies.
+
+    Args:
+        routeFile (str): Path of the route file.
+        copies (int): Number of copies.
+        outputFile (str): Path of the tiled route file.
+        seed (int): Seed of the demand (None to let SUMO draw it).
+    """
+    root = ET.parse(routeFile).getroot()
+    tiledRoot = ET.Element(root.tag, root.attrib)
+    tiledRoot.text = root.text
+    demand = []
+    for element in root:
+        if element.tag not in ROUTE_ID_ATTRIBUTES:
+            tiledRoot.append(element)
+    for copy in range(copies):
+        prefix = copyPrefix(copy)
+        rng = np.random.default_rng([seed, copy]) if seed is not None else None
+        for element in root:
+            if element.tag not in ROUTE_ID_ATTRIBUTES:
+                continue
+            copied = ET.fromstring(ET.tostring(element))
+            for child in copied.iter():
+                _renameAttributes(child, ROUTE_ID_ATTRIBUTES, prefix)
+            if rng is not None and copied.tag == "flow" and exponentialRate(copied.get("period")) is not None:
+                demand.extend(_sampleFlow(copied, rng))
+            else:
+                demand.append(copied)
+    # SUMO expects the demand sorted by departure. Routes defined on their own go first.
+    demand.sort(key=lambda element: -1 if element.tag == "route" else _departTime(element))
+    for element in demand:
+        element.tail = "\n    "
+        tiledRoot.append(element)
+    ET.ElementTree(tiledRoot).write(outputFile, encoding="UTF-8", xml_declaration=True)
+
+def tileScenario(sumocfgFile, copies, outputDir=None, spacing=100, seed=None):
+    """
+    Tiles the network and the route files of a SUMO configuration into copies disconnected copies, and
+    writes a configuration for them, so one simulation runs copies independent instances of the scenario.
+
+    Args:
+        sumocfgFile (str): Path of the SUMO configuration file.
+        copies (int): Number of copies.
+        outputDir (str): Directory of the generated files (the directory of the configuration by default).
+        spacing (float): Distance between copies.
+        seed (int): Seed of the demand (see tileRoutes).
+
+    Returns:
+        str: Path of the generated configuration file.
+    """
+    cfgDir = os.path.dirname(os.path.abspath(sumocfgFile))
+    if outputDir is None:
+        outputDir = cfgDir
+    os.makedirs(outputDir, exist_ok=True)
+    name = os.path.splitext(os.path.basename(sumocfgFile))[0] + "_x" + str(copies)
+    if seed is not None:
+        name += "_s" + str(seed)
+
+    tree = ET.parse(sumocfgFile)
+    inputElement = tree.getroot().find("input")
+    netFile = inputElement.find("net-file")
+    tiledNetFile = name + ".net.xml"
+    tileNetwork(os.path.join(cfgDir, netFile.get("value")), copies, os.path.join(outputDir, tiledNetFile), spacing)
+    netFile.set("value", tiledNetFile)
+    routeFiles = inputElement.find("route-files")
+    if routeFiles is not None:
+        tiledRouteFiles = []
+        for index, routeFile in enumerate(routeFiles.get("value").replace(",", " ").split()):
+            tiledRouteFile = name + "_" + str(index) + ".rou.xml"
+            tileRoutes(os.path.join(cfgDir, routeFile), copies, os.path.join(outputDir, tiledRouteFile), seed)
+            tiledRouteFiles.append(tiledRouteFile)
+        routeFiles.set("value", ",".join(tiledRouteFiles))
+    # Other input files are not copied
+    for element in list(inputElement):
+        if element.tag not in ("net-file", "route-files", "junction-taz"):
+            inputElement.remove(element)
+
+    tiledCfgFile = os.path.join(outputDir, name + ".sumocfg")
+    tree.write(tiledCfgFile, encoding="UTF-8", xml_declaration=True)
+    return tiledCfgFile
+
+def main():
+    parser = argparse.ArgumentParser(description="Tile copies of a SUMO scenario into one network.")
+    parser.add_argument("sumocfgFile", type=str, help="SUMO configuration file of the scenario.")
+    parser.add_argument("copies", type=int, help="Number of copies.")
+    parser.add_argument("--outputDir", type=str, default=None, help="Directory of the generated files.")
+    parser.add_argument("--spacing", type=float, default=100, help="Distance between copies.")
+    parser.add_argument("--seed", type=int, default=None, help="Seed of the demand of the copies.")
+
+    args = parser.parse_args()
+
+    tiledCfgFile = tileScenario(args.sumocfgFile, args.copies, args.outputDir, args.spacing, args.seed)
+    print(f"Tiled scenario saved in: {tiledCfgFile}")
+
+if __name__ == "__main__":
+    main()